@@ -3,17 +3,136 @@
 import sys
 import os
 import subprocess
+import re
+import json
+import hashlib
 import logging
 from pathlib import Path
 import platform
 
-def create_api_script(flask_dir, venv_python=None):
-    """創建Flask API相關檔案"""
+# 在目標 Python 中解析模組所在目錄 (只查找 spec，不實際匯入模組)
+PATH_RESOLVER_CODE = """
+import sys, json, importlib.util
+from pathlib import Path
+paths, missing = [], []
+for name in ('flask', 'speech_recognition', 'pyaudio'):
+    spec = importlib.util.find_spec(name)
+    if spec is None or spec.origin is None:
+        missing.append(name)
+        continue
+    origin = Path(spec.origin)
+    # 套件取 <目錄>/<套件>/__init__.py 的上兩層，單檔模組取上一層
+    directory = origin.parent.parent if spec.submodule_search_locations else origin.parent
+    if str(directory) not in paths:
+        paths.append(str(directory))
+print(json.dumps({
+    "python": sys.executable,
+    "version": "%d.%d" % sys.version_info[:2],
+    "paths": paths,
+    "missing": missing,
+}))
+"""
+
+def write_path_manifest(flask_dir, python_executable):
+    """使用指定的 Python 解析必要模組路徑並寫入 sys_path.json，讓 API 腳本不必每次探測"""
+    manifest_file = Path(flask_dir) / 'sys_path.json'
+    try:
+        result = subprocess.run(
+            [str(python_executable), "-c", PATH_RESOLVER_CODE],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            timeout=60
+        )
+        if result.returncode != 0:
+            logging.warning(f"解析模組路徑失敗: {result.stderr}")
+            return False
+        manifest = json.loads(result.stdout.strip().splitlines()[-1])
+        if manifest["missing"]:
+            # 有缺少的模組時不寫入清單，讓 API 腳本退回路徑探測
+            logging.warning(f"解析模組路徑時缺少模組: {manifest['missing']}")
+            if manifest_file.exists():
+                manifest_file.unlink()
+            return False
+        with open(manifest_file, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        logging.debug(f"已寫入模組路徑清單: {manifest_file}")
+        return True
+    except Exception as e:
+        logging.warning(f"寫入模組路徑清單失敗: {e}")
+        return False
+
+# 已產生腳本中記錄模板雜湊的那一行
+TEMPLATE_HASH_PATTERN = re.compile(r"^TEMPLATE_HASH = '([0-9a-f]+)'$", re.MULTILINE)
+
+def read_script_hash(api_file):
+    """讀取已產生的 API 腳本中的模板雜湊，舊版腳本或檔案不存在時回傳 None"""
+    try:
+        with open(api_file, 'r', encoding='utf-8') as f:
+            match = TEMPLATE_HASH_PATTERN.search(f.read())
+        return match.group(1) if match else None
+    except OSError:
+        return None
+
+def get_venv_python():
+    """回傳使用者虛擬環境中的 Python 路徑，不存在時回傳 None"""
+    venv_dir = Path.home() / '.libreoffice' / 'python_env' / 'venv'
+    if platform.system() == "Windows":
+        venv_python = venv_dir / 'Scripts' / 'python.exe'
+    else:
+        venv_python = venv_dir / 'bin' / 'python'
+    return venv_python if venv_python.exists() else None
+
+# 與 API 腳本一起部署到服務目錄的輔助模組 (純 Python，只在服務端匯入)
+COMPANION_MODULES = ['speech_stream.py', 'speech_dictionary.py', 'speech_capture.py', 'speech_engine.py',
+                     'speech_profiles.py', 'speech_endpointing.py', 'speech_serving.py',
+                     'speech_asgi.py', 'speech_clients.py',
+                     'speech_workers.py', 'speech_sources.py', 'speech_history.py', 'speech_files.py']
+
+def read_companion_modules():
+    """讀取擴充套件目錄中的輔助模組內容，回傳 {檔名: 內容}"""
+    source_dir = Path(__file__).resolve().parent
+    modules = {}
+    for name in COMPANION_MODULES:
+        with open(source_dir / name, 'r', encoding='utf-8') as f:
+            modules[name] = f.read()
+    return modules
+
+def precompile_api_script(flask_dir, python_executable=None):
+    """預先將 API 腳本編譯為目標 Python 的位元組碼 (以 -m speech_api 啟動時會使用快取)"""
+    try:
+        if python_executable:
+            result = subprocess.run(
+                [str(python_executable), "-m", "compileall", "-q", "-l", str(flask_dir)],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+                timeout=120
+            )
+            if result.returncode != 0:
+                logging.warning(f"預先編譯 API 腳本失敗: {result.stderr or result.stdout}")
+                return False
+        else:
+            import py_compile
+            for name in ['speech_api.py'] + COMPANION_MODULES:
+                py_compile.compile(str(Path(flask_dir) / name), doraise=True)
+        logging.debug("已預先編譯 API 腳本")
+        return True
+    except Exception as e:
+        logging.warning(f"預先編譯 API 腳本失敗: {e}")
+        return False
+
+def create_api_script(flask_dir, venv_python=None, interface=None):
+    """創建Flask API相關檔案，模板與選項未變更時不重新產生
+
+    interface 為 'wsgi' (Flask) 或 'asgi'，兩者的端點與 JSON 回應相同；未指定時依 asgi.enabled 標記檔決定。
+    回傳腳本的模板雜湊，供啟動時與運行中的服務比對版本。
+    """
+    if interface is None:
+        interface = 'asgi' if is_asgi_enabled() else 'wsgi'
     # 檢測作業系統
     system = platform.system()
     is_windows = system == "Windows"
-    is_macos = system == "Darwin"
-    is_linux = system == "Linux"
     
     # 創建Flask API Python檔案
     api_file = flask_dir / 'speech_api.py'
@@ -21,44 +140,40 @@ def create_api_script(flask_dir, venv_python=None):
     # 獲取虛擬環境 Python 路徑（如果提供）
     venv_python_path = f"# 使用虛擬環境 Python: {venv_python}" if venv_python else ""
     
-    # 根據不同作業系統創建啟動腳本
+    # 根據不同作業系統產生啟動腳本 (以 -m 啟動才會使用預先編譯的位元組碼)
+    # --server 可改為 waitress (正式環境) 或 werkzeug (開發用)，auto 在已安裝 waitress 時使用 waitress
+    # --host 改為 0.0.0.0 即成為區域網路共用服務 (需先設定 clients.json)
+    server_args = '--host 127.0.0.1 --server auto --threads 8 --backlog 128 --keep-alive 30 --connection-limit 100'
     if is_windows:
         # Windows 啟動腳本 (.bat)
         start_script = flask_dir / 'start_api.bat'
-        with open(start_script, 'w', encoding='utf-8') as f:
-            if venv_python:
-                f.write(f'@echo off\necho 啟動語音辨識 API 服務...\n"{venv_python}" "{flask_dir / "speech_api.py"}"\npause')
-            else:
-                f.write(f'@echo off\necho 啟動語音辨識 API 服務...\npython "{flask_dir / "speech_api.py"}"\npause')
+        python_command = f'"{venv_python}"' if venv_python else 'python'
+        start_script_content = f'@echo off\necho 啟動語音辨識 API 服務...\ncd /d "{flask_dir}"\n{python_command} -m speech_api {server_args}\npause'
     else:
         # Linux/Mac 啟動腳本 (.sh)
         start_script = flask_dir / 'start_api.sh'
-        with open(start_script, 'w', encoding='utf-8') as f:
-            if venv_python:
-                f.write(f'#!/bin/bash\necho "啟動語音辨識 API 服務..."\n"{venv_python}" "{flask_dir / "speech_api.py"}"\nread -p "按任意鍵繼續..."')
-            else:
-                f.write(f'#!/bin/bash\necho "啟動語音辨識 API 服務..."\npython3 "{flask_dir / "speech_api.py"}"\nread -p "按任意鍵繼續..."')
-        
-        # 設置執行權限
-        try:
-            os.chmod(start_script, 0o755)
-        except:
-            logging.warning(f"無法設置 {start_script} 的執行權限")
+        python_command = f'"{venv_python}"' if venv_python else 'python3'
+        start_script_content = f'#!/bin/bash\necho "啟動語音辨識 API 服務..."\ncd "{flask_dir}"\n{python_command} -m speech_api {server_args}\nread -p "按任意鍵繼續..."'
     
-    # 創建 API 腳本文件
-    with open(api_file, 'w', encoding='utf-8') as f:
-        f.write(rf'''#!/usr/bin/env python
+    # API 腳本內容
+    script = rf'''#!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
 import sys
 import os
 import platform
 import logging
+import threading
 from datetime import datetime
 from pathlib import Path
 
 {venv_python_path}
 
+# 模板雜湊 (由 create_api_script 產生，擴充套件藉此判斷運行中的服務是否為舊版)
+TEMPLATE_HASH = '__TEMPLATE_HASH__'
+# 預設的應用程式介面 (由 create_api_script 決定)：wsgi 為 Flask，asgi 為 asyncio 版本
+INTERFACE = '{interface}'
+
 # 設定日誌
 log_dir = Path.home() / '.libreoffice' / 'speech_to_text_logs'
 log_dir.mkdir(parents=True, exist_ok=True)
@@ -74,63 +189,90 @@ logging.debug(f"Python 執行檔: {{sys.executable}}")
 logging.debug(f"Python 版本: {{sys.version}}")
 logging.debug(f"作業系統: {{platform.system()}} {{platform.release()}}")
 
-# 動態添加家目錄下的 Python 模組路徑
-home_dir = Path.home()
-python_lib_dirs = []
+# 安裝程式預先解析好的模組路徑清單，存在時只插入清單中的目錄
+PATH_MANIFEST = Path(__file__).resolve().parent / 'sys_path.json'
+
+def load_path_manifest():
+    """讀取 sys_path.json，版本不符或檔案損毀時回傳 None 改用路徑探測"""
+    try:
+        import json
+        with open(PATH_MANIFEST, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('version') != f"{{sys.version_info.major}}.{{sys.version_info.minor}}":
+            logging.debug(f"路徑清單版本 {{manifest.get('version')}} 與目前 Python 不符，改用路徑探測")
+            return None
+        return [Path(p) for p in manifest.get('paths', [])]
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logging.warning(f"讀取路徑清單失敗: {{e}}")
+        return None
 
-# 識別當前 Python 主要版本
-python_major = sys.version_info.major
-python_minor = sys.version_info.minor
+def probe_python_lib_dirs():
+    """動態探測家目錄與系統中可能的 Python 模組路徑 (沒有路徑清單時的備用方案)"""
+    home_dir = Path.home()
+    python_lib_dirs = []
 
-# 優先添加用戶虛擬環境路徑
-system = platform.system()
-if system == 'Windows':
-    venv_site_packages = home_dir / '.libreoffice' / 'python_env' / 'venv' / 'Lib' / 'site-packages'
-else:
-    # Linux/Mac 虛擬環境結構
-    venv_site_packages = home_dir / '.libreoffice' / 'python_env' / 'venv' / 'lib' / f'python{{python_major}}.{{python_minor}}' / 'site-packages'
+    # 識別當前 Python 主要版本
+    python_major = sys.version_info.major
+    python_minor = sys.version_info.minor
 
-if venv_site_packages.exists():
-    python_lib_dirs.append(venv_site_packages)
-    logging.debug(f"添加虛擬環境路徑: {{venv_site_packages}}")
+    # 優先添加用戶虛擬環境路徑
+    system = platform.system()
+    if system == 'Windows':
+        venv_site_packages = home_dir / '.libreoffice' / 'python_env' / 'venv' / 'Lib' / 'site-packages'
+    else:
+        # Linux/Mac 虛擬環境結構
+        venv_site_packages = home_dir / '.libreoffice' / 'python_env' / 'venv' / 'lib' / f'python{{python_major}}.{{python_minor}}' / 'site-packages'
 
-# 根據作業系統添加適當的路徑
-if system == 'Windows':
-    # Windows 路徑模式
-    for minor_ver in range(python_minor, python_minor + 3):  # 當前版本及未來兩個小版本
-        python_lib_dirs.append(
-            home_dir / 'AppData' / 'Local' / 'Programs' / 'Python' / 
-            f'Python{{python_major}}{{minor_ver}}' / 'Lib' / 'site-packages'
-        )
-    # 添加 pip 安裝的用戶模組路徑
-    python_lib_dirs.append(
-        home_dir / 'AppData' / 'Roaming' / 'Python' / 
-        f'Python{{python_major}}{{python_minor}}' / 'site-packages'
-    )
-elif system == 'Darwin':
-    # macOS 路徑模式
-    for minor_ver in range(python_minor - 1, python_minor + 2):  # 前一個版本、當前版本和下一個版本
-        if minor_ver > 0:  # 確保次要版本號有效
-            python_lib_dirs.append(
-                home_dir / 'Library' / 'Python' / f'{{python_major}}.{{minor_ver}}' / 'lib' / 'python' / 'site-packages'
-            )
-    # 常見的 homebrew Python 路徑
-    python_lib_dirs.append(Path(f'/usr/local/lib/python{{python_major}}.{{python_minor}}/site-packages'))
-    python_lib_dirs.append(Path(f'/opt/homebrew/lib/python{{python_major}}.{{python_minor}}/site-packages'))
-else:
-    # Linux 路徑模式
-    for minor_ver in range(python_minor - 1, python_minor + 2):  # 前一個版本、當前版本和下一個版本
-        if minor_ver > 0:  # 確保次要版本號有效
+    if venv_site_packages.exists():
+        python_lib_dirs.append(venv_site_packages)
+        logging.debug(f"添加虛擬環境路徑: {{venv_site_packages}}")
+
+    # 根據作業系統添加適當的路徑
+    if system == 'Windows':
+        # Windows 路徑模式
+        for minor_ver in range(python_minor, python_minor + 3):  # 當前版本及未來兩個小版本
             python_lib_dirs.append(
-                home_dir / '.local' / 'lib' / f'python{{python_major}}.{{minor_ver}}' / 'site-packages'
+                home_dir / 'AppData' / 'Local' / 'Programs' / 'Python' / 
+                f'Python{{python_major}}{{minor_ver}}' / 'Lib' / 'site-packages'
             )
-    # 常見的系統路徑
-    python_lib_dirs.append(Path(f'/usr/lib/python{{python_major}}.{{python_minor}}/site-packages'))
-    python_lib_dirs.append(Path(f'/usr/lib/python{{python_major}}/dist-packages'))
-    python_lib_dirs.append(Path(f'/usr/local/lib/python{{python_major}}.{{python_minor}}/site-packages'))
+        # 添加 pip 安裝的用戶模組路徑
+        python_lib_dirs.append(
+            home_dir / 'AppData' / 'Roaming' / 'Python' / 
+            f'Python{{python_major}}{{python_minor}}' / 'site-packages'
+        )
+    elif system == 'Darwin':
+        # macOS 路徑模式
+        for minor_ver in range(python_minor - 1, python_minor + 2):  # 前一個版本、當前版本和下一個版本
+            if minor_ver > 0:  # 確保次要版本號有效
+                python_lib_dirs.append(
+                    home_dir / 'Library' / 'Python' / f'{{python_major}}.{{minor_ver}}' / 'lib' / 'python' / 'site-packages'
+                )
+        # 常見的 homebrew Python 路徑
+        python_lib_dirs.append(Path(f'/usr/local/lib/python{{python_major}}.{{python_minor}}/site-packages'))
+        python_lib_dirs.append(Path(f'/opt/homebrew/lib/python{{python_major}}.{{python_minor}}/site-packages'))
+    else:
+        # Linux 路徑模式
+        for minor_ver in range(python_minor - 1, python_minor + 2):  # 前一個版本、當前版本和下一個版本
+            if minor_ver > 0:  # 確保次要版本號有效
+                python_lib_dirs.append(
+                    home_dir / '.local' / 'lib' / f'python{{python_major}}.{{minor_ver}}' / 'site-packages'
+                )
+        # 常見的系統路徑
+        python_lib_dirs.append(Path(f'/usr/lib/python{{python_major}}.{{python_minor}}/site-packages'))
+        python_lib_dirs.append(Path(f'/usr/lib/python{{python_major}}/dist-packages'))
+        python_lib_dirs.append(Path(f'/usr/local/lib/python{{python_major}}.{{python_minor}}/site-packages'))
 
-# 添加自定義模組目錄
-python_lib_dirs.append(home_dir / '.libreoffice' / 'python_modules')
+    # 添加自定義模組目錄
+    python_lib_dirs.append(home_dir / '.libreoffice' / 'python_modules')
+    return python_lib_dirs
+
+python_lib_dirs = load_path_manifest()
+if python_lib_dirs is None:
+    python_lib_dirs = probe_python_lib_dirs()
+else:
+    logging.debug(f"使用路徑清單: {{PATH_MANIFEST}}")
 
 # 添加所有可能的路徑
 for path in python_lib_dirs:
@@ -138,227 +280,1492 @@ for path in python_lib_dirs:
         sys.path.append(str(path))
         logging.debug(f"添加路徑: {{path}}")
 
-# 嘗試導入必要模組
+# 只確認必要模組可被找到，不在啟動時匯入（實際匯入延後到第一次使用）
 required_modules = {{
     'flask': 'Flask Web 框架',
     'speech_recognition': 'SpeechRecognition 語音辨識',
     'pyaudio': 'PyAudio 音訊處理'
 }}
 
-missing_modules = []
+def find_missing_modules():
+    import importlib.util
+    missing_modules = []
+    for module_name, description in required_modules.items():
+        if importlib.util.find_spec(module_name) is None:
+            logging.error(f"無法找到 {{description}}")
+            missing_modules.append(module_name)
+    return missing_modules
+
+# speech_recognition 與 PyAudio 延遲載入
+_sr_module = None
 
-for module_name, description in required_modules.items():
+def get_sr():
+    """第一次使用時才匯入 speech_recognition"""
+    global _sr_module
+    if _sr_module is None:
+        import speech_recognition
+        logging.debug(f"SpeechRecognition 語音辨識 版本: {{getattr(speech_recognition, '__version__', '未知')}}")
+        _sr_module = speech_recognition
+    return _sr_module
+
+# 麥克風檢查結果快取，避免每個請求都重新列舉音訊裝置
+MIC_CHECK_TTL = 30.0
+_mic_status = {{"available": None, "checked_at": 0.0}}
+
+def check_microphone(max_age=MIC_CHECK_TTL):
+    """檢查麥克風是否可用 (第一次呼叫時載入 PyAudio)"""
+    import time
+    if _mic_status["available"] is not None and time.monotonic() - _mic_status["checked_at"] < max_age:
+        return _mic_status["available"]
     try:
-        module = __import__(module_name)
-        if hasattr(module, '__version__'):
-            logging.debug(f"{{description}} 版本: {{module.__version__}}")
+        mic_list = get_sr().Microphone.list_microphone_names()
+        if not mic_list:
+            logging.warning("未檢測到麥克風裝置")
+            available = False
         else:
-            logging.debug(f"{{description}} 已導入")
-    except ImportError as e:
-        logging.error(f"無法導入 {{description}}: {{e}}")
-        missing_modules.append(module_name)
-
-if missing_modules:
-    error_msg = f"缺少必要模組: {{', '.join(missing_modules)}}，請安裝所需模組。"
-    logging.error(error_msg)
-    print(error_msg)
-    sys.exit(1)
-
-# Flask 應用程式
-try:
-    from flask import Flask, request, jsonify
-    import speech_recognition as sr
-    
-    app = Flask(__name__)
+            logging.debug(f"檢測到 {{len(mic_list)}} 個麥克風裝置")
+            available = True
+    except Exception as e:
+        logging.error(f"檢查麥克風時發生錯誤: {{e}}")
+        available = False
+    _mic_status["available"] = available
+    _mic_status["checked_at"] = time.monotonic()
+    return available
+
+def warm_up():
+    """服務開始接受連線後，在背景預先載入語音模組與麥克風狀態"""
+    try:
+        check_microphone()
+        logging.debug("背景預載完成")
+    except Exception as e:
+        logging.warning(f"背景預載失敗: {{e}}")
+
+# 使用者詞典 (與 API 腳本同目錄)，第一次使用時才載入
+DICTIONARY_FILE = Path(__file__).resolve().parent / 'dictionary.txt'
+_dictionary_store = {{"store": None}}
+
+def get_dictionary():
+    """取得使用者詞典，詞典檔變更時自動重新載入"""
+    if _dictionary_store["store"] is None:
+        from speech_dictionary import DictionaryStore
+        _dictionary_store["store"] = DictionaryStore(DICTIONARY_FILE)
+    return _dictionary_store["store"].get()
+
+def apply_dictionary(text):
+    """一次掃描套用使用者詞典的所有取代規則"""
+    try:
+        return get_dictionary().apply(text)
+    except Exception as e:
+        logging.error(f"套用詞典時發生錯誤: {{e}}")
+        return text
+
+# 設定檔 (與 API 腳本同目錄)，存檔後下一個請求即套用
+PROFILES_FILE = Path(__file__).resolve().parent / 'profiles.json'
+_profiles = {{"store": None}}
+
+def get_profiles():
+    """取得設定組合，第一次使用時載入"""
+    if _profiles["store"] is None:
+        from speech_profiles import ProfileStore
+        _profiles["store"] = ProfileStore(PROFILES_FILE)
+    return _profiles["store"]
+
+# 每位說話者的停頓模型 (與 API 腳本同目錄)，服務重新啟動後沿用
+PAUSE_MODEL_FILE = Path(__file__).resolve().parent / 'pause_model.json'
+_pause_model = {{"model": None}}
+
+def get_pause_model():
+    """取得停頓模型，第一次使用時載入"""
+    if _pause_model["model"] is None:
+        from speech_endpointing import PauseModel
+        _pause_model["model"] = PauseModel(PAUSE_MODEL_FILE)
+    return _pause_model["model"]
+
+# 區域網路共用服務的用戶端權杖 (與 API 腳本同目錄)，存檔後下一個請求即套用
+CLIENTS_FILE = Path(__file__).resolve().parent / 'clients.json'
+_clients = {{"registry": None, "uploads": None}}
+
+def get_clients():
+    """取得用戶端權杖設定，第一次使用時載入"""
+    if _clients["registry"] is None:
+        from speech_clients import ClientRegistry, UploadLimiter
+        _clients["uploads"] = UploadLimiter()
+        _clients["registry"] = ClientRegistry(CLIENTS_FILE)
+    return _clients["registry"]
+
+# 辨識紀錄 (與 API 腳本同目錄)，寫入在背景批次進行
+HISTORY_FILE = Path(__file__).resolve().parent / 'history.db'
+HISTORY_AUDIO_DIR = Path(__file__).resolve().parent / 'history_audio'
+_history = {{"store": None}}
+_history_lock = threading.Lock()
+
+def get_history():
+    """取得辨識紀錄，第一次使用時開啟資料庫"""
+    with _history_lock:
+        if _history["store"] is None:
+            from speech_history import TranscriptStore
+            _history["store"] = TranscriptStore(HISTORY_FILE, HISTORY_AUDIO_DIR)
+        return _history["store"]
+
+def stop_history():
+    """寫入佇列中剩餘的辨識紀錄"""
+    with _history_lock:
+        store, _history["store"] = _history["store"], None
+    if store is not None:
+        store.close()
+
+def record_history(entry, audio=None):
+    """把辨識結果交給辨識紀錄在背景寫入，不阻塞請求
+
+    設定 keep_audio 時 audio (AudioSpool) 一併交給辨識紀錄另存並關閉，回傳 audio 是否已交出。
+    """
+    try:
+        config = get_profiles().history()
+        if not config["enabled"]:
+            return False
+        store = get_history()
+        store.retention_days = config["retention_days"]
+        # 音訊來源本身是檔案時已有音訊檔，不再另存
+        keep = audio is not None and bool(config["keep_audio"]) and not entry.get("audio_ref")
+        store.record(entry, audio if keep else None)
+        return keep
+    except Exception as e:
+        logging.error(f"記錄辨識結果時發生錯誤: {{e}}")
+        return False
+
+def history_fields(kind, payload, settings, source, started, client='local', audio_ref=None):
+    """辨識紀錄中與辨識結果無關的欄位；started 為請求開始的 time.monotonic()"""
+    return {{
+        "kind": kind,
+        "client": client,
+        "profile": payload.get('profile'),
+        "source": str(source),
+        "engine": settings['engine'],
+        "started": started,
+        "audio_ref": audio_ref
+    }}
+
+def stream_history(options, settings, audio_source):
+    """連續聽寫每段結果的辨識紀錄回呼"""
+    fields = history_fields("stream", options, settings, settings['source'], None,
+                            audio_ref=audio_source.target if audio_source.kind == "file" else None)
+    fields.pop("started")
+
+    def on_result(result, audio_seconds, latency):
+        record_history(dict(fields, text=result["text"], language=settings['language'],
+                            audio_seconds=round(audio_seconds, 2), latency_ms=round(latency * 1000, 1)))
+    return on_result
+
+_engine = {{"engine": None, "config": None}}
+_engine_lock = threading.Lock()
+
+def get_engine():
+    """取得辨識引擎呼叫層 (期限、對沖請求與斷路器)，設定檔的 engine 變更時即時更新"""
+    config = get_profiles().engine()
+    with _engine_lock:
+        engine = _engine["engine"]
+        if engine is None:
+            from speech_engine import HedgedEngine
+            engine = HedgedEngine(definitive_errors=(get_sr().UnknownValueError,))
+            _engine["engine"] = engine
+        if config != _engine["config"]:
+            engine.configure(
+                deadline=config["deadline"],
+                hedge_percentile=config["hedge_percentile"],
+                min_hedge_delay=config["min_hedge_delay"],
+                max_hedge_delay=config["max_hedge_delay"],
+                failure_threshold=config["failure_threshold"],
+                reset_timeout=config["reset_timeout"]
+            )
+            _engine["config"] = config
+        return engine, config
+
+# sphinx 與 whisper 的工作程序池，第一次以本機引擎辨識時才啟動
+_worker_pool = {{"pool": None, "processes": None}}
+_worker_pool_lock = threading.Lock()
+
+def get_worker_pool(name, language, config):
+    """取得本機辨識引擎的工作程序池，engine 設定的 processes 為 0 時回傳 None (在執行緒中辨識)
+
+    processes 變更時改用新的工作池，舊工作池完成已送出的工作後結束。
+    """
+    processes = config.get("processes", "auto")
+    if processes == "auto":
+        processes = max(1, (os.cpu_count() or 2) - 1)
+    try:
+        processes = int(processes)
+    except (TypeError, ValueError):
+        logging.warning(f"engine 設定的 processes 無效: {{processes}}")
+        return None
+    if processes <= 0:
+        return None
+    with _worker_pool_lock:
+        pool = _worker_pool["pool"]
+        if pool is not None and _worker_pool["processes"] == processes:
+            return pool
+        from speech_workers import ProcessPool
+        sr = get_sr()
+        _worker_pool["pool"] = ProcessPool(processes, warm_up=(name, language), errors={{
+            "UnknownValueError": sr.UnknownValueError,
+            "RequestError": sr.RequestError
+        }}).start()
+        _worker_pool["processes"] = processes
+        logging.info(f"已啟動 {{processes}} 個辨識程序 ({{name}})")
+    if pool is not None:
+        pool.shutdown(wait=False)
+    return _worker_pool["pool"]
+
+def stop_worker_pool():
+    with _worker_pool_lock:
+        pool, _worker_pool["pool"] = _worker_pool["pool"], None
+    if pool is not None:
+        pool.shutdown()
+
+def pooled_function(name, options, config):
+    """在工作程序中執行本機辨識引擎；沒有工作程序池時回傳 None"""
+    from concurrent.futures import TimeoutError as FutureTimeout
+    from speech_workers import WorkerError
 
-    def check_microphone():
-        """檢查麥克風是否可用"""
+    def recognize(recognizer, audio, language):
+        pool = get_worker_pool(name, language, config)
+        if pool is None:
+            return getattr(recognizer, f'recognize_{{name}}')(audio, **local_engine_options(name, language, options))
+        future = pool.submit(name, audio, language, options)
         try:
-            mic_list = sr.Microphone.list_microphone_names()
-            if not mic_list:
-                logging.warning("未檢測到麥克風裝置")
-                return False
-            logging.debug(f"檢測到 {{len(mic_list)}} 個麥克風裝置")
-            return True
+            # 引擎呼叫層以剩餘期限作為 operation_timeout
+            return future.result(timeout=getattr(recognizer, 'operation_timeout', None))
+        except FutureTimeout:
+            future.cancel()
+            raise get_sr().RequestError("辨識程序逾時")
+        except WorkerError as e:
+            raise get_sr().RequestError(str(e))
+    return recognize
+
+def local_engine_options(name, language, options):
+    """本機辨識引擎的語言參數 (whisper 只使用語言代碼的前半)"""
+    return dict(options, language=language.split('-')[0] if name == "whisper" else language)
+
+def engine_function(name, config):
+    """依名稱取得辨識函式 recognize(recognizer, audio, language)，未設定時回傳 None"""
+    from speech_dictionary import engine_hint_options
+    hints = get_dictionary().hints
+    if name == "google":
+        options = engine_hint_options('google', hints)
+        if config.get("google_endpoint"):
+            options["endpoint"] = config["google_endpoint"]
+        return lambda recognizer, audio, language: recognizer.recognize_google(audio, language=language, **options)
+    if name in ("sphinx", "whisper"):
+        # 以 CPU 辨識的引擎在工作程序中執行，不受 GIL 限制
+        return pooled_function(name, engine_hint_options(name, hints), config)
+    if name:
+        logging.warning(f"不支援的辨識引擎: {{name}}")
+    return None
+
+def google_scored_function(config):
+    """Google 辨識並回傳 (文字, 信心度)，回應未附信心度時信心度為 None"""
+    from speech_dictionary import engine_hint_options
+    options = engine_hint_options('google', get_dictionary().hints)
+    if config.get("google_endpoint"):
+        options["endpoint"] = config["google_endpoint"]
+
+    def recognize(recognizer, audio, language):
+        result = recognizer.recognize_google(audio, language=language, show_all=True, **options)
+        alternatives = result.get("alternative") if isinstance(result, dict) else None
+        if not alternatives:
+            raise get_sr().UnknownValueError()
+        best = alternatives[0]
+        return best["transcript"], best.get("confidence")
+    return recognize
+
+def without_score(recognize):
+    if recognize is None:
+        return None
+    return lambda recognizer, audio, language: (recognize(recognizer, audio, language), None)
+
+def call_engine(primary, secondary, recognizer, audio, language, deadline=None):
+    """透過引擎呼叫層辨識，超過期限時轉為 RequestError"""
+    from speech_engine import DeadlineExceeded
+    engine, _ = get_engine()
+    try:
+        return engine.call(primary, secondary, recognizer, audio, language, deadline)
+    except DeadlineExceeded as e:
+        raise get_sr().RequestError(str(e))
+
+def recognize_text(recognizer, audio, language, engine="google", deadline=None):
+    """以指定的辨識引擎辨識語音，斷路器開啟時改用備用引擎"""
+    _, config = get_engine()
+    primary = engine_function(engine, config) or engine_function("google", config)
+    return call_engine(primary, engine_function(config["secondary"], config), recognizer, audio, language, deadline)
+
+def recognize_scored(recognizer, audio, language, engine="google", deadline=None):
+    """與 recognize_text 相同，但回傳 (文字, 信心度)；只有 Google 提供信心度"""
+    _, config = get_engine()
+    if engine == "google":
+        primary = google_scored_function(config)
+    else:
+        primary = without_score(engine_function(engine, config)) or google_scored_function(config)
+    secondary = without_score(engine_function(config["secondary"], config))
+    return call_engine(primary, secondary, recognizer, audio, language, deadline)
+
+# 片段與多語言辨識共用的執行緒池，第一次使用時才建立
+MAX_LANGUAGES = 4
+_recognize_pool = {{"executor": None}}
+_recognize_pool_lock = threading.Lock()
+
+def get_recognize_executor(client='local'):
+    """取得片段與多語言辨識的執行緒池中 client 的視圖 (各用戶端的工作輪流執行)"""
+    fair = get_clients().options()["scheduling"] != 'fifo'
+    with _recognize_pool_lock:
+        if _recognize_pool["executor"] is None:
+            from speech_clients import FairExecutor
+            _recognize_pool["executor"] = FairExecutor(MAX_LANGUAGES * 2, fair, thread_name_prefix='recognize')
+        executor = _recognize_pool["executor"]
+        executor.fair = fair
+        return executor.for_client(client)
+
+# 目前的連續聽寫工作階段 (同一時間只有一個)
+_stream = {{"session": None}}
+_stream_lock = threading.Lock()
+
+def stop_stream():
+    """停止進行中的連續聽寫擷取"""
+    with _stream_lock:
+        session = _stream["session"]
+    if session is not None:
+        session.stop()
+
+# 進行中的請求數，優雅關閉時等待其歸零
+# 帶有 request_id 的單次辨識，/recognize/partial 由此取得說話期間已先行辨識的暫定文字
+_live_recognitions = {{}}
+_live_lock = threading.Lock()
+
+_active_requests = {{"count": 0}}
+_active_lock = threading.Lock()
+# 目前的 WSGI 伺服器，供優雅關閉使用
+_server_ref = {{"server": None, "interface": None}}
+
+def stop_standby():
+    """結束熱備援實例，避免它在服務優雅關閉後接手"""
+    try:
+        pid = int(STANDBY_READY.read_text(encoding='utf-8').strip())
+    except (OSError, ValueError):
+        return
+    try:
+        import signal
+        os.kill(pid, signal.SIGTERM)
+        logging.info(f"已結束熱備援實例 (PID {{pid}})")
+    except OSError:
+        pass
+
+def graceful_shutdown(timeout=30.0):
+    """等待進行中的請求完成後停止伺服器"""
+    import time
+    stop_standby()
+    stop_stream()
+    deadline = time.monotonic() + timeout
+    while _active_requests["count"] > 0 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    stop_worker_pool()
+    stop_history()
+    server = _server_ref["server"]
+    if server is not None:
+        logging.info("API 服務優雅關閉")
+        server.shutdown()
+
+def script_is_current():
+    """確認磁碟上的腳本仍是本進程載入的版本"""
+    try:
+        with open(Path(__file__).resolve(), 'r', encoding='utf-8') as f:
+            return f"TEMPLATE_HASH = '{{TEMPLATE_HASH}}'" in f.read()
+    except OSError:
+        return False
+
+# 各端點的處理函式，回傳 (JSON 內容, HTTP 狀態碼)；WSGI (Flask) 與 ASGI 版本共用，回應內容相同
+def api_status():
+    """服務狀態 (麥克風狀態取自快取，不阻塞健康檢查)"""
+    return {{
+        "status": "running",
+        "microphone_available": _mic_status["available"],
+        "python_version": sys.version,
+        "timestamp": datetime.now().isoformat(),
+        "pid": os.getpid(),
+        "template_hash": TEMPLATE_HASH,
+        "interface": _server_ref["interface"],
+        "engine": _engine["engine"].stats() if _engine["engine"] is not None else None,
+        "endpointing": _pause_model["model"].stats() if _pause_model["model"] is not None else None,
+        "scheduling": _recognize_pool["executor"].stats() if _recognize_pool["executor"] is not None else None,
+        "workers": _worker_pool["pool"].stats() if _worker_pool["pool"] is not None else None,
+        "history": _history["store"].stats() if _history["store"] is not None else None
+    }}, 200
+
+def api_mic_check():
+    """檢查麥克風可用性，並列出可用 mic:<編號> 指定的輸入裝置"""
+    if check_microphone(max_age=0):
+        try:
+            from speech_sources import input_devices
+            devices = [{{"index": index, "name": name}} for index, name in input_devices(get_sr())]
         except Exception as e:
-            logging.error(f"檢查麥克風時發生錯誤: {{e}}")
-            return False
+            logging.error(f"列出音訊裝置時發生錯誤: {{e}}")
+            devices = []
+        return {{"success": True, "message": "麥克風可用", "devices": devices}}, 200
+    return {{"success": False, "error": "未檢測到可用麥克風"}}, 200
+
+def api_profiles():
+    """列出可用的設定組合與合併後的參數"""
+    store = get_profiles()
+    return {{"success": True, "profiles": {{name: store.get(name) for name in store.names()}}}}, 200
+
+def candidate_languages(settings):
+    """候選語言清單 (去除重複，最多 MAX_LANGUAGES 個)；字串以逗號分隔"""
+    languages = settings['languages'] or [settings['language']]
+    if isinstance(languages, str):
+        languages = languages.split(',')
+    return list(dict.fromkeys(language.strip() for language in languages if language.strip()))[:MAX_LANGUAGES]
+
+def segment_recognize(settings, languages):
+    """片段辨識函式，回傳 (文字, 信心度)；只有一個候選語言時不取信心度"""
+    engine = settings['engine']
+    # 每個片段辨識請求的期限 (秒)，未指定時使用設定檔 engine 的設定
+    deadline = settings['deadline']
+    if len(languages) == 1:
+        return lambda recognizer, audio, language: (recognize_text(recognizer, audio, language, engine, deadline), None)
+    return lambda recognizer, audio, language: recognize_scored(recognizer, audio, language, engine, deadline)
+
+def prepare_recognizer(sr, settings, payload):
+    """依設定建立 Recognizer，回傳 (recognizer, 停頓記錄)
+
+    開啟 adaptive_pause 時依說話者過去的句中停頓縮短等待時間 (設定值為上限)，
+    停頓記錄為 (說話者, 設定的等待時間, PauseObserver)，否則為 None。
+    """
+    # 在檢測到語音停止後，再等待這麼久才結束識別
+    pause_threshold = settings['pause_threshold']
+    adaptive = None
+    if settings['adaptive_pause']:
+        from speech_endpointing import PauseObserver
+        speaker = str(payload.get('speaker') or 'default')
+        configured_pause = float(pause_threshold)
+        pause_threshold = get_pause_model().threshold(speaker, configured_pause)
+        adaptive = (speaker, configured_pause, PauseObserver())
+
+    recognizer = sr.Recognizer()
+    # 設定靜音等待時間 - 檢測到停止說話後再等多久才算結束
+    recognizer.pause_threshold = float(pause_threshold)
+    # 設定檢測靜音時間閾值
+    recognizer.non_speaking_duration = min(float(settings['non_speaking_duration']), recognizer.pause_threshold)
+    if settings['energy_threshold'] is not None:
+        # 固定的音量門檻，不再依環境噪音調整
+        recognizer.energy_threshold = float(settings['energy_threshold'])
+        recognizer.dynamic_energy_threshold = False
+    return recognizer, adaptive
+
+def observe_pauses(adaptive, on_chunk):
+    """開啟 adaptive_pause 時在 on_chunk 之前量測停頓"""
+    if adaptive is None:
+        return on_chunk
+    observer = adaptive[2]
+    observer.forward = on_chunk
+    return observer.on_chunk
+
+def record_pauses(adaptive, recognizer):
+    if adaptive is not None:
+        speaker, configured_pause, observer = adaptive
+        get_pause_model().record(speaker, observer.pauses, configured_pause, recognizer.pause_threshold,
+                                 observer.end_wait)
+
+def resolve_source(settings):
+    """取得設定的音訊來源，回傳 (來源, 錯誤回應)；使用麥克風時先確認有可用的麥克風"""
+    from speech_sources import parse_source, SourceError
+    try:
+        source = parse_source(settings['source'])
+    except SourceError as e:
+        return None, ({{"success": False, "error": str(e)}}, 200)
+    if source.microphone and not check_microphone():
+        return None, ({{"success": False, "error": "未檢測到可用麥克風"}}, 200)
+    return source, None
+
+def capture_to_spool(sr, recognizer, settings, audio_source, on_chunk=None):
+    """開啟音訊來源、校正環境噪音 (即時音訊) 後擷取一段語音，回傳 AudioSpool
+
+    音訊來源在語音開始前就結束時拋出 EOFError。
+    """
+    from speech_capture import listen_to_spool, adjust_for_ambient_noise
+    with audio_source.open(sr, timeout=settings['timeout']) as source:
+        logging.debug(f"{{audio_source}}開啟")
+        # 調整環境噪音
+        if audio_source.live and settings['ambient_duration'] and settings['energy_threshold'] is None:
+            adjust_for_ambient_noise(recognizer, source, duration=float(settings['ambient_duration']))
+            logging.debug("已調整環境噪音")
+    
+        # 提示用戶開始說話
+        print("請開始說話...")
+        
+        # 取得語音輸入 - 音訊寫入暫存區，長時間說話時改存暫存檔，記憶體用量固定
+        return listen_to_spool(sr, recognizer, source, timeout=settings['timeout'],
+                               phrase_time_limit=settings['phrase_time_limit'], on_chunk=on_chunk)
+
+def finish_recognition(sr, speculative, spool, languages, history=None):
+    """等待先行辨識的片段並辨識最後一段，依序串接後套用使用者詞典，回傳 /recognize 的回應
+
+    history 為辨識紀錄的欄位 (見 history_fields)，辨識成功時連同文字與各段耗時交給辨識紀錄。
+    """
+    import time
+    captured = time.monotonic()
+    handed_over = False
+    try:
+        results = speculative.finish(spool)
+        for result in results:
+            result["text"] = apply_dictionary(result["text"])
+        best = results[0]
+        logging.debug(f"辨識結果 ({{best['language']}}): {{best['text']}}")
+        response = {{
+            "success": True, 
+            "text": best["text"],
+            "language": best["language"]
+        }}
+        if len(languages) > 1:
+            response["confidence"] = best["confidence"]
+            response["alternatives"] = results[1:]
+        if history is not None:
+            entry = dict(history, text=best["text"], language=best["language"], confidence=best.get("confidence"),
+                         audio_seconds=round(spool.duration, 2),
+                         capture_ms=round((captured - history["started"]) * 1000, 1),
+                         latency_ms=round((time.monotonic() - captured) * 1000, 1))
+            del entry["started"]
+            handed_over = record_history(entry, spool)
+        return response, 200
+    except sr.UnknownValueError:
+        logging.warning("無法辨識語音內容")
+        return {{"success": False, "error": "無法辨識語音內容"}}, 200
+    except sr.RequestError as e:
+        logging.error(f"Google API 請求錯誤: {{str(e)}}")
+        return {{"success": False, "error": f"語音辨識服務錯誤: {{str(e)}}"}}, 200
+    finally:
+        if not handed_over:
+            spool.close()
+
+def api_recognize(payload):
+    """語音辨識：開啟麥克風聆聽一段語音並回傳辨識結果"""
+    import time
+    started = time.monotonic()
+    try:
+        from speech_capture import SpeculativeRecognizer
+        sr = get_sr()
+        # 依請求指定的設定組合取得參數 (profiles.json)，請求本身帶的參數優先
+        from speech_profiles import resolve_settings
+        settings = resolve_settings(get_profiles(), payload)
+        # 先檢查音訊來源 (使用麥克風時確認有可用的麥克風)
+        audio_source, error = resolve_source(settings)
+        if error is not None:
+            return error
+            
+        # 候選語言清單：同一段音訊以各語言同時辨識，回傳信心度最高者與其他候選結果
+        languages = candidate_languages(settings)
+        recognizer, adaptive = prepare_recognizer(sr, settings, payload)
+        
+        logging.debug(f"開始辨識 ({{payload.get('profile') or '預設'}})，語言: {{', '.join(languages)}}, 超時: {{settings['timeout']}}秒, 靜音等待: {{recognizer.pause_threshold}}秒")
+
+        # 說話期間在停頓處切出已完成的片段先行辨識，說完後只需辨識最後一段
+        speculative = SpeculativeRecognizer(sr, recognizer, languages, segment_recognize(settings, languages),
+                                            get_recognize_executor())
+        request_id = payload.get('request_id')
+        if request_id:
+            with _live_lock:
+                _live_recognitions[str(request_id)] = speculative
+        try:
+            try:
+                spool = capture_to_spool(sr, recognizer, settings, audio_source, observe_pauses(adaptive, speculative.on_chunk))
+                logging.debug(f"已擷取音訊 ({{spool.duration:.1f}} 秒{{'，已寫入暫存檔' if spool.spilled else ''}}，"
+                              f"已先行送出 {{len(speculative.segments)}} 段)")
+                record_pauses(adaptive, recognizer)
+            except sr.WaitTimeoutError:
+                speculative.cancel()
+                return {{"success": False, "error": "聆聽超時，未檢測到語音"}}, 200
+            except EOFError:
+                speculative.cancel()
+                return {{"success": False, "error": "音訊來源已結束，未檢測到語音"}}, 200
+            except Exception as e:
+                speculative.cancel()
+                logging.error(f"{{audio_source.label}}使用錯誤: {{str(e)}}")
+                return {{"success": False, "error": f"{{audio_source.label}}使用錯誤: {{str(e)}}"}}, 200
+        
+            history = history_fields("recognize", payload, settings, settings['source'], started,
+                                     audio_ref=audio_source.target if audio_source.kind == "file" else None)
+            return finish_recognition(sr, speculative, spool, languages, history)
+        finally:
+            if request_id:
+                with _live_lock:
+                    _live_recognitions.pop(str(request_id), None)
+        
+    except Exception as e:
+        logging.error(f"處理請求時發生錯誤: {{str(e)}}")
+        return {{"success": False, "error": f"發生錯誤: {{str(e)}}"}}, 200
+
+def api_recognize_partial(request_id):
+    """進行中的單次辨識 (/recognize 帶 request_id) 已先行辨識完成的暫定文字，已套用使用者詞典
+
+    辨識已結束或沒有這個請求時 active 為 False。
+    """
+    with _live_lock:
+        speculative = _live_recognitions.get(str(request_id or ''))
+    if speculative is None:
+        return {{"success": True, "active": False, "partial": ""}}, 200
+    return {{"success": True, "active": True, "partial": apply_dictionary(speculative.partial())}}, 200
+
+def api_capture(payload):
+    """用戶端模式：在本機擷取一段語音並以 PCM 串流回傳，由擴充套件上傳到區域網路上的共用服務
+
+    開始送出音訊前發生的錯誤 (沒有麥克風、聆聽逾時) 回傳與 /recognize 相同的 JSON；
+    否則回傳 CaptureStream。PCM 在語音確定開始後就邊擷取邊送出，不等說完；
+    format 為 flac 時說完後壓縮成一個 FLAC 檔送出 (頻寬有限的網路)。
+    """
+    try:
+        from speech_capture import PhraseStreamer, CaptureStream
+        sr = get_sr()
+        from speech_profiles import resolve_settings
+        settings = resolve_settings(get_profiles(), payload)
+        audio_source, error = resolve_source(settings)
+        if error is not None:
+            return error
+        recognizer, adaptive = prepare_recognizer(sr, settings, payload)
+        stream = CaptureStream()
+        flac = str(payload.get('format') or 'pcm').lower() == 'flac'
+        streamer = None if flac else PhraseStreamer(stream.put, recognizer.phrase_threshold)
+
+        def capture():
+            try:
+                spool = capture_to_spool(sr, recognizer, settings, audio_source,
+                                         observe_pauses(adaptive, streamer.on_chunk if streamer is not None else None))
+                try:
+                    if streamer is not None:
+                        streamer.finish(spool)
+                    elif spool.length:
+                        with spool.view() as view:
+                            audio = sr.AudioData(bytes(view), spool.sample_rate, spool.sample_width)
+                        stream.media_type = 'audio/flac'
+                        stream.put(audio.get_flac_data(), spool.sample_rate, spool.sample_width)
+                    logging.debug(f"已擷取音訊 ({{spool.duration:.1f}} 秒{{'，FLAC' if flac else ''}})")
+                    record_pauses(adaptive, recognizer)
+                finally:
+                    spool.close()
+                stream.close()
+            except sr.WaitTimeoutError:
+                stream.close("聆聽超時，未檢測到語音")
+            except EOFError:
+                stream.close("音訊來源已結束，未檢測到語音")
+            except Exception as e:
+                logging.error(f"{{audio_source.label}}使用錯誤: {{str(e)}}")
+                stream.close(f"{{audio_source.label}}使用錯誤: {{str(e)}}")
+
+        threading.Thread(target=capture, name='capture', daemon=True).start()
+        if stream.first() is None:
+            return {{"success": False, "error": stream.error or "聆聽超時，未檢測到語音"}}, 200
+        return stream
+    except Exception as e:
+        logging.error(f"擷取語音時發生錯誤: {{str(e)}}")
+        return {{"success": False, "error": f"發生錯誤: {{str(e)}}"}}, 200
+
+def is_loopback(address):
+    import ipaddress
+    try:
+        return ipaddress.ip_address(address).is_loopback
+    except ValueError:
+        return address == 'localhost'
+
+# 使用服務端麥克風的端點只接受本機請求；服務綁定區域網路介面時，其他電腦只能上傳音訊
+LOCAL_ONLY_PATHS = ('/recognize', '/recognize/partial', '/capture', '/mic_check', '/stream/start', '/stream/results', '/stream/events', '/stream/stop')
+# 辨識紀錄包含所有用戶端的文字，同樣只接受本機請求
+HISTORY_PATHS = ('/history', '/history/latency')
+
+def check_access(path, remote_addr):
+    """其他電腦不可使用服務端的麥克風與辨識紀錄，拒絕時回傳錯誤回應，否則回傳 None"""
+    if is_loopback(remote_addr):
+        return None
+    if path in LOCAL_ONLY_PATHS:
+        return {{"success": False, "error": "只允許本機使用麥克風"}}, 403
+    if path in HISTORY_PATHS:
+        return {{"success": False, "error": "只允許本機查詢辨識紀錄"}}, 403
+    return None
+
+def authenticate_client(authorization, remote_addr):
+    """取得上傳音訊的用戶端名稱，回傳 (用戶端, 錯誤回應)
+
+    clients.json 設定了用戶端時一律需要權杖 (包含本機請求)；未設定時只接受本機請求，用戶端為 local。
+    """
+    registry = get_clients()
+    if registry.enabled():
+        client = registry.authenticate(authorization)
+        if client is None:
+            return None, ({{"success": False, "error": "權杖無效或未提供"}}, 401)
+        return client, None
+    if not is_loopback(remote_addr):
+        return None, ({{"success": False, "error": "服務未設定用戶端權杖，只接受本機上傳"}}, 401)
+    return 'local', None
+
+# 上傳音訊時可用查詢參數指定的項目
+UPLOAD_PARAMETERS = ('profile', 'language', 'languages', 'engine', 'speaker')
+
+def upload_parameters(get):
+    """由查詢參數取得上傳音訊的辨識選項 (get 為依名稱取值的函式)"""
+    return {{key: get(key) for key in UPLOAD_PARAMETERS if get(key)}}
+
+def receive_audio_file(sr, read, energy_threshold, on_chunk, max_seconds):
+    """收完 WAV、AIFF 或 FLAC 檔後解碼寫入 AudioSpool (上傳的檔案較大時暫存到磁碟)"""
+    import tempfile
+    from speech_capture import receive_to_spool, AudioTooLong
+    # 以未壓縮的 48 kHz 16 位元立體聲估算檔案大小上限
+    limit = int(max_seconds * 48000 * 4) + 1024 * 1024
+    with tempfile.SpooledTemporaryFile(max_size=1024 * 1024) as upload:
+        while True:
+            data = read(65536)
+            if not data:
+                break
+            upload.write(data)
+            if upload.tell() > limit:
+                raise AudioTooLong(f"upload exceeds {{limit}} bytes")
+        upload.seek(0)
+        with sr.AudioFile(upload) as source:
+            width = source.SAMPLE_WIDTH
+            # AudioFile 的 read 以取樣數為單位
+            return receive_to_spool(lambda size: source.stream.read(size // width), source.SAMPLE_RATE, width,
+                                    energy_threshold, on_chunk, max_bytes=int(max_seconds * source.SAMPLE_RATE) * width)
+
+def api_recognize_audio(client, payload, content_type, read):
+    """辨識用戶端上傳的音訊，回應與 /recognize 相同
+
+    PCM (audio/pcm; rate=16000; width=2) 邊接收邊在停頓處切出片段先行辨識，上傳結束時只剩最後一段；
+    WAV、AIFF 與 FLAC 收完整個檔案後再辨識。各用戶端的辨識工作輪流使用執行緒池。
+    """
+    import time
+    from speech_clients import parse_audio_type
+    audio_type = parse_audio_type(content_type)
+    if audio_type is None:
+        return {{"success": False, "error": "不支援的音訊格式"}}, 415
+    options = get_clients().options()
+    if not _clients["uploads"].acquire(client, options["max_uploads"]):
+        return {{"success": False, "error": "同時上傳的請求過多"}}, 429
+    speculative = None
+    try:
+        from speech_capture import receive_to_spool, SpeculativeRecognizer, AudioTooLong
+        from speech_profiles import resolve_settings
+        sr = get_sr()
+        settings = resolve_settings(get_profiles(), payload)
+        languages = candidate_languages(settings)
+        recognizer = sr.Recognizer()
+        speculative = SpeculativeRecognizer(sr, recognizer, languages, segment_recognize(settings, languages),
+                                            get_recognize_executor(client))
+        # 斷句已由用戶端完成，音量門檻只用來找出片段間的停頓
+        energy_threshold = float(settings['energy_threshold'] or recognizer.energy_threshold)
+        max_seconds = float(options["max_upload_seconds"])
+        kind, rate, width = audio_type
+        started = time.monotonic()
+        try:
+            if kind == 'pcm':
+                spool = receive_to_spool(read, rate, width, energy_threshold, speculative.on_chunk,
+                                         max_bytes=int(max_seconds * rate) * width)
+            else:
+                spool = receive_audio_file(sr, read, energy_threshold, speculative.on_chunk, max_seconds)
+        except AudioTooLong:
+            speculative.cancel()
+            return {{"success": False, "error": f"音訊超過 {{max_seconds:g}} 秒"}}, 413
+        except ValueError as e:
+            speculative.cancel()
+            logging.warning(f"無法讀取 {{client}} 上傳的音訊檔: {{e}}")
+            return {{"success": False, "error": "無法讀取音訊檔"}}, 400
+        if spool.length == 0:
+            speculative.cancel()
+            spool.close()
+            return {{"success": False, "error": "未收到音訊"}}, 400
+        logging.debug(f"已接收 {{client}} 上傳的音訊 ({{spool.duration:.1f}} 秒，耗時 {{time.monotonic() - started:.1f}} 秒，"
+                      f"已先行送出 {{len(speculative.segments)}} 段)")
+        history = history_fields("upload", payload, settings, content_type, started, client)
+        return finish_recognition(sr, speculative, spool, languages, history)
+    except Exception as e:
+        if speculative is not None:
+            speculative.cancel()
+        logging.error(f"辨識 {{client}} 上傳的音訊時發生錯誤: {{str(e)}}")
+        return {{"success": False, "error": f"發生錯誤: {{str(e)}}"}}, 200
+    finally:
+        _clients["uploads"].release(client)
+
+def api_stream_start(options):
+    """開始連續聽寫，已有進行中的工作階段時沿用該工作階段"""
+    try:
+        from speech_stream import StreamSession
+        sr = get_sr()
+        from speech_profiles import resolve_settings
+        settings = resolve_settings(get_profiles(), options)
+        audio_source, error = resolve_source(settings)
+        if error is not None:
+            return error
+        with _stream_lock:
+            session = _stream["session"]
+            if session is not None and not session.stop_event.is_set():
+                return {{"success": True, "session": session.id, "language": session.language, "already_running": True}}, 200
+            engine, deadline = settings['engine'], settings['deadline']
+            session = StreamSession(
+                sr,
+                language=settings['language'],
+                pause_threshold=settings['pause_threshold'],
+                non_speaking_duration=settings['non_speaking_duration'],
+                phrase_time_limit=settings['phrase_time_limit'],
+                workers=settings['workers'],
+                partial_interval=settings['partial_interval'],
+                ambient_duration=settings['ambient_duration'],
+                energy_threshold=settings['energy_threshold'],
+                pause_model=get_pause_model() if settings['adaptive_pause'] else None,
+                speaker=str(options.get('speaker') or 'default'),
+                recognize=lambda recognizer, audio, language: recognize_text(recognizer, audio, language, engine, deadline),
+                postprocess=apply_dictionary,
+                source=audio_source,
+                on_result=stream_history(options, settings, audio_source)
+            )
+            session.start()
+            _stream["session"] = session
+        return {{"success": True, "session": session.id, "language": session.language}}, 200
+    except Exception as e:
+        logging.error(f"開始連續聽寫時發生錯誤: {{str(e)}}")
+        return {{"success": False, "error": f"發生錯誤: {{str(e)}}"}}, 200
+
+def find_stream_session(session_id):
+    """取得目前的連續聽寫工作階段，回傳 (工作階段, 錯誤回應)"""
+    with _stream_lock:
+        session = _stream["session"]
+    if session is None or (session_id and session_id != session.id):
+        return None, ({{"success": False, "error": "連續聽寫工作階段不存在"}}, 404)
+    return session, None
+
+def api_stream_results(session_id, after=0, wait=10.0, partial_after=None):
+    """長輪詢連續聽寫結果：回傳序號大於 after 的結果，沒有新結果時最多等待 wait 秒"""
+    session, error = find_stream_session(session_id)
+    if error is not None:
+        return error
+    data = session.results_after(after, min(wait, 30.0), partial_after)
+    data["success"] = True
+    return data, 200
+
+def api_stream_stop():
+    """停止連續聽寫擷取，已擷取的語音仍會完成辨識並可由 /stream/results 取得"""
+    with _stream_lock:
+        session = _stream["session"]
+    if session is None:
+        return {{"success": False, "error": "沒有進行中的連續聽寫"}}, 200
+    session.stop()
+    return {{"success": True, "session": session.id}}, 200
+
+def api_history(arg):
+    """搜尋辨識紀錄：q 為關鍵字 (空白分隔，全部符合)，before 為上一頁最後一筆的 id
+
+    arg(名稱, 預設值, 型別) 取得查詢參數，與 Flask 的 request.args.get 相同。
+    """
+    try:
+        limit = max(1, min(arg('limit', 20, int), 200))
+        results = get_history().search(arg('q'), limit, arg('before', None, int), arg('kind'), arg('client'))
+    except Exception as e:
+        logging.error(f"搜尋辨識紀錄時發生錯誤: {{str(e)}}")
+        return {{"success": False, "error": f"發生錯誤: {{str(e)}}"}}, 200
+    return {{
+        "success": True,
+        "results": results,
+        "next_before": results[-1]["id"] if len(results) == limit else None
+    }}, 200
+
+def api_history_latency(arg):
+    """最近 days 天 (預設 7 天) 每天各類辨識的筆數與延遲百分位數"""
+    try:
+        return {{"success": True, "days": get_history().latency(arg('days', 7, float))}}, 200
+    except Exception as e:
+        logging.error(f"統計辨識延遲時發生錯誤: {{str(e)}}")
+        return {{"success": False, "error": f"發生錯誤: {{str(e)}}"}}, 200
+
+def api_shutdown(remote_addr):
+    """優雅關閉服務 (僅限本機)，用於擴充套件更新後替換舊版服務"""
+    if not is_loopback(remote_addr):
+        return {{"success": False, "error": "只允許本機關閉服務"}}, 403
+    threading.Thread(target=graceful_shutdown, name='shutdown', daemon=True).start()
+    return {{"success": True, "message": "服務即將關閉"}}, 200
+
+def request_started():
+    with _active_lock:
+        _active_requests["count"] += 1
+
+def request_finished():
+    with _active_lock:
+        _active_requests["count"] -= 1
+
+# WSGI (Flask) 應用程式
+def create_app():
+    from flask import Flask, Response, request, jsonify
+    
+    app = Flask(__name__)
+
+    def respond(result):
+        body, status = result
+        return jsonify(body), status
 
     @app.route('/', methods=['GET'])
     def index():
         """API 根路徑，返回服務狀態"""
-        mic_available = check_microphone()
-        return jsonify({{
-            "status": "running",
-            "microphone_available": mic_available,
-            "python_version": sys.version,
-            "timestamp": datetime.now().isoformat()
-        }})
+        return respond(api_status())
 
     @app.route('/mic_check', methods=['GET'])
     def mic_check():
-        """檢查麥克風可用性"""
-        mic_available = check_microphone()
-        if mic_available:
-            return jsonify({{"success": True, "message": "麥克風可用"}})
-        else:
-            return jsonify({{"success": False, "error": "未檢測到可用麥克風"}})
+        return respond(api_mic_check())
+
+    @app.route('/profiles', methods=['GET'])
+    def list_profiles():
+        return respond(api_profiles())
 
     @app.route('/recognize', methods=['POST'])
     def recognize_speech():
         """語音辨識端點"""
-        try:
-            # 先檢查麥克風
-            if not check_microphone():
-                return jsonify({{"success": False, "error": "未檢測到可用麥克風"}})
-                
-            # 獲取設置參數
-            language = request.json.get('language', 'zh-TW')
-            timeout = request.json.get('timeout', 10)  # 增加默認等待時間到10秒
-            phrase_time_limit = request.json.get('phrase_time_limit', None)
-            # 新增靜音等待參數 - 在檢測到語音停止後，再等待這麼久才結束識別
-            pause_threshold = request.json.get('pause_threshold', 5.0)  # 默認等待5秒無聲才結束
-            non_speaking_duration = request.json.get('non_speaking_duration', 1.0)  # 設定檢測無聲時間閾值
-            
-            logging.debug(f"開始辨識，語言: {{language}}, 超時: {{timeout}}秒, 靜音等待: {{pause_threshold}}秒")
-            
-            recognizer = sr.Recognizer()
-            # 設定靜音等待時間 - 檢測到停止說話後再等多久才算結束
-            recognizer.pause_threshold = float(pause_threshold)
-            # 設定檢測靜音時間閾值
-            recognizer.non_speaking_duration = float(non_speaking_duration)
-            
-            try:
-                with sr.Microphone() as source:
-                    logging.debug("麥克風開啟")
-                    # 調整環境噪音
-                    recognizer.adjust_for_ambient_noise(source)
-                    logging.debug("已調整環境噪音")
-                
-                    # 提示用戶開始說話
-                    print("請開始說話...")
-                    
-                    # 取得語音輸入 - 注意使用更長的timeout和phrase_time_limit
-                    audio = recognizer.listen(source, timeout=timeout, phrase_time_limit=phrase_time_limit)
-                    logging.debug("已擷取音訊")
-            except sr.WaitTimeoutError:
-                return jsonify({{"success": False, "error": "聆聽超時，未檢測到語音"}})
-            except Exception as e:
-                logging.error(f"麥克風使用錯誤: {{str(e)}}")
-                return jsonify({{"success": False, "error": f"麥克風使用錯誤: {{str(e)}}"}})
-            
-            try:
-                # 使用 Google API 辨識語音
-                recognized_text = recognizer.recognize_google(audio, language=language)
-                logging.debug(f"辨識結果: {{recognized_text}}")
-                
-                return jsonify({{
-                    "success": True, 
-                    "text": recognized_text,
-                    "language": language
-                }})
-            except sr.UnknownValueError:
-                logging.warning("無法辨識語音內容")
-                return jsonify({{"success": False, "error": "無法辨識語音內容"}})
-            except sr.RequestError as e:
-                logging.error(f"Google API 請求錯誤: {{str(e)}}")
-                return jsonify({{"success": False, "error": f"語音辨識服務錯誤: {{str(e)}}"}})
-            
-        except Exception as e:
-            logging.error(f"處理請求時發生錯誤: {{str(e)}}")
-            return jsonify({{"success": False, "error": f"發生錯誤: {{str(e)}}"}})
+        return respond(api_recognize(request.get_json(silent=True) or {{}}))
+
+    @app.route('/recognize/partial', methods=['GET'])
+    def recognize_partial():
+        """單次辨識進行中的暫定文字"""
+        return respond(api_recognize_partial(request.args.get('id')))
+
+    @app.route('/recognize_audio', methods=['POST'])
+    def recognize_audio():
+        """辨識上傳的音訊 (區域網路共用服務)"""
+        client, error = authenticate_client(request.headers.get('Authorization'), request.remote_addr)
+        if error is not None:
+            return respond(error)
+        return respond(api_recognize_audio(client, upload_parameters(request.args.get), request.content_type,
+                                           request.stream.read))
+
+    @app.route('/capture', methods=['POST'])
+    def capture():
+        """在本機擷取一段語音並以 PCM 串流回傳 (用戶端模式)"""
+        result = api_capture(request.get_json(silent=True) or {{}})
+        if isinstance(result, tuple):
+            return respond(result)
+        return Response(result.chunks(), content_type=result.content_type)
+
+    @app.route('/stream/start', methods=['POST'])
+    def stream_start():
+        return respond(api_stream_start(request.get_json(silent=True) or {{}}))
+
+    @app.route('/stream/results', methods=['GET'])
+    def stream_results():
+        args = request.args
+        return respond(api_stream_results(args.get('session'), args.get('after', 0, type=int),
+                                          args.get('wait', 10.0, type=float), args.get('partial_after', None, type=int)))
+
+    @app.route('/stream/events', methods=['GET'])
+    def stream_events():
+        """以 NDJSON 串流連續聽寫的更新，每行與 /stream/results 的回應相同，工作階段結束時關閉"""
+        session, error = find_stream_session(request.args.get('session'))
+        if error is not None:
+            return respond(error)
+        after = request.args.get('after', 0, type=int)
+        partial_after = request.args.get('partial_after', None, type=int)
+
+        def generate():
+            import json
+            for data in session.events(after, partial_after):
+                data["success"] = True
+                yield json.dumps(data, ensure_ascii=False) + "\n"
+        return Response(generate(), mimetype='application/x-ndjson')
+
+    @app.route('/stream/stop', methods=['POST'])
+    def stream_stop():
+        return respond(api_stream_stop())
+
+    @app.route('/history', methods=['GET'])
+    def history():
+        """搜尋辨識紀錄"""
+        return respond(api_history(request.args.get))
+
+    @app.route('/history/latency', methods=['GET'])
+    def history_latency():
+        return respond(api_history_latency(request.args.get))
+
+    @app.route('/shutdown', methods=['POST'])
+    def shutdown():
+        return respond(api_shutdown(request.remote_addr))
+
+    @app.before_request
+    def track_request_start():
+        request_started()
+        error = check_access(request.path, request.remote_addr)
+        if error is not None:
+            return respond(error)
+
+    @app.teardown_request
+    def track_request_end(error):
+        request_finished()
 
     @app.errorhandler(404)
     def not_found(error):
         """處理 404 錯誤"""
         return jsonify({{"success": False, "error": "端點不存在"}}), 404
 
+    @app.errorhandler(405)
+    def method_not_allowed(error):
+        return jsonify({{"success": False, "error": "不支援的請求方法"}}), 405
+
     @app.errorhandler(500)
     def server_error(error):
         """處理 500 錯誤"""
         logging.error(f"伺服器錯誤: {{str(error)}}")
         return jsonify({{"success": False, "error": "伺服器內部錯誤"}}), 500
-                
-except Exception as e:
-    logging.error(f"初始化 Flask 或 SpeechRecognition 發生錯誤: {{e}}")
-    print(f"初始化錯誤: {{e}}")
-    sys.exit(1)                
 
-if __name__ == '__main__':
-    # 檢查端口是否已被使用
-    import socket
-    port = 5000
-    retry = 0
-    
-    while retry < 3:
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        result = sock.connect_ex(('127.0.0.1', port))
-        sock.close()
-        
-        if result == 0:  # 端口已被使用
-            logging.warning(f"端口 {{port}} 已被占用，嘗試使用 {{port+1}}")
-            port += 1
-            retry += 1
+    return app
+
+# ASGI 應用程式：端點與回應和 create_app 相同，麥克風與辨識等阻塞工作交給執行緒池，
+# 連續聽寫的長輪詢與串流在等待期間不佔用執行緒
+def create_asgi_app(workers=8):
+    from speech_asgi import AsgiApp, StreamingResponse, wait_for_session, session_events
+
+    app = AsgiApp(workers, on_request_start=request_started, on_request_end=request_finished,
+                  before_request=lambda request: check_access(request.path, request.remote_addr))
+
+    @app.route('/')
+    async def index(request):
+        return api_status()
+
+    @app.route('/mic_check')
+    async def mic_check(request):
+        return await app.run_blocking(api_mic_check)
+
+    @app.route('/profiles')
+    async def list_profiles(request):
+        return api_profiles()
+
+    @app.route('/recognize', methods=('POST',))
+    async def recognize_speech(request):
+        return await app.run_blocking(api_recognize, request.json())
+
+    @app.route('/recognize/partial')
+    async def recognize_partial(request):
+        return api_recognize_partial(request.arg('id'))
+
+    @app.route('/recognize_audio', methods=('POST',), stream_body=True)
+    async def recognize_audio(request):
+        client, error = authenticate_client(request.header('Authorization'), request.remote_addr)
+        if error is not None:
+            return error
+        return await app.run_blocking(api_recognize_audio, client, upload_parameters(request.arg),
+                                      request.header('Content-Type'), request.body.read)
+
+    @app.route('/capture', methods=('POST',))
+    async def capture(request):
+        result = await app.run_blocking(api_capture, request.json())
+        if isinstance(result, tuple):
+            return result
+
+        async def chunks():
+            while True:
+                data = await app.run_blocking(result.next)
+                if data is None:
+                    return
+                yield data
+        return StreamingResponse(chunks(), result.content_type)
+
+    @app.route('/stream/start', methods=('POST',))
+    async def stream_start(request):
+        return await app.run_blocking(api_stream_start, request.json())
+
+    @app.route('/stream/results')
+    async def stream_results(request):
+        session, error = find_stream_session(request.arg('session'))
+        if error is not None:
+            return error
+        data = await wait_for_session(session, request.arg('after', 0, int), min(request.arg('wait', 10.0, float), 30.0),
+                                      request.arg('partial_after', None, int))
+        data["success"] = True
+        return data, 200
+
+    @app.route('/stream/events')
+    async def stream_events(request):
+        session, error = find_stream_session(request.arg('session'))
+        if error is not None:
+            return error
+
+        async def events():
+            async for data in session_events(session, request.arg('after', 0, int), request.arg('partial_after', None, int)):
+                data["success"] = True
+                yield data
+        return StreamingResponse(events())
+
+    @app.route('/stream/stop', methods=('POST',))
+    async def stream_stop(request):
+        return api_stream_stop()
+
+    @app.route('/history')
+    async def history(request):
+        return await app.run_blocking(api_history, request.arg)
+
+    @app.route('/history/latency')
+    async def history_latency(request):
+        return await app.run_blocking(api_history_latency, request.arg)
+
+    @app.route('/shutdown', methods=('POST',))
+    async def shutdown(request):
+        return api_shutdown(request.remote_addr)
+
+    return app
+
+def create_application(interface, options):
+    """建立應用程式，回傳 (應用程式, 介面)；asgi 需要 uvicorn，未安裝時改用 WSGI 版本"""
+    if interface == 'asgi':
+        from speech_serving import asgi_available
+        if asgi_available():
+            return create_asgi_app(options['threads']), 'asgi'
+        logging.warning("未安裝 uvicorn，改用 WSGI 版本的語音辨識 API")
+    return create_app(), 'wsgi'
+
+def make_server(app, interface, sock, options):
+    """以選定的伺服器提供應用程式，回傳 (伺服器, 伺服器種類)"""
+    from speech_serving import make_wsgi_server, make_asgi_server
+    if interface == 'asgi':
+        return make_asgi_server(app, sock, options)
+    return make_wsgi_server(app, sock, options)
+
+# 服務鎖：持有者才是正在服務的實例；熱備援實例阻塞等待此鎖以接手
+SERVE_LOCK = Path(__file__).resolve().parent / 'serve.lock'
+# 熱備援鎖：確保同時最多只有一個熱備援實例
+STANDBY_LOCK = Path(__file__).resolve().parent / 'standby.lock'
+# 熱備援就緒檔，內容為熱備援實例的 PID
+STANDBY_READY = Path(__file__).resolve().parent / 'standby.ready'
+
+def acquire_lock(lock_path, blocking=False):
+    """取得檔案鎖並回傳檔案物件 (進程結束時由作業系統自動釋放)，失敗回傳 None"""
+    import time
+    lock_file = open(lock_path, 'a+')
+    while True:
+        try:
+            if platform.system() == 'Windows':
+                import msvcrt
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+                flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+                fcntl.flock(lock_file.fileno(), flags)
+            return lock_file
+        except OSError:
+            if not blocking:
+                lock_file.close()
+                return None
+            # msvcrt 沒有無限期阻塞模式，以短間隔重試
+            time.sleep(0.005)
+
+def release_lock(lock_file):
+    try:
+        if platform.system() == 'Windows':
+            import msvcrt
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
         else:
-            break
-    
-    if retry >= 3:
-        logging.error(f"無法找到可用端口，請確認 5000-5002 端口是否被占用")
-        print("錯誤: 無法找到可用端口，請確認 5000-5002 端口是否被占用")
+            import fcntl
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+    except OSError:
+        pass
+    lock_file.close()
+
+def server_arguments(options):
+    """把伺服器選項轉回命令列參數，讓熱備援實例使用相同的設定"""
+    arguments = []
+    for key, value in options.items():
+        if value is not None:
+            arguments += ['--' + key.replace('_', '-'), str(value)]
+    return arguments
+
+def spawn_standby(port, options=None):
+    """在背景啟動熱備援實例"""
+    import subprocess
+    kwargs = {{}}
+    if platform.system() == 'Windows':
+        kwargs['creationflags'] = getattr(subprocess, 'CREATE_NO_WINDOW', 0)
+    else:
+        kwargs['start_new_session'] = True
+    try:
+        subprocess.Popen(
+            [sys.executable, '-m', Path(__file__).stem, '--standby', '--port', str(port)] + server_arguments(options or {{}}),
+            cwd=str(Path(__file__).resolve().parent),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            **kwargs
+        )
+        logging.info("已啟動熱備援實例")
+    except Exception as e:
+        logging.error(f"啟動熱備援實例失敗: {{e}}")
+
+def run_standby(port, options):
+    """熱備援模式：預先載入所有模組，等到服務鎖釋放 (主實例結束) 後立即接手"""
+    import time
+    standby_lock = acquire_lock(STANDBY_LOCK)
+    if standby_lock is None:
+        logging.info("已有熱備援實例，不再重複啟動")
+        sys.exit(0)
+
+    if find_missing_modules():
+        logging.error("熱備援實例缺少必要模組")
         sys.exit(1)
-        
-    print(f"啟動語音辨識 API 服務在 http://127.0.0.1:{{port}}")
-    logging.info(f"啟動語音辨識 API 服務在 http://127.0.0.1:{{port}}")
-    app.run(host='127.0.0.1', port=port, debug=False)
-''')
+    app, interface = create_application(options['interface'], options)
+    from speech_serving import preload
+    preload(options['server'], interface)
+    warm_up()
+    with open(STANDBY_READY, 'w', encoding='utf-8') as f:
+        f.write(str(os.getpid()))
+    logging.info("熱備援實例就緒，等待接手")
+
+    serve_lock = acquire_lock(SERVE_LOCK, blocking=True)
+    started = time.perf_counter()
+    try:
+        STANDBY_READY.unlink()
+    except OSError:
+        pass
+    release_lock(standby_lock)
+
+    if not script_is_current():
+        # 擴充套件已更新腳本，讓新版服務取得服務鎖
+        logging.info("API 腳本已更新，熱備援實例不接手")
+        release_lock(serve_lock)
+        sys.exit(0)
+
+    from speech_serving import bind_socket
+    sock, bound_port = bind_socket(port, retries=1, backlog=options['backlog'], host=options['host'])
+    if sock is None:
+        logging.error(f"熱備援實例無法綁定端口 {{port}}")
+        sys.exit(1)
+    server, _ = make_server(app, interface, sock, options)
+    _server_ref["server"] = server
+    _server_ref["interface"] = interface
+    logging.info(f"熱備援實例已接手服務，耗時 {{(time.perf_counter() - started) * 1000:.1f}} ms")
+    spawn_standby(port, options)
+    server.serve_forever()
+    server.server_close()
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='語音辨識 API 服務')
+    parser.add_argument('--port', type=int, default=5000, help='起始監聽端口，被占用時依序嘗試後兩個端口')
+    parser.add_argument('--strict-port', action='store_true',
+                        help='只使用 --port 指定的端口，被占用時結束而不改用其他端口 (由監管程式啟動時使用)')
+    parser.add_argument('--host', default='127.0.0.1',
+                        help='監聽的介面；區域網路共用服務可用 0.0.0.0 或本機的區域網路位址 (需先在 clients.json 設定用戶端權杖)')
+    parser.add_argument('--warm-standby', action='store_true', help='服務啟動後保留一個預先載入的熱備援實例')
+    parser.add_argument('--standby', action='store_true', help='以熱備援實例身分執行 (由服務自行啟動)')
+    parser.add_argument('--interface', choices=['wsgi', 'asgi'], default=INTERFACE, help='應用程式介面 (端點與回應相同)')
+    parser.add_argument('--server', choices=['auto', 'waitress', 'werkzeug'], default='auto',
+                        help='WSGI 伺服器：auto 在已安裝 waitress 時使用 waitress，werkzeug 僅供開發 (asgi 一律使用 uvicorn)')
+    parser.add_argument('--threads', type=int, default=8, help='工作執行緒數 (waitress；asgi 為阻塞工作的執行緒數)')
+    parser.add_argument('--backlog', type=int, default=128, help='尚未接受的連線佇列長度')
+    parser.add_argument('--keep-alive', type=int, default=30, help='keep-alive 連線的閒置逾時秒數 (waitress)')
+    parser.add_argument('--connection-limit', type=int, default=100, help='同時開啟的連線數上限 (waitress)')
+    args = parser.parse_args()
+    server_options = {{
+        "host": args.host,
+        "interface": args.interface,
+        "server": args.server,
+        "threads": args.threads,
+        "backlog": args.backlog,
+        "keep_alive": args.keep_alive,
+        "connection_limit": args.connection_limit
+    }}
+
+    if args.standby:
+        run_standby(args.port, server_options)
+        sys.exit(0)
+
+    if not is_loopback(args.host) and not get_clients().enabled():
+        # 綁定區域網路介面時，上傳音訊一律需要權杖
+        logging.error(f"綁定 {{args.host}} 前必須先在 {{CLIENTS_FILE}} 設定用戶端權杖")
+        print(f"錯誤: 綁定 {{args.host}} 前必須先在 {{CLIENTS_FILE}} 設定用戶端權杖")
+        sys.exit(1)
+
+    serve_lock = acquire_lock(SERVE_LOCK)
+    if serve_lock is None:
+        logging.info("已有語音辨識 API 服務在運行")
+        print("已有語音辨識 API 服務在運行")
+        sys.exit(0)
+
+    from speech_serving import bind_socket
+    retries = 1 if args.strict_port else 3
+    sock, port = bind_socket(args.port, retries=retries, backlog=args.backlog, host=args.host)
+    if sock is None:
+        ports = f"{{args.port}}-{{args.port + retries - 1}}" if retries > 1 else f"{{args.port}}"
+        logging.error(f"無法找到可用端口，請確認 {{ports}} 端口是否被占用")
+        print(f"錯誤: 無法找到可用端口，請確認 {{ports}} 端口是否被占用")
+        sys.exit(1)
+
+    missing_modules = find_missing_modules()
+    if missing_modules:
+        error_msg = f"缺少必要模組: {{', '.join(missing_modules)}}，請安裝所需模組。"
+        logging.error(error_msg)
+        print(error_msg)
+        sys.exit(1)
+
+    try:
+        app, interface = create_application(args.interface, server_options)
+        server, server_kind = make_server(app, interface, sock, server_options)
+    except Exception as e:
+        logging.error(f"初始化 Flask 或 SpeechRecognition 發生錯誤: {{e}}")
+        print(f"初始化錯誤: {{e}}")
+        sys.exit(1)
+
+    import threading
+    threading.Thread(target=warm_up, name='warm-up', daemon=True).start()
+    if args.warm_standby:
+        # 熱備援以主實例實際使用的端口接手
+        spawn_standby(port, server_options)
+
+    _server_ref["server"] = server
+    _server_ref["interface"] = interface
+    print(f"啟動語音辨識 API 服務在 http://{{args.host}}:{{port}} ({{server_kind}})")
+    logging.info(f"啟動語音辨識 API 服務在 http://{{args.host}}:{{port}}")
+    server.serve_forever()
+    server.server_close()
+'''
 
-    # 設置API腳本的執行權限 (Linux/Mac)
+    # 模板雜湊涵蓋 API 腳本、啟動腳本與輔助模組，三者都只由模板與選項決定
+    companion_modules = read_companion_modules()
+    digest = hashlib.sha256()
+    digest.update(script.encode('utf-8'))
+    digest.update(start_script_content.encode('utf-8'))
+    for name, content in sorted(companion_modules.items()):
+        digest.update(name.encode('utf-8'))
+        digest.update(content.encode('utf-8'))
+    template_hash = digest.hexdigest()[:16]
+    script = script.replace("TEMPLATE_HASH = '__TEMPLATE_HASH__'", f"TEMPLATE_HASH = '{template_hash}'", 1)
+
+    manifest_ready = not venv_python or (flask_dir / 'sys_path.json').exists()
+    companions_ready = all((flask_dir / name).exists() for name in companion_modules)
+    if read_script_hash(api_file) == template_hash and start_script.exists() and manifest_ready and companions_ready:
+        logging.debug(f"API 腳本已是最新版本 ({template_hash})")
+        return template_hash
+
+    logging.debug(f"產生 API 腳本 ({template_hash})")
+    with open(start_script, 'w', encoding='utf-8') as f:
+        f.write(start_script_content)
+    for name, content in companion_modules.items():
+        with open(flask_dir / name, 'w', encoding='utf-8') as f:
+            f.write(content)
+    with open(api_file, 'w', encoding='utf-8') as f:
+        f.write(script)
+
+    # 設置API腳本與啟動腳本的執行權限 (Linux/Mac)
     if not is_windows:
+        for path in (start_script, api_file):
+            try:
+                os.chmod(path, 0o755)
+            except:
+                logging.warning(f"無法設置 {path} 的執行權限")
+
+    # 預先解析虛擬環境中的模組路徑，API 腳本啟動時直接使用
+    if venv_python:
+        write_path_manifest(flask_dir, venv_python)
+
+    # 預先編譯成虛擬環境 Python 的位元組碼
+    precompile_api_script(flask_dir, venv_python)
+    return template_hash
+
+# 使用者建立此標記檔即啟用熱備援模式
+WARM_STANDBY_MARKER = Path.home() / '.libreoffice' / 'speech_api' / 'warm_standby.enabled'
+
+def is_warm_standby_enabled():
+    """檢查是否啟用熱備援模式 (主實例結束時由預先載入的備援實例立即接手)"""
+    return WARM_STANDBY_MARKER.exists()
+
+# 使用者建立此標記檔即改用 ASGI 版本的服務 (需安裝 uvicorn)
+ASGI_MARKER = Path.home() / '.libreoffice' / 'speech_api' / 'asgi.enabled'
+
+def is_asgi_enabled():
+    """檢查是否使用 ASGI 版本的語音辨識 API"""
+    return ASGI_MARKER.exists()
+
+def wait_for_api(timeout, port=5000):
+    """在 timeout 秒內輪詢 API 根路徑，收到 HTTP 200 即回傳 True"""
+    import time
+    import http.client
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
         try:
-            os.chmod(api_file, 0o755)
-        except:
-            logging.warning(f"無法設置 {api_file} 的執行權限")
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=max(deadline - time.monotonic(), 0.05))
+            conn.request("GET", "/")
+            status = conn.getresponse().status
+            conn.close()
+            if status == 200:
+                return True
+        except (OSError, http.client.HTTPException):
+            pass
+        time.sleep(0.02)
+    return False
+
+def get_python_candidates(venv_python=None):
+    """依優先順序列出可用來啟動 API 服務的 Python：虛擬環境、目前的 Python、python3 命令"""
+    candidates = []
+    if venv_python is not None and Path(venv_python).exists():
+        candidates.append(str(venv_python))
+    candidates.append(sys.executable)
+    if platform.system() != "Windows":
+        candidates.append("python3")
+    return candidates
+
+def fetch_api_status(port=5000, timeout=1.0):
+    """取得 API 根路徑回傳的狀態 JSON，無法連線時回傳 None"""
+    import http.client
+    try:
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+        conn.request("GET", "/")
+        resp = conn.getresponse()
+        body = resp.read()
+        conn.close()
+        if resp.status == 200:
+            return json.loads(body.decode('utf-8'))
+    except (OSError, ValueError, http.client.HTTPException):
+        pass
+    return None
+
+def api_request(method, path, payload=None, port=5000, timeout=10.0):
+    """呼叫 API 端點並回傳 JSON 結果，無法連線或回應不是 JSON 時回傳 None"""
+    import http.client
+    try:
+        body = json.dumps(payload).encode('utf-8') if payload is not None else None
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+        conn.request(method, path, body=body, headers=headers)
+        resp = conn.getresponse()
+        data = resp.read()
+        conn.close()
+        return json.loads(data.decode('utf-8'))
+    except (OSError, ValueError, http.client.HTTPException) as e:
+        logging.debug(f"API 請求失敗 {method} {path}: {e}")
+        return None
+
+def request_api_shutdown(port=5000, timeout=5.0):
+    """要求 API 服務優雅關閉，舊版服務沒有此端點時回傳 False"""
+    import http.client
+    try:
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+        conn.request("POST", "/shutdown")
+        status = conn.getresponse().status
+        conn.close()
+        return status == 200
+    except (OSError, http.client.HTTPException):
+        return False
 
 def start_api_server():
-    """直接在Python中啟動語音辨識API服務"""
+    """透過監管程式啟動語音辨識API服務 (每位使用者只保留一個服務實例)"""
     try:
-        from pathlib import Path
-        import subprocess
-        import os
-        import platform
-        
-        # 檢測作業系統
-        system = platform.system()
-        is_windows = system == "Windows"
-        is_macos = system == "Darwin"
-        is_linux = system == "Linux"
-        
         home_path = Path.home()
         flask_dir = home_path / '.libreoffice' / 'speech_api'
         api_script = flask_dir / 'speech_api.py'
         
-        # 根據不同作業系統尋找虛擬環境中的 Python 路徑
-        if is_windows:
-            venv_python = home_path / '.libreoffice' / 'python_env' / 'venv' / 'Scripts' / 'python.exe'
-        else:  # Linux/Mac
-            venv_python = home_path / '.libreoffice' / 'python_env' / 'venv' / 'bin' / 'python'
-        
-        # 決定用哪個 Python 啟動 API 服務
-        python_executable = str(venv_python) if venv_python.exists() else sys.executable
-        logging.debug(f"使用 Python 執行檔: {python_executable}")
+        # 尋找虛擬環境中的 Python
+        venv_python = get_venv_python()
         
-        # 首先檢查必要目錄和文件是否存在
+        # 首先檢查必要目錄是否存在
         if not flask_dir.exists():
             logging.debug(f"創建 API 目錄 {flask_dir}")
             flask_dir.mkdir(parents=True, exist_ok=True)
         
-        if not api_script.exists():
-            logging.debug("API 腳本不存在，創建新的腳本")
-            # 如果虛擬環境存在，傳遞給 create_api_script
-            if venv_python.exists():
-                create_api_script(flask_dir, venv_python)
-            else:
-                create_api_script(flask_dir)
+        # 模板或選項有變更時才會重新產生 (例如擴充套件更新後留下的舊腳本)
+        template_hash = create_api_script(flask_dir, venv_python)
         
         logging.debug(f"啟動 API 腳本：{api_script}")
         
@@ -367,68 +1774,10 @@ def start_api_server():
             logging.error(f"API 腳本不存在：{api_script}")
             return False
         
-        # 確保權限正確 (僅 Linux/Mac)
-        if not is_windows:
-            try:
-                os.chmod(api_script, 0o755)
-            except:
-                logging.warning(f"無法設置 {api_script} 的執行權限，但仍會嘗試執行")
-        
-        # 使用選定的 Python 啟動 API 服務
-        process = subprocess.Popen(
-            [python_executable, str(api_script)],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            shell=False,  # 避免shell=True的路徑問題
-            text=True     # 讓stdout/stderr為文本模式
-        )
-        
-        # 等待一小段時間確認進程啟動正常
-        import time
-        time.sleep(1)
-        
-        # 檢查進程是否立即退出
-        if process.poll() is not None:
-            # 進程已退出，可能有錯誤
-            stdout, stderr = process.communicate()
-            logging.error(f"API進程立即退出，返回碼：{process.returncode}")
-            logging.error(f"標準輸出：{stdout}")
-            logging.error(f"錯誤輸出：{stderr}")
-            
-            # 如果使用虛擬環境失敗，嘗試使用系統 Python
-            if python_executable == str(venv_python):
-                logging.debug("虛擬環境 Python 啟動失敗，嘗試使用系統 Python")
-                return start_api_server_with_system_python(api_script)
-            return False
-        
-        # 給API一些啟動時間
-        time.sleep(3)
-        
-        # 嘗試連接API確認是否啟動
-        import socket
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        result = sock.connect_ex(('127.0.0.1', 5000))
-        sock.close()
-        
-        if result == 0:  # 端口可連接
-            logging.info("API 服務啟動成功")
-            return True
-        else:
-            # 嘗試備用端口
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            result = sock.connect_ex(('127.0.0.1', 5001))
-            sock.close()
-            
-            if result == 0:  # 備用端口可連接
-                logging.info("API 服務在備用端口 5001 啟動成功")
-                return True
-            else:
-                logging.error("無法連接到 API 服務")
-                # 如果使用虛擬環境失敗，嘗試使用系統 Python
-                if python_executable == str(venv_python):
-                    logging.debug("虛擬環境 Python 啟動失敗，嘗試使用系統 Python")
-                    return start_api_server_with_system_python(api_script)
-                return False
+        # 由監管程式保留進程、讀取輸出、健康檢查並在異常時重新啟動；
+        # 運行中的服務版本與腳本不符時會先優雅關閉舊版服務
+        from api_supervisor import get_supervisor
+        return get_supervisor().start(api_script, get_python_candidates(venv_python), template_hash)
                 
     except Exception as e:
         logging.error(f"啟動API服務失敗: {e}")
@@ -437,78 +1786,9 @@ def start_api_server():
 def start_api_server_with_system_python(api_script):
     """使用系統 Python 啟動 API 服務 (備用方案)"""
     try:
-        import subprocess
-        import time
-        import platform
-        
-        system = platform.system()
-        is_windows = system == "Windows"
-        
         logging.debug(f"使用系統 Python 啟動 API: {sys.executable}")
-        
-        # 使用系統 Python 啟動 API
-        process = subprocess.Popen(
-            [sys.executable, str(api_script)],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            shell=False,
-            text=True
-        )
-        
-        # 等待確認進程啟動
-        time.sleep(1)
-        if process.poll() is not None:
-            stdout, stderr = process.communicate()
-            logging.error(f"系統 Python API進程立即退出，返回碼：{process.returncode}")
-            logging.error(f"標準輸出：{stdout}")
-            logging.error(f"錯誤輸出：{stderr}")
-            
-            # 在 Linux/Mac 上，嘗試使用 python3 命令
-            if not is_windows:
-                try:
-                    logging.debug("嘗試使用 python3 命令啟動 API")
-                    alt_process = subprocess.Popen(
-                        ["python3", str(api_script)],
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.PIPE,
-                        shell=False,
-                        text=True
-                    )
-                    time.sleep(1)
-                    if alt_process.poll() is None:
-                        # 給API一些啟動時間
-                        time.sleep(3)
-                        
-                        # 嘗試連接API確認是否啟動
-                        import socket
-                        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                        result = sock.connect_ex(('127.0.0.1', 5000))
-                        sock.close()
-                        
-                        if result == 0 or sock.connect_ex(('127.0.0.1', 5001)) == 0:
-                            logging.info("使用 python3 命令啟動 API 服務成功")
-                            return True
-                except:
-                    logging.error("使用 python3 命令啟動 API 失敗")
-            
-            return False
-        
-        # 給API一些啟動時間
-        time.sleep(3)
-        
-        # 嘗試連接API確認是否啟動
-        import socket
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        result = sock.connect_ex(('127.0.0.1', 5000))
-        sock.close()
-        
-        if result == 0 or sock.connect_ex(('127.0.0.1', 5001)) == 0:
-            logging.info("使用系統 Python 啟動 API 服務成功")
-            return True
-        else:
-            logging.error("使用系統 Python 啟動 API 服務失敗")
-            return False
-            
+        from api_supervisor import get_supervisor
+        return get_supervisor().start(api_script, get_python_candidates(), read_script_hash(api_script))
     except Exception as e:
         logging.error(f"使用系統 Python 啟動 API 服務失敗: {e}")
-        return False
\ No newline at end of file
+        return False
@@ -0,0 +1,278 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import time
+import logging
+import platform
+import threading
+import subprocess
+from pathlib import Path
+from logging.handlers import RotatingFileHandler
+
+from utils import acquire_file_lock, release_file_lock
+from api_service import wait_for_api, fetch_api_status, request_api_shutdown, is_warm_standby_enabled
+
+# 監管程式鎖：同一位使用者只會有一個 LibreOffice 進程負責啟動與重啟 API 服務
+SUPERVISOR_LOCK = Path.home() / '.libreoffice' / 'speech_api' / 'supervisor.lock'
+
+# API 服務輸出的輪替日誌
+OUTPUT_LOG = Path.home() / '.libreoffice' / 'speech_to_text_logs' / 'speech_api_output.log'
+
+
+def create_output_logger():
+    """建立專門記錄 API 服務標準輸出/錯誤輸出的輪替日誌"""
+    logger = logging.getLogger('speech_api.output')
+    if not logger.handlers:
+        OUTPUT_LOG.parent.mkdir(parents=True, exist_ok=True)
+        handler = RotatingFileHandler(OUTPUT_LOG, maxBytes=1024 * 1024, backupCount=3, encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.DEBUG)
+        # 不寫入擴充套件的主日誌
+        logger.propagate = False
+    return logger
+
+
+class ApiSupervisor:
+    """監管語音辨識 API 服務進程
+
+    保留 Popen 物件並持續讀取輸出管線 (避免管線緩衝區滿時服務阻塞)，
+    定期健康檢查，服務異常時以指數退避重新啟動。
+    """
+
+    def __init__(self, port=5000, check_interval=5.0, startup_timeout=15.0,
+                 backoff_base=1.0, backoff_max=60.0, stable_after=60.0, failure_threshold=3):
+        self.port = port
+        self.check_interval = check_interval
+        self.startup_timeout = startup_timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.stable_after = stable_after
+        self.failure_threshold = failure_threshold
+
+        self.lock = threading.RLock()
+        self.stop_event = threading.Event()
+        self.output_logger = create_output_logger()
+        self.lock_file = None
+        self.process = None
+        self.api_script = None
+        self.candidates = []
+        self.expected_hash = None
+        self.started_at = None
+        self.health_failures = 0
+        self.restart_failures = 0
+        self.next_restart_at = None
+        self.health_thread = None
+
+    def start(self, api_script, candidates, expected_hash=None):
+        """確保 API 服務正在運行，成功時回傳 True
+
+        expected_hash 為腳本的模板雜湊，運行中的服務回報不同雜湊時視為舊版並替換。
+        """
+        with self.lock:
+            self.api_script = Path(api_script)
+            self.candidates = [str(c) for c in candidates]
+            self.expected_hash = expected_hash
+
+            if self.lock_file is None:
+                SUPERVISOR_LOCK.parent.mkdir(parents=True, exist_ok=True)
+                self.lock_file = acquire_file_lock(SUPERVISOR_LOCK)
+            if self.lock_file is None:
+                # 其他 LibreOffice 進程已在監管服務，只等待服務可用
+                logging.info("API 服務由其他進程監管")
+                return wait_for_api(self.startup_timeout, self.port)
+
+            ok = self._ensure_running()
+            if self.health_thread is None:
+                self.health_thread = threading.Thread(target=self._health_loop, name='api-supervisor', daemon=True)
+                self.health_thread.start()
+            return ok
+
+    def stop(self):
+        """停止健康檢查、結束由本監管程式啟動的服務，並釋放監管程式鎖讓其他進程接手"""
+        self.stop_event.set()
+        with self.lock:
+            self._terminate()
+            if self.lock_file is not None:
+                release_file_lock(self.lock_file)
+                self.lock_file = None
+
+    def _ensure_running(self):
+        status = fetch_api_status(self.port, 0.3)
+        if status is not None:
+            if self.expected_hash and status.get('template_hash') != self.expected_hash:
+                logging.info(f"運行中的 API 服務版本 ({status.get('template_hash')}) 與腳本 ({self.expected_hash}) 不符，替換舊版服務")
+                self._replace_stale()
+            else:
+                if self.process is not None and self.process.poll() is not None:
+                    # 服務已由熱備援實例或其他進程接手
+                    self.process = None
+                return True
+        self._terminate()
+        return self._spawn()
+
+    def _replace_stale(self, timeout=35.0):
+        """要求舊版服務優雅關閉 (等待進行中的辨識完成)，必要時直接結束本程式啟動的進程"""
+        if request_api_shutdown(self.port):
+            deadline = time.monotonic() + timeout
+            while time.monotonic() < deadline and fetch_api_status(self.port, 0.5) is not None:
+                time.sleep(0.1)
+        else:
+            logging.warning("舊版 API 服務不支援優雅關閉")
+        if fetch_api_status(self.port, 0.5) is not None and self.process is not None:
+            self._terminate()
+
+    def _spawn(self):
+        """依序嘗試候選 Python，只保留成功啟動的那一個進程"""
+        extra_args = ['--warm-standby'] if is_warm_standby_enabled() else []
+        env = dict(os.environ)
+        env['PYTHONIOENCODING'] = 'utf-8'
+        kwargs = {}
+        if platform.system() == "Windows":
+            kwargs['creationflags'] = getattr(subprocess, 'CREATE_NO_WINDOW', 0)
+
+        for python_executable in self.candidates:
+            logging.debug(f"使用 Python 執行檔啟動 API 服務: {python_executable}")
+            try:
+                process = subprocess.Popen(
+                    # 以 -m 執行才會使用預先編譯的位元組碼；
+                    # 健康檢查只探測 self.port，服務不可改用其他端口，否則健康的服務會被誤判為當機而不斷重啟
+                    [python_executable, '-u', '-m', self.api_script.stem, '--port', str(self.port), '--strict-port']
+                    + extra_args,
+                    stdin=subprocess.DEVNULL,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    cwd=str(self.api_script.parent),
+                    env=env,
+                    shell=False,
+                    text=True,
+                    encoding='utf-8',
+                    errors='replace',
+                    **kwargs
+                )
+            except OSError as e:
+                logging.error(f"無法執行 {python_executable}: {e}")
+                continue
+
+            self._drain(process.stdout, logging.INFO)
+            self._drain(process.stderr, logging.WARNING)
+
+            if self._wait_until_ready(process):
+                self.process = process if process.poll() is None else None
+                self.started_at = time.monotonic()
+                self.health_failures = 0
+                logging.info(f"API 服務啟動成功 (PID {process.pid})")
+                return True
+
+            if process.poll() is None:
+                self._kill(process)
+            logging.error(f"API 進程啟動失敗，返回碼：{process.returncode}，詳見 {OUTPUT_LOG}")
+        return False
+
+    def _wait_until_ready(self, process):
+        deadline = time.monotonic() + self.startup_timeout
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                # 返回碼 0 表示已有其他服務實例持有服務鎖
+                return process.returncode == 0 and wait_for_api(1.0, self.port)
+            if wait_for_api(0.2, self.port):
+                return True
+        return False
+
+    def _drain(self, stream, level):
+        """在背景執行緒逐行讀取輸出並寫入輪替日誌"""
+        def reader():
+            try:
+                for line in iter(stream.readline, ''):
+                    self.output_logger.log(level, line.rstrip())
+            except (OSError, ValueError):
+                pass
+            finally:
+                stream.close()
+        threading.Thread(target=reader, name='api-output', daemon=True).start()
+
+    def _health_loop(self):
+        while True:
+            with self.lock:
+                if self.next_restart_at is not None:
+                    wait = max(min(self.check_interval, self.next_restart_at - time.monotonic()), 0.05)
+                else:
+                    wait = self.check_interval
+            if self.stop_event.wait(wait):
+                return
+            try:
+                with self.lock:
+                    self._check_once()
+            except Exception as e:
+                logging.error(f"API 服務健康檢查發生錯誤: {e}")
+
+    def _check_once(self):
+        now = time.monotonic()
+        if self.next_restart_at is not None:
+            if now < self.next_restart_at:
+                return
+            self.next_restart_at = None
+            logging.info(f"重新啟動 API 服務 (第 {self.restart_failures} 次)")
+            self._ensure_running()
+            return
+
+        if wait_for_api(1.0, self.port):
+            self.health_failures = 0
+            if self.process is not None and self.process.poll() is not None:
+                self.process = None
+            if self.started_at is not None and now - self.started_at >= self.stable_after:
+                self.restart_failures = 0
+            return
+
+        if self.process is not None and self.process.poll() is None:
+            # 進程仍在但沒有回應，連續失敗多次才視為當機
+            self.health_failures += 1
+            if self.health_failures < self.failure_threshold:
+                return
+            logging.warning("API 服務沒有回應，結束進程")
+        elif self.process is not None:
+            logging.warning(f"API 服務已結束，返回碼：{self.process.returncode}")
+        else:
+            logging.warning("無法連接到 API 服務")
+
+        self._terminate()
+        delay = min(self.backoff_base * (2 ** self.restart_failures), self.backoff_max)
+        self.restart_failures += 1
+        self.next_restart_at = now + delay
+        logging.info(f"{delay:.0f} 秒後重新啟動 API 服務")
+
+    def _terminate(self):
+        if self.process is not None and self.process.poll() is None:
+            self._kill(self.process)
+        self.process = None
+
+    @staticmethod
+    def _kill(process):
+        process.terminate()
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+_supervisor = None
+_supervisor_lock = threading.Lock()
+
+
+def get_supervisor():
+    """取得本進程唯一的 ApiSupervisor"""
+    global _supervisor
+    with _supervisor_lock:
+        if _supervisor is None:
+            _supervisor = ApiSupervisor()
+        return _supervisor
+
+
+def stop_supervisor():
+    """停止本進程的 ApiSupervisor (LibreOffice 結束時呼叫)，之後 get_supervisor 會建立新的"""
+    global _supervisor
+    with _supervisor_lock:
+        supervisor, _supervisor = _supervisor, None
+    if supervisor is not None:
+        supervisor.stop()
@@ -0,0 +1,1669 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""語音辨識擴充套件冷啟動效能量測工具
+
+在沒有 LibreOffice 的環境下（使用替身 UNO 模組）量測以下階段：
+模組匯入、Job 建構、環境檢查、API 腳本產生、行程啟動、伺服器匯入，
+以及第一個 `/` 回應所需時間，並輸出固定格式的報告以便追蹤效能退化。
+
+用法：
+    python benchmark.py                      # 文字報告
+    python benchmark.py --format json -o bench_output.txt
+    python benchmark.py --repeat 5 --skip-server
+    python benchmark.py --failover           # 另外量測熱備援接手時間
+    python benchmark.py --skip-server --scenario provisional   # 附加情境量測
+"""
+import sys
+import os
+import json
+import time
+import types
+import socket
+import signal
+import argparse
+import platform
+import tempfile
+import subprocess
+import statistics
+import threading
+import http.client
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent
+
+# 報告格式版本，報告欄位變動時遞增
+REPORT_SCHEMA = 2
+
+# 依序輸出的階段名稱，確保報告順序固定
+PHASES = [
+    "import_main",
+    "job_construction",
+    "environment_check",
+    "script_generation",
+    "server_import",
+    "process_spawn",
+    "port_open",
+    "first_response",
+    "failover",
+]
+
+# 需要啟動伺服器的階段
+SERVER_PHASES = ["server_import", "process_spawn", "port_open", "first_response", "failover"]
+
+# 匯入時間明細中要列出的專案模組
+PROJECT_MODULES = ["main", "utils", "module_installer", "api_service", "document_inserter", "continuous_dictation",
+                   "remote_recognition"]
+
+# 伺服器端需要的重量級模組
+SERVER_MODULES = ["flask", "speech_recognition", "pyaudio"]
+
+# 逐一匯入伺服器模組，缺少的模組不影響其他模組的量測
+SERVER_IMPORT_CODE = """
+import json
+failed = []
+for name in %r:
+    try:
+        __import__(name)
+    except ImportError:
+        failed.append(name)
+print(json.dumps(failed))
+"""
+
+# com.sun.star 常數（與 UNO 實際數值相同）
+MESSAGE_BOX_TYPES = {"MESSAGEBOX": 0, "INFOBOX": 1, "WARNINGBOX": 2, "ERRORBOX": 3, "QUERYBOX": 4}
+MESSAGE_BOX_BUTTONS = {
+    "BUTTONS_OK": 1, "BUTTONS_OK_CANCEL": 2, "BUTTONS_YES_NO": 3,
+    "BUTTONS_YES_NO_CANCEL": 4, "BUTTONS_RETRY_CANCEL": 5, "BUTTONS_ABORT_IGNORE_RETRY": 6,
+}
+MESSAGE_BOX_RESULTS = {"CANCEL": 0, "OK": 1, "YES": 2, "NO": 3}
+CONTROL_CHARACTERS = {"PARAGRAPH_BREAK": 0, "LINE_BREAK": 1}
+
+
+class StubMessageBox:
+    def __init__(self, ctx, msg_type, buttons, title, message):
+        self.ctx = ctx
+        ctx.messages.append({"type": msg_type, "title": title, "message": message})
+
+    def execute(self):
+        return self.ctx.message_result
+
+
+class StubToolkit:
+    def __init__(self, ctx):
+        self.ctx = ctx
+
+    def getDesktopWindow(self):
+        return None
+
+    def createMessageBox(self, parent, msg_type, buttons, title, message):
+        return StubMessageBox(self.ctx, msg_type, buttons, title, message)
+
+
+class StubDesktop:
+    def __init__(self, ctx):
+        self.ctx = ctx
+
+    def getCurrentComponent(self):
+        return self.ctx.current_component
+
+    def addTerminateListener(self, listener):
+        self.ctx.terminate_listeners.append(listener)
+
+
+class StubAsyncCallback:
+    """替身 AsyncCallback：回呼排入佇列，由 run_pending 在呼叫端 (視為主執行緒) 依序執行"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = []
+
+    def addCallback(self, callback, data):
+        with self.lock:
+            self.pending.append((callback, data))
+
+    def run_pending(self):
+        while True:
+            with self.lock:
+                if not self.pending:
+                    return
+                callback, data = self.pending.pop(0)
+            callback.notify(data)
+
+
+class StubServiceManager:
+    def __init__(self, ctx):
+        self.ctx = ctx
+
+    def createInstanceWithContext(self, name, ctx):
+        if name == "com.sun.star.frame.Desktop":
+            return StubDesktop(self.ctx)
+        if name == "com.sun.star.awt.Toolkit":
+            return StubToolkit(self.ctx)
+        if name == "com.sun.star.awt.AsyncCallback":
+            return self.ctx.async_callback
+        raise RuntimeError(f"替身 UNO 不支援服務: {name}")
+
+
+class StubContext:
+    """替身 UNO 元件上下文，記錄所有對話框並回傳固定的按鈕結果"""
+    def __init__(self, message_result=MESSAGE_BOX_RESULTS["NO"]):
+        self.message_result = message_result
+        self.messages = []
+        self.current_component = None
+        self.terminate_listeners = []
+        self.async_callback = StubAsyncCallback()
+        self.service_manager = StubServiceManager(self)
+
+    def getServiceManager(self):
+        return self.service_manager
+
+
+class StubTextCursor:
+    """替身文字游標：以 (anchor, position) 表示選取範圍"""
+    def __init__(self, document, anchor, position=None):
+        self.document = document
+        self.anchor = anchor
+        self.position = anchor if position is None else position
+        document.cursors.append(self)
+
+    @property
+    def span(self):
+        return min(self.anchor, self.position), max(self.anchor, self.position)
+
+    def getText(self):
+        return self.document.text
+
+    def getStart(self):
+        return StubTextCursor(self.document, self.span[0])
+
+    def getEnd(self):
+        return StubTextCursor(self.document, self.span[1])
+
+    def collapseToEnd(self):
+        self.anchor = self.position = self.span[1]
+
+    def collapseToStart(self):
+        self.anchor = self.position = self.span[0]
+
+    def goLeft(self, count, expand):
+        self.position = max(0, self.position - count)
+        if not expand:
+            self.anchor = self.position
+        return True
+
+    def goRight(self, count, expand):
+        self.position = min(len(self.document.content), self.position + count)
+        if not expand:
+            self.anchor = self.position
+        return True
+
+    def gotoRange(self, text_range, expand):
+        self.position = text_range.span[1]
+        if not expand:
+            self.anchor = self.position
+
+    def setString(self, string):
+        start, end = self.span
+        self.document.replace(start, end, string)
+        self.anchor, self.position = start, start + len(string)
+
+
+class StubText:
+    def __init__(self, document):
+        self.document = document
+
+    def createTextCursorByRange(self, text_range):
+        start, end = text_range.span
+        return StubTextCursor(self.document, start, end)
+
+    def insertString(self, cursor, string, absorb):
+        start, end = cursor.span
+        if not absorb:
+            start = end
+        self.document.replace(start, end, string)
+        cursor.anchor = cursor.position = start + len(string)
+
+    def insertControlCharacter(self, cursor, character, absorb):
+        self.insertString(cursor, "\n", absorb)
+
+
+class StubUndoManager:
+    def __init__(self):
+        self.locked = 0
+        self.depth = 0
+        self.actions = 0
+
+    def lock(self):
+        self.locked += 1
+
+    def unlock(self):
+        self.locked -= 1
+
+    def enterUndoContext(self, title):
+        if self.depth == 0 and not self.locked:
+            self.actions += 1
+        self.depth += 1
+
+    def leaveUndoContext(self):
+        self.depth -= 1
+
+    def record(self):
+        if self.depth == 0 and not self.locked:
+            self.actions += 1
+
+
+class StubFrame:
+    def createStatusIndicator(self):
+        return types.SimpleNamespace(start=lambda text, steps: None, setText=lambda text: None,
+                                     setValue=lambda value: None, end=lambda: None)
+
+
+class StubController:
+    def __init__(self, document):
+        self.view_cursor = StubTextCursor(document, 0)
+
+    def getViewCursor(self):
+        return self.view_cursor
+
+    def getFrame(self):
+        return StubFrame()
+
+
+class StubTextDocument:
+    """替身 Writer 文件：記錄修改字元數、版面配置次數與復原動作數"""
+    def __init__(self, content=""):
+        self.content = content
+        self.cursors = []
+        self.text = StubText(self)
+        self.Text = self.text
+        self.undo_manager = StubUndoManager()
+        self.controller = StubController(self)
+        self.lock_depth = 0
+        self.dirty = False
+        self.layouts = 0
+
+    def getCurrentController(self):
+        return self.controller
+
+    def getUndoManager(self):
+        return self.undo_manager
+
+    def lockControllers(self):
+        self.lock_depth += 1
+
+    def unlockControllers(self):
+        self.lock_depth -= 1
+        if self.lock_depth == 0 and self.dirty:
+            self.layouts += 1
+            self.dirty = False
+
+    def replace(self, start, end, string):
+        """以 string 取代 content[start:end]，並調整其他游標位置"""
+        self.content = self.content[:start] + string + self.content[end:]
+        delta = len(string) - (end - start)
+        for cursor in self.cursors:
+            cursor.anchor = self._shift(cursor.anchor, start, end, delta)
+            cursor.position = self._shift(cursor.position, start, end, delta)
+        self.undo_manager.record()
+        if self.lock_depth:
+            self.dirty = True
+        else:
+            self.layouts += 1
+
+    @staticmethod
+    def _shift(position, start, end, delta):
+        if position >= end and position > start:
+            return position + delta
+        return min(position, start + max(0, (end - start) + delta)) if position > start else position
+
+
+def install_uno_stubs(message_result=MESSAGE_BOX_RESULTS["NO"]):
+    """在 sys.modules 中註冊替身 uno / unohelper / officehelper / com.sun.star 模組"""
+    def register(name, **attrs):
+        module = types.ModuleType(name)
+        module.__dict__.update(attrs)
+        sys.modules[name] = module
+        return module
+
+    class Base:
+        pass
+
+    class ImplementationHelper:
+        def __init__(self):
+            self.implementations = []
+
+        def addImplementation(self, *args):
+            self.implementations.append(args)
+
+    register("uno")
+    register("unohelper", Base=Base, ImplementationHelper=ImplementationHelper)
+    register("officehelper", bootstrap=lambda: StubContext(message_result))
+    for package in ("com", "com.sun", "com.sun.star", "com.sun.star.text"):
+        register(package)
+    register("com.sun.star.awt", XCallback=type("XCallback", (), {}))
+    register("com.sun.star.task", XJobExecutor=type("XJobExecutor", (), {}))
+    register("com.sun.star.frame", XTerminateListener=type("XTerminateListener", (), {}))
+    register("com.sun.star.awt.MessageBoxType", **MESSAGE_BOX_TYPES)
+    register("com.sun.star.awt.MessageBoxButtons", **MESSAGE_BOX_BUTTONS)
+    register("com.sun.star.awt.MessageBoxResults", **MESSAGE_BOX_RESULTS)
+    register("com.sun.star.text.ControlCharacter", **CONTROL_CHARACTERS)
+
+
+def sandbox_env(home_dir):
+    """建立指向沙盒家目錄的環境變數，避免動到使用者真正的設定"""
+    env = dict(os.environ)
+    env["HOME"] = str(home_dir)
+    env["USERPROFILE"] = str(home_dir)
+    env["PYTHONDONTWRITEBYTECODE"] = "1"
+    return env
+
+
+def parse_importtime(stderr_text):
+    """解析 `-X importtime` 輸出，回傳 {模組: (self_us, cumulative_us)}"""
+    timings = {}
+    for line in stderr_text.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        try:
+            self_us = int(parts[0].strip())
+            cumulative_us = int(parts[1].strip())
+        except ValueError:
+            continue  # 標題列
+        name = parts[2].strip()
+        # 同一模組只取第一次（真正載入的那次）
+        timings.setdefault(name, (self_us, cumulative_us))
+    return timings
+
+
+def measure_import_breakdown(python, code, modules, env, top=10):
+    """以子行程執行 `-X importtime` 並整理指定模組與最耗時模組的明細
+
+    code 執行後若在標準輸出最後一行印出 JSON 陣列，視為匯入失敗的模組清單。
+    """
+    proc = subprocess.run(
+        [python, "-X", "importtime", "-c", code],
+        cwd=str(REPO_DIR),
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True
+    )
+    timings = parse_importtime(proc.stderr)
+    try:
+        failed = set(json.loads(proc.stdout.strip().splitlines()[-1]))
+    except (IndexError, ValueError):
+        failed = set()
+    result = {
+        "returncode": proc.returncode,
+        "modules": {},
+        "top_self": [],
+    }
+    for name in modules:
+        if name in timings and name not in failed:
+            result["modules"][name] = round(timings[name][1] / 1000.0, 1)
+        else:
+            result["modules"][name] = None  # 未安裝或匯入失敗
+    ranked = sorted(timings.items(), key=lambda item: (-item[1][0], item[0]))[:top]
+    result["top_self"] = [{"module": name, "self_ms": round(t[0] / 1000.0, 1)} for name, t in ranked]
+    return result
+
+
+def run_child_phases(server_python=None):
+    """在全新的直譯器中量測擴充套件端的各階段（由父行程呼叫）"""
+    timings = {}
+    install_uno_stubs()
+    sys.path.insert(0, str(REPO_DIR))
+
+    start = time.perf_counter()
+    import main
+    timings["import_main"] = time.perf_counter() - start
+
+    ctx = StubContext()
+
+    # Job 建構時不執行環境檢查，讓兩個階段分開計時
+    original_check = main.SpeechToTextJob.check_first_install
+    main.SpeechToTextJob.check_first_install = lambda self: None
+    start = time.perf_counter()
+    job = main.SpeechToTextJob(ctx)
+    timings["job_construction"] = time.perf_counter() - start
+    main.SpeechToTextJob.check_first_install = original_check
+
+    # 環境檢查期間不真正啟動伺服器，啟動成本由 process_spawn 等階段量測
+    spawn_requests = []
+    main.start_api_server = lambda *args, **kwargs: spawn_requests.append(args) or False
+    start = time.perf_counter()
+    job.check_first_install()
+    timings["environment_check"] = time.perf_counter() - start
+
+    import api_service
+    flask_dir = Path.home() / '.libreoffice' / 'speech_api'
+    flask_dir.mkdir(parents=True, exist_ok=True)
+    start = time.perf_counter()
+    # 與安裝程式相同，傳入伺服器 Python 以產生模組路徑清單
+    api_service.create_api_script(flask_dir, server_python)
+    timings["script_generation"] = time.perf_counter() - start
+
+    print(json.dumps({
+        "timings": timings,
+        "dialogs": len(ctx.messages),
+        "spawn_requests": len(spawn_requests),
+    }))
+
+
+def find_free_port():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def measure_server_start(python, api_script, env, timeout=60.0):
+    """啟動 API 腳本並量測 行程建立 / 端口可連線 / 第一個回應 的時間"""
+    port = find_free_port()
+    timings = {}
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [python, "-m", api_script.stem, "--port", str(port)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        env=env,
+        cwd=str(api_script.parent)
+    )
+    timings["process_spawn"] = time.perf_counter() - start
+    try:
+        deadline = start + timeout
+        # 等待端口可連線
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f"API 進程提前結束，返回碼：{process.returncode}")
+            if time.perf_counter() > deadline:
+                raise RuntimeError("等待 API 端口逾時")
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            connected = sock.connect_ex(("127.0.0.1", port)) == 0
+            sock.close()
+            if connected:
+                timings["port_open"] = time.perf_counter() - start
+                break
+            time.sleep(0.005)
+        # 等待第一個成功的 `/` 回應
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f"API 進程提前結束，返回碼：{process.returncode}")
+            if time.perf_counter() > deadline:
+                raise RuntimeError("等待 API 回應逾時")
+            try:
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=deadline - time.perf_counter())
+                conn.request("GET", "/")
+                status = conn.getresponse().status
+                conn.close()
+                if status == 200:
+                    timings["first_response"] = time.perf_counter() - start
+                    break
+            except (OSError, http.client.HTTPException):
+                pass
+            time.sleep(0.005)
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+    return timings
+
+
+def fetch_status(port, timeout=1.0):
+    """取得 API 根路徑的 JSON 狀態，無法連線時回傳 None"""
+    try:
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+        conn.request("GET", "/")
+        resp = conn.getresponse()
+        body = resp.read()
+        conn.close()
+        if resp.status == 200:
+            return json.loads(body.decode("utf-8"))
+    except (OSError, ValueError, http.client.HTTPException):
+        pass
+    return None
+
+
+def wait_for_standby(ready_file, deadline):
+    """等待熱備援就緒檔出現並回傳其中的 PID"""
+    while time.perf_counter() < deadline:
+        try:
+            content = ready_file.read_text(encoding="utf-8").strip()
+            if content:
+                return int(content)
+        except (OSError, ValueError):
+            pass
+        time.sleep(0.01)
+    raise RuntimeError("等待熱備援實例就緒逾時")
+
+
+def measure_failover(python, api_script, env, timeout=60.0):
+    """以熱備援模式啟動服務，強制結束主實例並量測備援實例恢復回應的時間"""
+    port = find_free_port()
+    ready_file = api_script.parent / "standby.ready"
+    deadline = time.perf_counter() + timeout
+    extra_pids = []
+    primary = subprocess.Popen(
+        [python, "-m", api_script.stem, "--port", str(port), "--warm-standby"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        env=env,
+        cwd=str(api_script.parent)
+    )
+    try:
+        while fetch_status(port) is None:
+            if primary.poll() is not None:
+                raise RuntimeError(f"API 進程提前結束，返回碼：{primary.returncode}")
+            if time.perf_counter() > deadline:
+                raise RuntimeError("等待 API 回應逾時")
+            time.sleep(0.01)
+        extra_pids.append(wait_for_standby(ready_file, deadline))
+
+        start = time.perf_counter()
+        primary.kill()
+        primary.wait()
+        while True:
+            status = fetch_status(port, timeout=0.5)
+            if status and status.get("pid") != primary.pid:
+                failover = time.perf_counter() - start
+                break
+            if time.perf_counter() > deadline:
+                raise RuntimeError("等待熱備援實例接手逾時")
+            time.sleep(0.001)
+
+        # 接手後會再啟動新的備援實例，等待它就緒後一併結束
+        extra_pids.append(wait_for_standby(ready_file, deadline))
+        return failover
+    finally:
+        if primary.poll() is None:
+            primary.kill()
+            primary.wait()
+        for pid in extra_pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+
+
+def summarize(samples):
+    """將多次量測的秒數轉為固定精度的毫秒統計"""
+    values = [s * 1000.0 for s in samples]
+    return {
+        "runs": len(values),
+        "median_ms": round(statistics.median(values), 1),
+        "min_ms": round(min(values), 1),
+        "max_ms": round(max(values), 1),
+    }
+
+
+def default_server_python():
+    """與 start_api_server 相同的規則選擇伺服器使用的 Python"""
+    home_path = Path.home()
+    if platform.system() == "Windows":
+        venv_python = home_path / '.libreoffice' / 'python_env' / 'venv' / 'Scripts' / 'python.exe'
+    else:
+        venv_python = home_path / '.libreoffice' / 'python_env' / 'venv' / 'bin' / 'python'
+    return str(venv_python) if venv_python.exists() else sys.executable
+
+
+# 附加情境量測：名稱 -> 量測函式 (回傳結果字典)，以 --scenario 選擇
+SCENARIOS = {}
+
+
+def scenario(name):
+    def register(function):
+        SCENARIOS[name] = function
+        return function
+    return register
+
+
+def synthetic_hypotheses(sentences, step=2):
+    """模擬逐步增長的暫定辨識結果：每次多幾個字，中途修正一次尾段"""
+    for sentence in sentences:
+        hypotheses = []
+        for end in range(step, len(sentence) + step, step):
+            hypotheses.append(sentence[:end])
+        # 模擬辨識器中途改變尾段的判斷
+        middle = len(hypotheses) // 2
+        if middle > 0:
+            wrong = hypotheses[middle][:-1] + "的"
+            hypotheses.insert(middle, wrong)
+        yield sentence, hypotheses
+
+
+@scenario("provisional")
+def measure_provisional(args):
+    """暫定文字更新：最小差異改寫與整段改寫的 UNO 呼叫數、改寫字元數與版面配置次數"""
+    install_uno_stubs()
+    sys.path.insert(0, str(REPO_DIR))
+    from document_inserter import DocumentInserter, ProvisionalText
+
+    class FullRewriteText(ProvisionalText):
+        """對照組：每次更新都改寫整段暫定文字"""
+        def _replace(self, new_text):
+            if self.cursor is None:
+                return super()._replace(new_text)
+            self._select_from(0)
+            self._without_undo(self.inserter.call, self.cursor.setString, new_text)
+            self.chars_written += len(new_text)
+            self.text = new_text
+
+    sentences = [
+        "今天下午三點在會議室討論下一季的產品規劃與預算分配",
+        "請把這份報告寄給所有參與專案的同事並附上會議紀錄",
+        "語音辨識的結果會依照說話的順序插入到目前游標的位置",
+    ]
+    # 暫定結果以每秒 20 次到達，文件更新上限為每秒 10 次
+    interval = 0.05
+    variants = [("minimal_diff", ProvisionalText, 10.0),
+                ("minimal_diff_uncoalesced", ProvisionalText, 1000.0),
+                ("full_rewrite", FullRewriteText, 10.0)]
+    results = {}
+    for name, provisional_class, max_rate in variants:
+        document = StubTextDocument()
+        inserter = DocumentInserter(document)
+        provisional = provisional_class(inserter, max_rate)
+        expected = ""
+        for sentence, hypotheses in synthetic_hypotheses(sentences):
+            for hypothesis in hypotheses:
+                provisional.update(hypothesis)
+                time.sleep(interval)
+            provisional.commit(sentence)
+            expected += sentence
+        stats = provisional.stats()
+        results[name] = {
+            "updates_received": stats["received"],
+            "updates_applied": stats["applied"],
+            "uno_calls": stats["uno_calls"],
+            "chars_written": stats["chars_written"],
+            "layouts": document.layouts,
+            "undo_actions": document.undo_manager.actions,
+            "latency_median_ms": stats["latency_median_ms"],
+            "latency_max_ms": stats["latency_max_ms"],
+            "document_ok": document.content == expected,
+        }
+    return results
+
+
+@scenario("dictionary")
+def measure_dictionary(args):
+    """使用者詞典：編譯、讀取快取，以及一次掃描取代與逐條 str.replace 的耗時比較"""
+    sys.path.insert(0, str(REPO_DIR))
+    from speech_dictionary import DictionaryStore
+
+    rules = [(f"產品{index:04d}號", f"P-{index}") for index in range(5000)]
+    rules += [("句號", "。"), ("逗號", "，"), ("問號", "？")]
+    transcript = "今天討論產品0042號與產品4999號逗號預計下週上市句號還有問題嗎問號" * 300
+    result = {"rules": len(rules), "transcript_chars": len(transcript)}
+    with tempfile.TemporaryDirectory(prefix="speech_bench_") as directory:
+        dictionary_file = Path(directory) / "dictionary.txt"
+        dictionary_file.write_text("\n".join(f"{source} => {target}" for source, target in rules), encoding="utf-8")
+        start = time.perf_counter()
+        DictionaryStore(dictionary_file).get()
+        result["compile_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        start = time.perf_counter()
+        dictionary = DictionaryStore(dictionary_file).get()
+        result["cached_load_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+    start = time.perf_counter()
+    one_pass = dictionary.apply(transcript)
+    result["one_pass_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    start = time.perf_counter()
+    naive = transcript
+    for source, target in rules:
+        naive = naive.replace(source, target)
+    result["str_replace_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    result["outputs_match"] = one_pass == naive
+    return result
+
+
+class SyntheticSpeechSource:
+    """長時間說話的合成麥克風：持續的語音，每隔數秒有短暫停頓，最後接上靜音"""
+
+    CHUNK = 1024
+    SAMPLE_RATE = 16000
+    SAMPLE_WIDTH = 2
+
+    def __init__(self, speech_seconds, dip_every=3.0, dip_seconds=0.3, silence_seconds=2.0, speedup=None):
+        import math
+        from array import array
+        tone = array('h', (int(8000 * math.sin(2 * math.pi * 440 * i / self.SAMPLE_RATE)) for i in range(self.CHUNK)))
+        self.speech = tone.tobytes()
+        self.quiet = bytes(self.CHUNK * self.SAMPLE_WIDTH)
+        seconds_per_chunk = self.CHUNK / self.SAMPLE_RATE
+        self.speech_chunks = int(speech_seconds / seconds_per_chunk)
+        self.total_chunks = self.speech_chunks + int(silence_seconds / seconds_per_chunk)
+        self.dip_every = max(1, int(dip_every / seconds_per_chunk))
+        self.dip_chunks = int(dip_seconds / seconds_per_chunk)
+        self.position = 0
+        self.stream = self
+        # 指定 speedup 時以實際時間的 1/speedup 產生音訊，模擬麥克風的即時輸入
+        self.chunk_delay = seconds_per_chunk / speedup if speedup else 0.0
+
+    def read(self, size):
+        if self.chunk_delay:
+            time.sleep(self.chunk_delay)
+        index = self.position
+        if index >= self.total_chunks:
+            return b""
+        self.position += 1
+        if index >= self.speech_chunks or index % self.dip_every < self.dip_chunks:
+            return self.quiet
+        return self.speech
+
+
+def run_child_capture(seconds, spool):
+    """在全新的直譯器中擷取並分段辨識一段合成長語音，回報峰值記憶體 (由 capture 情境呼叫)"""
+    import io
+    import wave
+    import resource
+    sys.path.insert(0, str(REPO_DIR))
+    from speech_capture import listen_to_spool, recognize_spool
+
+    class UnknownValueError(Exception):
+        pass
+
+    class WaitTimeoutError(Exception):
+        pass
+
+    class AudioData:
+        def __init__(self, frame_data, sample_rate, sample_width):
+            self.frame_data, self.sample_rate, self.sample_width = frame_data, sample_rate, sample_width
+
+    def recognize(recognizer, audio, language):
+        # 與真實引擎相同，辨識前把音訊轉成 WAV (一份片段大小的複本)
+        with io.BytesIO() as wav_file:
+            with wave.open(wav_file, "wb") as writer:
+                writer.setnchannels(1)
+                writer.setsampwidth(audio.sample_width)
+                writer.setframerate(audio.sample_rate)
+                writer.writeframes(audio.frame_data)
+            return f"[{len(wav_file.getvalue())}]"
+
+    sr = types.SimpleNamespace(AudioData=AudioData, UnknownValueError=UnknownValueError, WaitTimeoutError=WaitTimeoutError)
+    recognizer = types.SimpleNamespace(energy_threshold=300, dynamic_energy_threshold=False, pause_threshold=0.8,
+                                       phrase_threshold=0.3, non_speaking_duration=0.5)
+    source = SyntheticSpeechSource(seconds)
+    scale = 1024 if sys.platform != "darwin" else 1024 * 1024
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    start = time.perf_counter()
+    if spool:
+        audio = listen_to_spool(sr, recognizer, source)
+        max_seconds = 30.0
+    else:
+        # 原本的作法：整段語音留在記憶體並一次辨識
+        audio = listen_to_spool(sr, recognizer, source, memory_limit=float("inf"))
+        max_seconds = None
+    captured_seconds = audio.duration
+    spilled = audio.spilled
+    text = recognize_spool(sr, recognizer, audio, "zh-TW", recognize, max_seconds)
+    audio.close()
+    print(json.dumps({
+        "captured_seconds": round(captured_seconds, 1),
+        "spilled": spilled,
+        "segments": text.count("["),
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+        "peak_rss_growth_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale - baseline, 1)
+    }))
+
+
+@scenario("capture")
+def measure_capture(args):
+    """長時間語音的擷取與分段辨識：暫存檔與整段留在記憶體的峰值記憶體比較"""
+    result = {}
+    for seconds in (60, 600):
+        for mode in ("spool", "memory"):
+            proc = subprocess.run(
+                [sys.executable, str(REPO_DIR / "benchmark.py"), "--child-capture", str(seconds)]
+                + (["--capture-in-memory"] if mode == "memory" else []),
+                cwd=str(REPO_DIR),
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True
+            )
+            if proc.returncode != 0:
+                raise RuntimeError((proc.stderr.strip().splitlines() or ["未知錯誤"])[-1])
+            result[f"{mode}_{seconds}s"] = json.loads(proc.stdout.strip().splitlines()[-1])
+    return result
+
+
+@scenario("languages")
+def measure_languages(args):
+    """多語言辨識：以服務的 SpeculativeRecognizer 路徑，比較多個候選語言並行辨識與逐一辨識的耗時 (以固定延遲代替網路辨識)"""
+    from concurrent.futures import ThreadPoolExecutor
+    sys.path.insert(0, str(REPO_DIR))
+    from speech_capture import listen_to_spool, SpeculativeRecognizer
+
+    class UnknownValueError(Exception):
+        pass
+
+    class RequestError(Exception):
+        pass
+
+    class WaitTimeoutError(Exception):
+        pass
+
+    class AudioData:
+        def __init__(self, frame_data, sample_rate, sample_width):
+            self.frame_data, self.sample_rate, self.sample_width = frame_data, sample_rate, sample_width
+
+    request_latency = 0.2
+    confidences = {"zh-TW": 0.62, "en-US": 0.91, "ja-JP": 0.35}
+
+    def recognize_scored(recognizer, audio, language):
+        time.sleep(request_latency)
+        return f"{language}:{len(audio.frame_data)}", confidences[language]
+
+    sr = types.SimpleNamespace(AudioData=AudioData, UnknownValueError=UnknownValueError,
+                               RequestError=RequestError, WaitTimeoutError=WaitTimeoutError)
+    speedup = 20
+    languages = list(confidences)
+
+    def recognize(candidates, workers):
+        """與 /recognize 相同：擷取期間先行送出片段，說完後 finish；回傳 (從開始說話到取得結果的 ms, 說完後等待的 ms, 排序結果)"""
+        recognizer = types.SimpleNamespace(energy_threshold=300, dynamic_energy_threshold=False, pause_threshold=0.8,
+                                           phrase_threshold=0.3, non_speaking_duration=0.5)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            speculative = SpeculativeRecognizer(sr, recognizer, candidates, recognize_scored, executor)
+            source = SyntheticSpeechSource(45.0, speedup=speedup)
+            start = time.perf_counter()
+            spool = listen_to_spool(sr, recognizer, source, on_chunk=speculative.on_chunk)
+            captured = time.perf_counter()
+            ranked = speculative.finish(spool)
+            finished = time.perf_counter()
+            duration = spool.duration
+            spool.close()
+        return round((finished - start) * 1000, 1), round((finished - captured) * 1000, 1), ranked, duration
+
+    result = {"languages": len(languages), "request_latency_ms": request_latency * 1000, "speedup": speedup}
+    total, after, _, duration = recognize(languages[:1], 1)
+    result["audio_seconds"] = round(duration, 1)
+    result["single_language"] = {"total_ms": total, "after_speech_ms": after}
+    total, after, _, _ = recognize(languages, 1)
+    result["sequential"] = {"total_ms": total, "after_speech_ms": after}
+    total, after, ranked, _ = recognize(languages, len(languages))
+    result["concurrent"] = {"total_ms": total, "after_speech_ms": after}
+    result["best_language"] = ranked[0]["language"]
+    result["alternatives"] = len(ranked) - 1
+    return result
+
+
+@scenario("speculative")
+def measure_speculative(args):
+    """先行辨識：說話期間送出已完成片段與說完才整段辨識，比較說完後的等待時間"""
+    from concurrent.futures import ThreadPoolExecutor
+    sys.path.insert(0, str(REPO_DIR))
+    from speech_capture import listen_to_spool, recognize_spool, SpeculativeRecognizer
+
+    class UnknownValueError(Exception):
+        pass
+
+    class RequestError(Exception):
+        pass
+
+    class WaitTimeoutError(Exception):
+        pass
+
+    class AudioData:
+        def __init__(self, frame_data, sample_rate, sample_width):
+            self.frame_data, self.sample_rate, self.sample_width = frame_data, sample_rate, sample_width
+
+    def recognize(recognizer, audio, language):
+        # 以固定往返時間加上與音訊長度成正比的處理時間代替網路辨識
+        seconds = len(audio.frame_data) / (audio.sample_rate * audio.sample_width)
+        time.sleep(0.05 + 0.01 * seconds)
+        return f"[{seconds:.1f}]"
+
+    def recognize_scored(recognizer, audio, language):
+        return recognize(recognizer, audio, language), None
+
+    sr = types.SimpleNamespace(AudioData=AudioData, UnknownValueError=UnknownValueError,
+                               RequestError=RequestError, WaitTimeoutError=WaitTimeoutError)
+
+    def make_recognizer():
+        return types.SimpleNamespace(energy_threshold=300, dynamic_energy_threshold=False, pause_threshold=0.8,
+                                     phrase_threshold=0.3, non_speaking_duration=0.5)
+
+    result = {"speedup": 20}
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        for seconds in (5, 20, 60):
+            recognizer = make_recognizer()
+            source = SyntheticSpeechSource(seconds, dip_seconds=0.4, speedup=result["speedup"])
+            spool = listen_to_spool(sr, recognizer, source)
+            start = time.perf_counter()
+            recognize_spool(sr, recognizer, spool, "zh-TW", recognize)
+            after_ms = (time.perf_counter() - start) * 1000
+            spool.close()
+
+            recognizer = make_recognizer()
+            source = SyntheticSpeechSource(seconds, dip_seconds=0.4, speedup=result["speedup"])
+            speculative = SpeculativeRecognizer(sr, recognizer, ["zh-TW"], recognize_scored, executor)
+            spool = listen_to_spool(sr, recognizer, source, on_chunk=speculative.on_chunk)
+            segments = len(speculative.segments)
+            start = time.perf_counter()
+            speculative.finish(spool)
+            speculative_ms = (time.perf_counter() - start) * 1000
+            spool.close()
+            result[f"utterance_{seconds}s"] = {
+                "after_speech_ms": round(after_ms, 1),
+                "speculative_ms": round(speculative_ms, 1),
+                "segments_sent_early": segments
+            }
+    return result
+
+
+@scenario("clients")
+def measure_clients(args):
+    """區域網路共用服務：一個用戶端上傳長錄音時，其他用戶端短句的辨識延遲 (依用戶端輪流與先進先出比較)"""
+    import io
+    import threading
+    sys.path.insert(0, str(REPO_DIR))
+    from speech_capture import receive_to_spool, SpeculativeRecognizer
+    from speech_clients import FairExecutor
+
+    class UnknownValueError(Exception):
+        pass
+
+    class RequestError(Exception):
+        pass
+
+    class AudioData:
+        def __init__(self, frame_data, sample_rate, sample_width):
+            self.frame_data, self.sample_rate, self.sample_width = frame_data, sample_rate, sample_width
+
+    request_latency = 0.2
+
+    def recognize_scored(recognizer, audio, language):
+        time.sleep(request_latency)
+        return f"[{len(audio.frame_data)}]", None
+
+    def synthetic_pcm(seconds):
+        source = SyntheticSpeechSource(seconds, dip_seconds=0.4, silence_seconds=0.5)
+        return b"".join(iter(lambda: source.read(source.CHUNK), b""))
+
+    sr = types.SimpleNamespace(AudioData=AudioData, UnknownValueError=UnknownValueError, RequestError=RequestError)
+    recording, utterance = synthetic_pcm(300.0), synthetic_pcm(3.0)
+
+    def upload(executor, client, pcm):
+        """與 /recognize_audio 相同：邊接收邊先行辨識，回傳從開始上傳到取得結果的秒數"""
+        start = time.perf_counter()
+        speculative = SpeculativeRecognizer(sr, None, ["zh-TW"], recognize_scored, executor.for_client(client))
+        spool = receive_to_spool(io.BytesIO(pcm).read, 16000, 2, on_chunk=speculative.on_chunk)
+        speculative.finish(spool)
+        spool.close()
+        return time.perf_counter() - start
+
+    result = {"workers": 4, "request_latency_ms": request_latency * 1000, "recording_seconds": 300.0,
+              "light_clients": 4, "utterance_seconds": 3.0}
+    for scheduling in ("fifo", "fair"):
+        executor = FairExecutor(result["workers"], fair=scheduling == "fair")
+        latencies = []
+        lock = threading.Lock()
+
+        def light_client(index):
+            time.sleep(0.2 + index * 0.1)
+            for _ in range(3):
+                seconds = upload(executor, f"desk-{index}", utterance)
+                with lock:
+                    latencies.append(seconds)
+                time.sleep(0.5)
+
+        threads = [threading.Thread(target=light_client, args=(index,)) for index in range(result["light_clients"])]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        recording_seconds = upload(executor, "transcription", recording)
+        for thread in threads:
+            thread.join()
+        executor.shutdown()
+        latencies.sort()
+        result[scheduling] = {
+            "light_p50_ms": round(latencies[len(latencies) // 2] * 1000, 1),
+            "light_max_ms": round(latencies[-1] * 1000, 1),
+            "recording_ms": round(recording_seconds * 1000, 1),
+            "total_ms": round((time.perf_counter() - start) * 1000, 1)
+        }
+    return result
+
+
+def cpu_bound_recognize(engine, frame_data, sample_rate, sample_width, language, options):
+    """本機辨識引擎的替身：以純 Python 運算模擬 CPU 辨識 (持有 GIL)，運算量與音訊長度成正比"""
+    total = 0
+    for _ in range(int(options.get("passes", 1))):
+        for index in range(0, len(frame_data), 2):
+            total += frame_data[index]
+    return f"[{len(frame_data)}:{total % 97}]"
+
+
+@scenario("workers")
+def measure_workers(args):
+    """批次轉錄：多執行緒 (受 GIL 限制) 與不同數量的工作程序辨識同一批片段的吞吐量"""
+    import os
+    from concurrent.futures import ThreadPoolExecutor
+    sys.path.insert(0, str(REPO_DIR))
+    from speech_workers import ProcessPool
+
+    segments = 32
+    source = SyntheticSpeechSource(3.0, dip_seconds=0.0, silence_seconds=0.0)
+    frame_data = b"".join(iter(lambda: source.read(source.CHUNK), b""))
+    audio = types.SimpleNamespace(frame_data=frame_data, sample_rate=16000, sample_width=2)
+    options = {"passes": 40}
+    cores = os.cpu_count() or 1
+
+    def throughput(seconds):
+        return round(segments / seconds, 2)
+
+    started = time.perf_counter()
+    cpu_bound_recognize("stand-in", frame_data, 16000, 2, "zh-TW", options)
+    single_ms = (time.perf_counter() - started) * 1000
+    result = {"cores": cores, "segments": segments, "segment_seconds": 3.0, "segment_cpu_ms": round(single_ms, 1)}
+
+    with ThreadPoolExecutor(max_workers=max(2, cores)) as executor:
+        started = time.perf_counter()
+        list(executor.map(lambda _: cpu_bound_recognize("stand-in", frame_data, 16000, 2, "zh-TW", options),
+                          range(segments)))
+        result["threads_per_second"] = throughput(time.perf_counter() - started)
+
+    counts = sorted({1, max(1, cores // 2), cores})
+    baseline = None
+    for processes in counts:
+        pool = ProcessPool(processes, runner=cpu_bound_recognize, warm_up=("stand-in", "zh-TW")).start()
+        try:
+            # 等所有程序就緒，只量測辨識本身
+            deadline = time.monotonic() + 60
+            while not all(worker["ready"] for worker in pool.stats()["workers"]) and time.monotonic() < deadline:
+                time.sleep(0.01)
+            started = time.perf_counter()
+            futures = [pool.submit("stand-in", audio, "zh-TW", options) for _ in range(segments)]
+            for future in futures:
+                future.result(timeout=300)
+            per_second = throughput(time.perf_counter() - started)
+            stats = pool.stats()
+        finally:
+            pool.shutdown()
+        baseline = baseline or per_second
+        result[f"processes_{processes}"] = {
+            "per_second": per_second,
+            "speedup": round(per_second / baseline, 2),
+            "completed_per_worker": [worker["completed"] for worker in stats["workers"]]
+        }
+    return result
+
+
+class LatencyStandIn:
+    """本機的辨識服務替身：以 Google 語音 API 的格式回應，並依設定注入延遲
+
+    slow_every 個請求中有一個延遲 slow_delay 秒，其餘延遲 fast_delay 秒；outage 時全部延遲 slow_delay 秒。
+    """
+
+    def __init__(self, fast_delay=0.05, slow_delay=1.5, slow_every=5):
+        import threading
+        from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+        self.fast_delay = fast_delay
+        self.slow_delay = slow_delay
+        self.slow_every = slow_every
+        self.outage = False
+        self.requests = 0
+        self.lock = threading.Lock()
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                time.sleep(stand_in.next_delay())
+                body = b'{"result":[]}\n{"result":[{"alternative":[{"transcript":"ok","confidence":0.9}],"final":true}]}\n'
+                try:
+                    self.send_response(200)
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except OSError:
+                    # 用戶端已放棄這個請求 (對沖請求的輸家)
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/recognize"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def next_delay(self):
+        with self.lock:
+            self.requests += 1
+            slow = self.outage or self.requests % self.slow_every == 0
+        return self.slow_delay if slow else self.fast_delay
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@scenario("hedging")
+def measure_hedging(args):
+    """對沖請求與斷路器：以注入延遲的本機替身服務比較尾端延遲，並量測故障時改用備用引擎的情形"""
+    import urllib.request
+    sys.path.insert(0, str(REPO_DIR))
+    from speech_engine import HedgedEngine, DeadlineExceeded
+
+    stand_in = LatencyStandIn()
+
+    def primary(recognizer, audio, language):
+        request = urllib.request.Request(stand_in.url, data=audio, headers={"Content-Type": "audio/l16; rate=16000"})
+        with urllib.request.urlopen(request, timeout=recognizer.operation_timeout) as response:
+            lines = [line for line in response.read().decode("utf-8").splitlines() if line.strip()]
+        return json.loads(lines[-1])["result"][0]["alternative"][0]["transcript"]
+
+    def secondary(recognizer, audio, language):
+        return "offline"
+
+    def run(engine, count):
+        latencies = []
+        for _ in range(count):
+            start = time.perf_counter()
+            try:
+                engine.call(primary, secondary, types.SimpleNamespace(operation_timeout=None), b"\0" * 3200, "zh-TW")
+            except DeadlineExceeded:
+                pass
+            latencies.append((time.perf_counter() - start) * 1000)
+        latencies.sort()
+        return {
+            "p50_ms": round(latencies[len(latencies) // 2], 1),
+            "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1], 1),
+            "max_ms": round(latencies[-1], 1)
+        }
+
+    result = {"stand_in": {"fast_ms": stand_in.fast_delay * 1000, "slow_ms": stand_in.slow_delay * 1000, "slow_every": stand_in.slow_every}}
+    try:
+        # 對沖延遲等於期限時不會送出對沖請求，作為比較基準
+        result["without_hedging"] = run(HedgedEngine(deadline=5.0, min_hedge_delay=5.0, max_hedge_delay=5.0), 40)
+        engine = HedgedEngine(deadline=5.0, max_hedge_delay=0.5)
+        result["with_hedging"] = run(engine, 40)
+        result["with_hedging"].update(engine.stats())
+
+        # 替身服務完全停擺：連續逾時後斷路器開啟，之後的請求直接使用備用引擎
+        stand_in.outage = True
+        engine = HedgedEngine(deadline=0.4, max_hedge_delay=0.2, failure_threshold=3, reset_timeout=60.0)
+        result["outage"] = run(engine, 10)
+        result["outage"].update(engine.stats())
+    finally:
+        stand_in.close()
+    return result
+
+
+class ReplaySource:
+    """以固定大小的區塊重播一段 16 位元單聲道 PCM 音訊，記錄已讀取的區塊數"""
+
+    CHUNK = 1024
+    SAMPLE_WIDTH = 2
+
+    def __init__(self, pcm, sample_rate=16000):
+        self.pcm = pcm
+        self.SAMPLE_RATE = sample_rate
+        self.position = 0
+        self.stream = self
+
+    def read(self, size):
+        start = self.position * size * self.SAMPLE_WIDTH
+        data = self.pcm[start:start + size * self.SAMPLE_WIDTH]
+        if data:
+            self.position += 1
+        return data
+
+
+def synthetic_utterances(count, seed=7):
+    """合成一位說話者的語句：0.3～1.5 秒的語音之間夾著長度呈對數常態分佈 (中位數約 0.35 秒) 的停頓"""
+    import math
+    import random
+    from array import array
+    rate, chunk = 16000, ReplaySource.CHUNK
+    tone = array('h', (int(8000 * math.sin(2 * math.pi * 440 * i / rate)) for i in range(chunk))).tobytes()
+    quiet = bytes(chunk * 2)
+    rng = random.Random(seed)
+
+    def chunks(seconds):
+        return max(1, int(round(seconds * rate / chunk)))
+
+    utterances = []
+    for _ in range(count):
+        parts = [quiet * chunks(0.3)]
+        for word in range(rng.randint(4, 10)):
+            if word:
+                parts.append(quiet * chunks(min(2.5, rng.lognormvariate(math.log(0.35), 0.6))))
+            parts.append(tone * chunks(rng.uniform(0.3, 1.5)))
+        utterances.append(b"".join(parts))
+    return utterances
+
+
+def load_fixtures(directory):
+    """讀取目錄中的 WAV 錄音 (16 位元單聲道，每檔一句)，回傳 (pcm, sample_rate) 清單"""
+    import wave
+    fixtures = []
+    for path in sorted(Path(directory).glob("*.wav")):
+        with wave.open(str(path), "rb") as reader:
+            if reader.getsampwidth() != 2 or reader.getnchannels() != 1:
+                print(f"略過非 16 位元單聲道的錄音: {path}", file=sys.stderr)
+                continue
+            fixtures.append((reader.readframes(reader.getnframes()), reader.getframerate()))
+    return fixtures
+
+
+@scenario("endpointing")
+def measure_endpointing(args):
+    """自適應斷句：重播同一位說話者的語句，比較固定 pause_threshold 與依停頓分佈調整後，說完到結束擷取的等待時間"""
+    sys.path.insert(0, str(REPO_DIR))
+    from speech_capture import listen_to_spool, rms
+    from speech_endpointing import PauseModel, PauseObserver
+    from speech_profiles import DEFAULT_PROFILES
+
+    class WaitTimeoutError(Exception):
+        pass
+
+    sr = types.SimpleNamespace(WaitTimeoutError=WaitTimeoutError)
+    profile = DEFAULT_PROFILES["dictation"]
+    configured = profile["pause_threshold"]
+
+    if getattr(args, "fixtures", None):
+        fixtures = load_fixtures(args.fixtures)
+        source_name = str(args.fixtures)
+    else:
+        fixtures = [(pcm, 16000) for pcm in synthetic_utterances(80)]
+        source_name = "synthetic"
+    if not fixtures:
+        return {"error": "沒有可重播的錄音"}
+
+    prepared = []
+    for pcm, rate in fixtures:
+        size = ReplaySource.CHUNK * ReplaySource.SAMPLE_WIDTH
+        energies = [rms(pcm[i:i + size], 2) for i in range(0, len(pcm), size)]
+        # 錄音的音量門檻取安靜區塊的能量乘上 SpeechRecognition 預設的 dynamic_energy_ratio
+        threshold = max(300.0, sorted(energies)[len(energies) // 10] * 1.5)
+        last_speech = max(i for i, energy in enumerate(energies) if energy > threshold) if max(energies) > threshold else None
+        if last_speech is None:
+            continue
+        # 結尾補上比設定的門檻更長的靜音，固定門檻也能正常結束擷取
+        pcm = pcm[:(last_speech + 1) * size] + bytes(int((configured + 1.0) * rate) * 2)
+        prepared.append((pcm, rate, threshold, last_speech))
+
+    def replay(pcm, rate, threshold, last_speech, pause_threshold, on_chunk=None):
+        recognizer = types.SimpleNamespace(energy_threshold=threshold, dynamic_energy_threshold=False,
+                                           pause_threshold=pause_threshold, phrase_threshold=0.3,
+                                           non_speaking_duration=min(profile["non_speaking_duration"], pause_threshold))
+        source = ReplaySource(pcm, rate)
+        listen_to_spool(sr, recognizer, source, on_chunk=on_chunk).close()
+        seconds_per_chunk = source.CHUNK / rate
+        read = source.position - 1
+        return (read - last_speech) * seconds_per_chunk, read < last_speech
+
+    def summarize_latency(latencies, cut_offs):
+        ordered = sorted(latencies)
+        return {
+            "median_ms": round(ordered[len(ordered) // 2] * 1000, 1),
+            "p95_ms": round(ordered[max(0, int(len(ordered) * 0.95) - 1)] * 1000, 1),
+            "cut_off": cut_offs
+        }
+
+    fixed = [replay(*item, configured) for item in prepared]
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        model_path = os.path.join(temp_dir, "pause_model.json")
+        model = PauseModel(model_path)
+        adaptive, warmup = [], 0
+        for item in prepared:
+            applied = model.threshold("replay", configured)
+            if applied == configured:
+                warmup += 1
+            observer = PauseObserver()
+            adaptive.append(replay(*item, applied, on_chunk=observer.on_chunk))
+            model.record("replay", observer.pauses, configured, applied, observer.end_wait)
+        learned = model.threshold("replay", configured)
+        # 重新啟動後由檔案載入，門檻應與執行中的相同
+        persisted = PauseModel(model_path).threshold("replay", configured) == learned
+
+    return {
+        "fixtures": source_name,
+        "utterances": len(prepared),
+        "configured_pause_s": configured,
+        "fixed": summarize_latency([latency for latency, _ in fixed], sum(cut for _, cut in fixed)),
+        "adaptive": summarize_latency([latency for latency, _ in adaptive], sum(cut for _, cut in adaptive)),
+        "warmup_utterances": warmup,
+        "learned_pause_s": round(learned, 3),
+        "median_saving_ms": model.stats()["median_saving_ms"],
+        "persisted": persisted
+    }
+
+
+def server_threads(pid):
+    """伺服器進程目前的執行緒數 (只支援 Linux)"""
+    try:
+        with open(f"/proc/{pid}/status", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("Threads:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def run_load(port, pid, clients, seconds, recognize=None):
+    """以 clients 個保持連線的用戶端同時送出 `/`、`/mic_check` 與 `/recognize`，回傳各端點的延遲統計
+
+    recognize 為 /recognize 的請求內容，例如以 source 指定音訊檔代替麥克風。
+    """
+    import threading
+    requests = [("GET", "/", None), ("GET", "/", None), ("GET", "/mic_check", None),
+                ("POST", "/recognize", json.dumps(recognize or {"profile": "fast-commands", "timeout": 1}))]
+    latencies = {path: [] for _, path, _ in requests}
+    errors = {path: 0 for _, path, _ in requests}
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + seconds
+    peak = [server_threads(pid) or 0]
+
+    def client(index):
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        turn = index
+        while time.perf_counter() < stop_at:
+            method, path, body = requests[turn % len(requests)]
+            turn += 1
+            start = time.perf_counter()
+            try:
+                headers = {"Content-Type": "application/json"} if body else {}
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                ok = response.status == 200
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                ok = False
+            with lock:
+                if ok:
+                    latencies[path].append(time.perf_counter() - start)
+                else:
+                    errors[path] += 1
+        conn.close()
+
+    threads = [threading.Thread(target=client, args=(i,), daemon=True) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    while any(thread.is_alive() for thread in threads):
+        peak[0] = max(peak[0], server_threads(pid) or 0)
+        time.sleep(0.05)
+
+    result = {"clients": clients, "seconds": seconds, "peak_threads": peak[0] or None}
+    total = 0
+    for path, samples in latencies.items():
+        samples.sort()
+        total += len(samples)
+        result[path] = {
+            "requests": len(samples),
+            "errors": errors[path],
+            "p50_ms": round(samples[len(samples) // 2] * 1000, 1) if samples else None,
+            "p95_ms": round(samples[max(0, int(len(samples) * 0.95) - 1)] * 1000, 1) if samples else None,
+            "max_ms": round(samples[-1] * 1000, 1) if samples else None
+        }
+    result["requests_per_second"] = round(total / seconds, 1)
+    return result
+
+
+def measure_graceful_shutdown(port, process):
+    """辨識請求進行中要求關閉：該請求仍應取得回應，之後進程自行結束"""
+    import threading
+    outcome = {}
+
+    def slow_request():
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+            conn.request("POST", "/recognize", body=json.dumps({"profile": "fast-commands", "timeout": 1}),
+                         headers={"Content-Type": "application/json"})
+            outcome["status"] = conn.getresponse().status
+            conn.close()
+        except (OSError, http.client.HTTPException) as e:
+            outcome["error"] = str(e)
+
+    request = threading.Thread(target=slow_request)
+    request.start()
+    time.sleep(0.2)
+    start = time.perf_counter()
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    conn.request("POST", "/shutdown")
+    conn.getresponse().read()
+    conn.close()
+    request.join(30)
+    try:
+        process.wait(timeout=30)
+        exit_ms = round((time.perf_counter() - start) * 1000, 1)
+    except subprocess.TimeoutExpired:
+        exit_ms = None
+    return {"in_flight_completed": outcome.get("status") == 200, "exit_ms": exit_ms}
+
+
+@scenario("serving")
+def measure_serving(args):
+    """伺服器負載測試：werkzeug、waitress 與 ASGI 版本 (uvicorn) 在同時的 `/`、`/mic_check`、`/recognize` 請求下的延遲、執行緒數與優雅關閉"""
+    install_uno_stubs()
+    sys.path.insert(0, str(REPO_DIR))
+    import api_service
+    server_python = args.server_python or default_server_python()
+    result = {"server_python": server_python}
+    with tempfile.TemporaryDirectory(prefix="speech_bench_") as home_dir:
+        env = sandbox_env(home_dir)
+        flask_dir = Path(home_dir) / '.libreoffice' / 'speech_api'
+        flask_dir.mkdir(parents=True)
+        api_service.create_api_script(flask_dir)
+        # 以合成語音檔代替麥克風、本機替身代替 Google 語音 API，沒有音訊裝置與網路的機器也走完整的擷取、斷句與辨識流程
+        import wave
+        fixture = Path(home_dir) / 'utterance.wav'
+        source = SyntheticSpeechSource(1.5, dip_seconds=0.0, silence_seconds=1.0)
+        with wave.open(str(fixture), "wb") as writer:
+            writer.setnchannels(1)
+            writer.setsampwidth(source.SAMPLE_WIDTH)
+            writer.setframerate(source.SAMPLE_RATE)
+            writer.writeframes(b"".join(iter(lambda: source.read(source.CHUNK), b"")))
+        stand_in = LatencyStandIn(fast_delay=0.05, slow_delay=0.05)
+        (flask_dir / 'profiles.json').write_text(json.dumps({"engine": {"google_endpoint": stand_in.url}}), encoding='utf-8')
+        recognize = {"profile": "fast-commands", "timeout": 1, "source": f"file:{fixture}"}
+        result["recognize_source"] = "file"
+        for kind, interface, server in (("werkzeug", "wsgi", "werkzeug"), ("waitress", "wsgi", "waitress"),
+                                        ("uvicorn", "asgi", "auto")):
+            port = find_free_port()
+            process = subprocess.Popen(
+                [server_python, "-m", "speech_api", "--port", str(port), "--interface", interface,
+                 "--server", server, "--threads", "8"],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=env, cwd=str(flask_dir)
+            )
+            try:
+                deadline = time.perf_counter() + 60
+                while fetch_status(port) is None:
+                    if process.poll() is not None:
+                        raise RuntimeError(f"{kind} 伺服器提前結束，返回碼：{process.returncode}")
+                    if time.perf_counter() > deadline:
+                        raise RuntimeError(f"等待 {kind} 伺服器逾時")
+                    time.sleep(0.05)
+                status = fetch_status(port)
+                if status.get("interface") != interface:
+                    raise RuntimeError(f"{kind} 伺服器未啟用 {interface} 介面")
+                result[kind] = run_load(port, process.pid, clients=32, seconds=5.0, recognize=recognize)
+                result[kind]["shutdown"] = measure_graceful_shutdown(port, process)
+            except RuntimeError as e:
+                result[kind] = {"error": str(e)}
+            finally:
+                if process.poll() is None:
+                    process.kill()
+                    process.wait()
+        stand_in.close()
+    return result
+
+
+def run_benchmark(args):
+    samples = {phase: [] for phase in PHASES}
+    errors = {}
+    extension_python = args.python or sys.executable
+    server_python = args.server_python or default_server_python()
+    import_breakdown = None
+    server_breakdown = None
+
+    for _ in range(args.repeat):
+        with tempfile.TemporaryDirectory(prefix="speech_bench_") as home_dir:
+            env = sandbox_env(home_dir)
+
+            proc = subprocess.run(
+                [extension_python, str(REPO_DIR / "benchmark.py"), "--child-phases",
+                 "--server-python", server_python],
+                cwd=str(REPO_DIR),
+                env=env,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True
+            )
+            if proc.returncode != 0:
+                errors["extension"] = proc.stderr.strip().splitlines()[-1:] or ["未知錯誤"]
+            else:
+                child = json.loads(proc.stdout.strip().splitlines()[-1])
+                for phase, seconds in child["timings"].items():
+                    samples[phase].append(seconds)
+
+            if args.skip_server:
+                continue
+
+            api_script = Path(home_dir) / '.libreoffice' / 'speech_api' / 'speech_api.py'
+            if not api_script.exists():
+                errors.setdefault("server", ["API 腳本未產生"])
+                continue
+            try:
+                start = time.perf_counter()
+                server_breakdown = measure_import_breakdown(
+                    server_python, SERVER_IMPORT_CODE % (SERVER_MODULES,), SERVER_MODULES, env
+                )
+                samples["server_import"].append(time.perf_counter() - start)
+                for phase, seconds in measure_server_start(server_python, api_script, env).items():
+                    samples[phase].append(seconds)
+                if args.failover:
+                    samples["failover"].append(measure_failover(server_python, api_script, env))
+            except Exception as e:
+                errors["server"] = [str(e)]
+
+    with tempfile.TemporaryDirectory(prefix="speech_bench_") as home_dir:
+        import_breakdown = measure_import_breakdown(
+            extension_python,
+            "import benchmark; benchmark.install_uno_stubs(); import main",
+            PROJECT_MODULES, sandbox_env(home_dir)
+        )
+
+    scenarios = {}
+    for name in args.scenario or []:
+        try:
+            scenarios[name] = SCENARIOS[name](args)
+        except Exception as e:
+            errors[f"scenario:{name}"] = [str(e)]
+
+    phases = []
+    for phase in PHASES:
+        entry = {"name": phase}
+        if samples[phase]:
+            entry["status"] = "ok"
+            entry.update(summarize(samples[phase]))
+        elif (args.skip_server and phase in SERVER_PHASES) or (phase == "failover" and not args.failover):
+            entry["status"] = "skipped"
+        else:
+            entry["status"] = "error"
+        phases.append(entry)
+
+    return {
+        "schema": REPORT_SCHEMA,
+        "environment": {
+            "platform": platform.system(),
+            "extension_python": "%d.%d.%d" % sys.version_info[:3],
+            "server_python": server_python,
+        },
+        "phases": phases,
+        "import_breakdown": import_breakdown,
+        "server_import_breakdown": server_breakdown,
+        "scenarios": scenarios,
+        "errors": errors,
+    }
+
+
+def format_text(report):
+    lines = [f"語音辨識擴充套件冷啟動報告 (schema {report['schema']})", ""]
+    lines.append(f"{'階段':<20}{'狀態':<10}{'中位數(ms)':>12}{'最小(ms)':>12}{'最大(ms)':>12}")
+    for phase in report["phases"]:
+        if phase["status"] == "ok":
+            lines.append(f"{phase['name']:<20}{phase['status']:<10}{phase['median_ms']:>12}{phase['min_ms']:>12}{phase['max_ms']:>12}")
+        else:
+            lines.append(f"{phase['name']:<20}{phase['status']:<10}")
+    for title, key in (("擴充套件匯入明細", "import_breakdown"), ("伺服器匯入明細", "server_import_breakdown")):
+        breakdown = report.get(key)
+        if not breakdown:
+            continue
+        lines.append("")
+        lines.append(f"{title} (累計 ms)")
+        for name, value in breakdown["modules"].items():
+            lines.append(f"  {name:<28}{'未載入' if value is None else value}")
+        lines.append("  最耗時模組 (self ms)")
+        for item in breakdown["top_self"]:
+            lines.append(f"    {item['module']:<26}{item['self_ms']}")
+    for name, result in report.get("scenarios", {}).items():
+        lines.append("")
+        lines.append(f"情境 [{name}]")
+        lines.extend(format_scenario(result, "  "))
+    for name, messages in sorted(report["errors"].items()):
+        lines.append("")
+        lines.append(f"錯誤 [{name}]: {'; '.join(messages)}")
+    return "\n".join(lines)
+
+
+def format_scenario(result, indent):
+    lines = []
+    for key, value in result.items():
+        if isinstance(value, dict):
+            lines.append(f"{indent}{key}")
+            lines.extend(format_scenario(value, indent + "  "))
+        else:
+            lines.append(f"{indent}{key:<28}{value}")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="語音辨識擴充套件冷啟動效能量測")
+    parser.add_argument("--repeat", type=int, default=3, help="每個階段重複量測次數")
+    parser.add_argument("--format", choices=["text", "json"], default="text", help="報告格式")
+    parser.add_argument("-o", "--output", help="將報告寫入檔案")
+    parser.add_argument("--python", help="模擬 LibreOffice 內建 Python 的直譯器")
+    parser.add_argument("--server-python", help="啟動 API 伺服器的直譯器（預設與 start_api_server 相同）")
+    parser.add_argument("--skip-server", action="store_true", help="只量測擴充套件端")
+    parser.add_argument("--failover", action="store_true", help="量測熱備援模式下主實例結束後的接手時間")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="附加的情境量測 (可重複指定)")
+    parser.add_argument("--fixtures", help="endpointing 情境重播的 WAV 錄音目錄 (每檔一句，預設使用合成語句)")
+    parser.add_argument("--child-phases", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--child-capture", type=float, help=argparse.SUPPRESS)
+    parser.add_argument("--capture-in-memory", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child_phases:
+        run_child_phases(args.server_python)
+        return
+    if args.child_capture:
+        run_child_capture(args.child_capture, spool=not args.capture_in_memory)
+        return
+
+    report = run_benchmark(args)
+    if args.format == "json":
+        output = json.dumps(report, ensure_ascii=False, indent=2, sort_keys=True)
+    else:
+        output = format_text(report)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import time
+import logging
+import threading
+import urllib.parse
+
+from api_service import api_request
+from document_inserter import DocumentInserter, ProvisionalText
+
+# 不以空白分隔詞語的語言，連續的辨識結果直接相接
+UNSPACED_LANGUAGES = ('zh', 'ja', 'ko', 'th')
+
+
+class ContinuousDictation:
+    """連續聽寫：服務端持續擷取與辨識，本端長輪詢結果並依序插入游標位置
+
+    服務提供暫定結果時，以 ProvisionalText 即時顯示，最終結果到達後定稿。
+    language 為 None 時使用服務端設定組合的語言。接收執行緒的文件操作交給 dispatch (見 MainThreadDispatcher)。
+    """
+
+    def __init__(self, model, language=None, poll_wait=10.0, stop_timeout=30.0, max_update_rate=10.0, dispatch=None):
+        self.model = model
+        self.language = language
+        self.poll_wait = poll_wait
+        self.stop_timeout = stop_timeout
+        self.inserter = DocumentInserter(model)
+        self.provisional = ProvisionalText(self.inserter, max_update_rate, dispatch)
+        self.partial_version = 0
+        self.session_id = None
+        self.after = 0
+        self.inserted = 0
+        self.stop_requested = threading.Event()
+        self.thread = None
+        self.error = None
+
+    def start(self, options=None):
+        """要求服務開始連續聽寫，成功時開始接收結果"""
+        payload = {"language": self.language} if self.language else {}
+        payload.update(options or {})
+        result = api_request("POST", "/stream/start", payload)
+        if not result or not result.get("success"):
+            self.error = (result or {}).get("error", "無法連接到語音辨識服務")
+            return False
+        self.session_id = result["session"]
+        self.language = result.get("language") or self.language or 'zh-TW'
+        self.inserter.show_status("連續聽寫中... (再按一次停止)")
+        self.thread = threading.Thread(target=self._receive_loop, name='continuous-dictation', daemon=True)
+        self.thread.start()
+        return True
+
+    def stop(self):
+        """停止擷取；已擷取的語音辨識完成後仍會插入文件"""
+        self.stop_requested.set()
+        self.inserter.show_status("連續聽寫停止中...")
+        api_request("POST", "/stream/stop")
+
+    def is_running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def _receive_loop(self):
+        global _active_dictation
+        stop_deadline = None
+        try:
+            while True:
+                if self.stop_requested.is_set() and stop_deadline is None:
+                    stop_deadline = time.monotonic() + self.stop_timeout
+                if stop_deadline is not None and time.monotonic() > stop_deadline:
+                    logging.warning("等待連續聽寫結果逾時")
+                    break
+                query = urllib.parse.urlencode({
+                    "session": self.session_id,
+                    "after": self.after,
+                    "wait": self.poll_wait,
+                    "partial_after": self.partial_version
+                })
+                data = api_request("GET", f"/stream/results?{query}", timeout=self.poll_wait + 5)
+                if not data or not data.get("success"):
+                    self.error = (data or {}).get("error", "與語音辨識服務的連線中斷")
+                    logging.error(f"連續聽寫中斷: {self.error}")
+                    break
+                self._insert_results(data["results"])
+                self.after = data["next"]
+                self.partial_version = data.get("partial_version", self.partial_version)
+                partial = data.get("partial")
+                if partial and partial.get("text"):
+                    self.provisional.update(partial["text"])
+                if data.get("error"):
+                    self.error = data["error"]
+                if not data["active"]:
+                    break
+        except Exception as e:
+            self.error = str(e)
+            logging.error(f"連續聽寫發生錯誤: {e}")
+        finally:
+            self.provisional.discard()
+            self.provisional.dispatch(self._finish)
+            with _dictation_lock:
+                if _active_dictation is self:
+                    _active_dictation = None
+
+    def _finish(self):
+        self.inserter.clear_status()
+        logging.info(f"連續聽寫結束，共插入 {self.inserted} 段")
+        logging.info(f"暫定文字統計: {self.provisional.stats()}")
+
+    def _insert_results(self, results):
+        """依序插入辨識成功的結果，多段合併為一次插入"""
+        pieces = []
+        for result in results:
+            text = result.get("text", "")
+            if not result.get("success") or not text:
+                continue
+            if (self.inserted or pieces) and not self.language.lower().startswith(UNSPACED_LANGUAGES):
+                text = " " + text
+            pieces.append(text)
+        if results and (pieces or self.provisional.active):
+            # 暫定文字所在位置即最終結果的插入位置，定稿與插入合併為一次操作
+            self.provisional.commit("".join(pieces))
+            self.inserted += len(pieces)
+
+
+_active_dictation = None
+_dictation_lock = threading.Lock()
+
+
+def get_active_dictation():
+    """取得進行中的連續聽寫，沒有時回傳 None"""
+    with _dictation_lock:
+        if _active_dictation is not None and _active_dictation.is_running():
+            return _active_dictation
+        return None
+
+
+def start_dictation(model, language=None, options=None, dispatch=None):
+    """開始連續聽寫，失敗時回傳 (None, 錯誤訊息)"""
+    global _active_dictation
+    with _dictation_lock:
+        if _active_dictation is not None and _active_dictation.is_running():
+            return _active_dictation, None
+        dictation = ContinuousDictation(model, language, dispatch=dispatch)
+        if not dictation.start(options):
+            return None, dictation.error
+        _active_dictation = dictation
+        return dictation, None
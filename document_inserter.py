@@ -0,0 +1,300 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import time
+import logging
+import threading
+from collections import deque
+
+import unohelper
+from com.sun.star.awt import XCallback
+from com.sun.star.text.ControlCharacter import PARAGRAPH_BREAK
+
+# 文字插入時的復原動作名稱
+UNDO_TITLE = "語音辨識"
+
+
+class DocumentInserter:
+    """Writer 文件插入層
+
+    聆聽狀態顯示在狀態列，不修改文件內容；
+    辨識結果在 lockControllers 與單一復原動作中一次插入，只觸發一次版面配置。
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.controller = model.getCurrentController()
+        self.indicator = None
+        # 文件操作的 UNO 呼叫次數 (每次都是跨行程呼叫，包含上面的 getCurrentController)
+        self.uno_calls = 1
+
+    def call(self, method, *args):
+        """呼叫 UNO 方法並計數"""
+        self.uno_calls += 1
+        return method(*args)
+
+    def show_status(self, message):
+        """在目前視窗的狀態列顯示訊息"""
+        try:
+            if self.indicator is None:
+                self.indicator = self.controller.getFrame().createStatusIndicator()
+                self.indicator.start(message, 0)
+            else:
+                self.indicator.setText(message)
+        except Exception as e:
+            logging.debug(f"無法顯示狀態列訊息: {e}")
+
+    def clear_status(self):
+        """結束狀態列訊息"""
+        if self.indicator is not None:
+            try:
+                self.indicator.end()
+            except Exception as e:
+                logging.debug(f"無法結束狀態列訊息: {e}")
+            self.indicator = None
+
+    def insert(self, text):
+        """在游標位置插入辨識結果，多行文字以段落分隔"""
+        if not text:
+            return
+        call = self.call
+        undo_manager = call(self.model.getUndoManager)
+        call(self.model.lockControllers)
+        call(undo_manager.enterUndoContext, UNDO_TITLE)
+        try:
+            cursor = call(self.controller.getViewCursor)
+            # 使用游標所在的文字物件，在表格或文字方塊中也能插入
+            self.insert_lines(call(cursor.getText), cursor, text)
+        finally:
+            call(undo_manager.leaveUndoContext)
+            call(self.model.unlockControllers)
+
+    def insert_lines(self, document_text, cursor, text):
+        """在游標位置插入文字，多行文字以段落分隔"""
+        for index, line in enumerate(text.split("\n")):
+            if index > 0:
+                self.call(document_text.insertControlCharacter, cursor, PARAGRAPH_BREAK, False)
+            if line:
+                self.call(document_text.insertString, cursor, line, False)
+
+
+class MainThreadDispatcher(unohelper.Base, XCallback):
+    """把文件操作排到 LibreOffice 主執行緒執行
+
+    UI 執行緒持有 SolarMutex，背景執行緒的 UNO 呼叫必須等它釋放；背景執行緒改以 AsyncCallback
+    把函式排入主執行緒的事件佇列，不與 UI 執行緒互相等待。須在主執行緒建立，在主執行緒呼叫時直接執行。
+    """
+
+    def __init__(self, ctx):
+        self.async_callback = ctx.getServiceManager().createInstanceWithContext("com.sun.star.awt.AsyncCallback", ctx)
+        self.thread_id = threading.get_ident()
+        self.lock = threading.Lock()
+        self.functions = deque()
+
+    def __call__(self, function):
+        if threading.get_ident() == self.thread_id:
+            function()
+            return
+        with self.lock:
+            self.functions.append(function)
+        self.async_callback.addCallback(self, None)
+
+    def notify(self, data):
+        """XCallback：由主執行緒依排入順序呼叫"""
+        with self.lock:
+            function = self.functions.popleft()
+        try:
+            function()
+        except Exception as e:
+            logging.error(f"主執行緒執行文件操作時發生錯誤: {e}")
+
+
+def common_prefix_length(old, new):
+    """兩段文字相同開頭的長度"""
+    limit = min(len(old), len(new))
+    index = 0
+    while index < limit and old[index] == new[index]:
+        index += 1
+    return index
+
+
+class ProvisionalText:
+    """文件中的暫定辨識文字
+
+    每次更新只改寫與前一版不同的尾段，更新頻率有上限 (只套用最新一版)，
+    最後以單一操作定稿。暫定文字的修改不記錄復原動作，定稿只產生一個復原動作。
+    update、commit 與 discard 可在任何執行緒呼叫，文件操作一律交給 dispatch 執行 (見 MainThreadDispatcher)；
+    lock 只保護待套用的文字與統計，不在持有時呼叫 UNO。未指定 dispatch 時在呼叫端執行緒執行，以 apply_lock 依序執行。
+    游標涵蓋暫定文字中上次改寫的尾段，其結尾即暫定文字結尾。改變從這個範圍的開頭開始時只需 setString，
+    否則先以 collapseToEnd、goLeft 移動游標 (純粹接在後面時只需 collapseToEnd)，另加停止記錄復原的 lock/unlock。
+    改寫的字元數最少，UNO 呼叫數則比每次改寫整段多 (見 benchmark.py 的 provisional 情境)。
+    """
+
+    def __init__(self, inserter, max_rate=10.0, dispatch=None):
+        self.inserter = inserter
+        self.min_interval = 1.0 / max_rate
+        self.lock = threading.Lock()
+        self.apply_lock = threading.RLock()
+        self.dispatch = dispatch or self._dispatch_here
+        self.undo_manager = None
+        self.view_cursor = None
+        self.cursor = None
+        self.text = ""
+        # 游標涵蓋 text[span_start:]
+        self.span_start = 0
+        self.pending = None
+        # 已交給 dispatch、尚未套用
+        self.scheduled = False
+        self.last_applied_at = 0.0
+        self.timer = None
+        self.received = 0
+        self.applied = 0
+        self.chars_written = 0
+        self.latencies = []
+
+    @property
+    def active(self):
+        """是否有顯示中或等待套用的暫定文字"""
+        return self.cursor is not None or self.pending is not None or self.scheduled
+
+    def update(self, text):
+        """收到新的暫定文字；距離上次改寫不足最小間隔時延後，期間只保留最新一版"""
+        with self.lock:
+            self.received += 1
+            self.pending = (text, time.perf_counter())
+            if self.scheduled or self.timer is not None:
+                return
+            wait = self.last_applied_at + self.min_interval - time.perf_counter()
+            if wait > 0:
+                self.timer = threading.Timer(wait, self._schedule)
+                self.timer.daemon = True
+                self.timer.start()
+                return
+            self.scheduled = True
+        self.dispatch(self._flush)
+
+    def commit(self, final_text):
+        """以最終結果取代暫定文字：一次版面配置、一個復原動作"""
+        with self.lock:
+            self._cancel_pending()
+        self.dispatch(lambda: self._commit(final_text))
+
+    def discard(self):
+        """移除暫定文字"""
+        with self.lock:
+            self._cancel_pending()
+        self.dispatch(self._discard)
+
+    def stats(self):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            return {
+                "received": self.received,
+                "applied": self.applied,
+                "chars_written": self.chars_written,
+                "uno_calls": self.inserter.uno_calls,
+                "latency_median_ms": round(latencies[len(latencies) // 2] * 1000, 1) if latencies else None,
+                "latency_max_ms": round(latencies[-1] * 1000, 1) if latencies else None
+            }
+
+    def _dispatch_here(self, function):
+        with self.apply_lock:
+            function()
+
+    def _schedule(self):
+        """最小間隔到期 (計時器執行緒)：把最新一版交給 dispatch"""
+        with self.lock:
+            self.timer = None
+            if self.pending is None or self.scheduled:
+                return
+            self.scheduled = True
+        self.dispatch(self._flush)
+
+    def _cancel_pending(self):
+        """捨棄尚未套用的暫定文字 (呼叫端持有 lock)；已交給 dispatch 的 _flush 執行時沒有文字可套用"""
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        self.pending = None
+
+    def _flush(self):
+        with self.lock:
+            self.scheduled = False
+            pending, self.pending = self.pending, None
+        if pending is None:
+            return
+        text, received_at = pending
+        self._replace(text)
+        applied_at = time.perf_counter()
+        with self.lock:
+            self.last_applied_at = applied_at
+            self.applied += 1
+            self.latencies.append(applied_at - received_at)
+
+    def _commit(self, final_text):
+        if self.cursor is None:
+            self.inserter.insert(final_text)
+            return
+        call = self.inserter.call
+        model = self.inserter.model
+        call(model.lockControllers)
+        try:
+            # 移除暫定文字 (不記錄復原動作)，再以一個復原動作插入最終結果
+            self._without_undo(self._select_from, 0)
+            self._without_undo(call, self.cursor.setString, "")
+            if final_text:
+                call(self.undo_manager.enterUndoContext, UNDO_TITLE)
+                try:
+                    self.inserter.insert_lines(call(self.cursor.getText), self.cursor, final_text)
+                finally:
+                    call(self.undo_manager.leaveUndoContext)
+            # 與直接插入相同，游標移到結果之後，下一段接著插入
+            call(self.view_cursor.gotoRange, self.cursor, False)
+        finally:
+            call(model.unlockControllers)
+            self.cursor = None
+            self.text = ""
+            self.span_start = 0
+
+    def _discard(self):
+        if self.cursor is not None:
+            self._replace("")
+            self.cursor = None
+            self.span_start = 0
+
+    def _without_undo(self, method, *args):
+        call = self.inserter.call
+        call(self.undo_manager.lock)
+        try:
+            return method(*args)
+        finally:
+            call(self.undo_manager.unlock)
+
+    def _select_from(self, position):
+        """讓游標涵蓋 text[position:]"""
+        if position != self.span_start:
+            self.inserter.call(self.cursor.collapseToEnd)
+            if len(self.text) > position:
+                self.inserter.call(self.cursor.goLeft, len(self.text) - position, True)
+            self.span_start = position
+
+    def _replace(self, new_text):
+        """以最小差異改寫暫定文字：保留相同開頭，只取代不同的尾段"""
+        call = self.inserter.call
+        if self.cursor is None:
+            if not new_text:
+                return
+            if self.undo_manager is None:
+                self.undo_manager = call(self.inserter.model.getUndoManager)
+            if self.view_cursor is None:
+                self.view_cursor = call(self.inserter.controller.getViewCursor)
+            view_cursor = self.view_cursor
+            self.cursor = call(call(view_cursor.getText).createTextCursorByRange, call(view_cursor.getStart))
+            self.text = ""
+            self.span_start = 0
+        prefix = common_prefix_length(self.text, new_text)
+        if prefix == len(self.text) == len(new_text):
+            return
+        self._select_from(prefix)
+        self._without_undo(call, self.cursor.setString, new_text[prefix:])
+        self.chars_written += len(new_text) - prefix
+        self.text = new_text
@@ -6,9 +6,11 @@ import os
 import tempfile
 import importlib.util
 import platform
+import threading
 from pathlib import Path
 
 from com.sun.star.task import XJobExecutor
+from com.sun.star.frame import XTerminateListener
 from com.sun.star.awt.MessageBoxType import MESSAGEBOX, INFOBOX, WARNINGBOX, ERRORBOX, QUERYBOX
 from com.sun.star.awt.MessageBoxButtons import BUTTONS_OK, BUTTONS_OK_CANCEL, BUTTONS_YES_NO, BUTTONS_YES_NO_CANCEL, BUTTONS_RETRY_CANCEL, BUTTONS_ABORT_IGNORE_RETRY
 from com.sun.star.awt.MessageBoxResults import OK, YES, NO, CANCEL
@@ -17,8 +19,88 @@ sys.path.append(os.path.dirname(__file__))
 
 # 導入自定義模組
 from utils import setup_logging, check_module_installed, show_message_box
-from module_installer import install_modules_directly, fix_venv_permissions
-from api_service import create_api_script, start_api_server, start_api_server_with_system_python
+from document_inserter import DocumentInserter, ProvisionalText, MainThreadDispatcher
+from continuous_dictation import start_dictation, get_active_dictation
+from remote_recognition import load_remote_config, recognize_remote
+from module_installer import start_install_task, get_install_task, fix_venv_permissions
+from api_service import create_api_script, start_api_server, start_api_server_with_system_python, is_warm_standby_enabled, wait_for_api, get_venv_python, api_request
+
+# 各命令預設使用的設定組合 (定義在服務端的 profiles.json)；
+# 命令 URL 也可以用 "命令:設定組合" 指定，例如 ?StartSpeechRecognition:meeting
+COMMAND_PROFILES = {
+    "StartSpeechRecognition": "dictation",
+    "StartCommandRecognition": "fast-commands",
+    "StartContinuousRecognition": "long-form"
+}
+
+
+def parse_command(args):
+    """把命令 URL 的參數拆成 (命令, 設定組合)"""
+    command, _, profile = (args or "").partition(":")
+    return command, profile or COMMAND_PROFILES.get(command, "dictation")
+
+class PartialPoller:
+    """單次辨識期間定期向服務查詢已先行辨識的暫定文字，交給 ProvisionalText 顯示 (更新頻率由它限制)"""
+
+    def __init__(self, request_id, provisional, interval=0.3):
+        self.request_id = request_id
+        self.provisional = provisional
+        self.interval = interval
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self._poll, name='recognize-partial', daemon=True)
+        self.thread.start()
+
+    def _poll(self):
+        last = ""
+        while not self.done.wait(self.interval):
+            data = api_request("GET", f"/recognize/partial?id={self.request_id}", timeout=2.0)
+            if self.done.is_set():
+                return
+            if data and data.get("partial") and data["partial"] != last:
+                last = data["partial"]
+                self.provisional.update(last)
+
+    def stop(self):
+        self.done.set()
+        self.thread.join(3.0)
+
+
+class SupervisorShutdown(unohelper.Base, XTerminateListener):
+    """LibreOffice 結束時停止 API 服務的監管程式，結束它啟動的服務並釋放監管程式鎖"""
+
+    def queryTermination(self, event):
+        pass
+
+    def notifyTermination(self, event):
+        # 沒有啟動過監管程式時不必匯入
+        supervisor = sys.modules.get('api_supervisor')
+        if supervisor is not None:
+            supervisor.stop_supervisor()
+
+    def disposing(self, source):
+        pass
+
+
+# 每個 LibreOffice 進程只註冊一次
+_supervisor_shutdown = None
+
+
+def register_supervisor_shutdown(desktop):
+    global _supervisor_shutdown
+    if _supervisor_shutdown is None:
+        _supervisor_shutdown = SupervisorShutdown()
+        desktop.addTerminateListener(_supervisor_shutdown)
+
+
+# 進行中的單次辨識；辨識在背景執行緒進行，期間再觸發語音命令不另外開始辨識
+_recognition_thread = None
+_recognition_lock = threading.Lock()
+
+
+def recognition_running():
+    with _recognition_lock:
+        return _recognition_thread is not None and _recognition_thread.is_alive()
+
 
 class SpeechToTextJob(unohelper.Base, XJobExecutor):
     def __init__(self, ctx):
@@ -35,6 +117,11 @@ class SpeechToTextJob(unohelper.Base, XJobExecutor):
                     "com.sun.star.frame.Desktop", self.ctx
                 )
             logging.debug("Desktop service initialized")
+
+            try:
+                register_supervisor_shutdown(self.desktop)
+            except Exception as e:
+                logging.error(f"無法註冊結束監聽器: {e}")
             
             # 檢查首次安裝
             self.check_first_install()
@@ -170,17 +257,9 @@ class SpeechToTextJob(unohelper.Base, XJobExecutor):
                 result = show_message_box(self.ctx, message, "安裝必要模組", QUERYBOX, BUTTONS_YES_NO)
                 
                 if result == YES:
-                    # 直接在Python中安裝模組，無需批次檔
-                    if install_modules_directly(self.ctx):
-                        # 安裝成功後，嘗試立即啟動 API 服務
-                        logging.debug("模組安裝成功，嘗試啟動 API 服務")
-                        if start_api_server():
-                            logging.debug("API 服務已自動啟動")
-                        return
-                    else:
-                        # 安裝失敗
-                        show_message_box(self.ctx, "缺少必要模組，語音辨識功能可能無法正常運作。", "警告", WARNINGBOX)
-                        return
+                    # 在背景安裝模組，進度顯示在狀態列，安裝期間可繼續編輯文件
+                    start_install_task(self.ctx, self.on_install_done)
+                    return
                 else:
                     # 如果用戶選擇不安裝，顯示警告
                     show_message_box(self.ctx, "缺少必要模組，語音辨識功能可能無法正常運作。", "警告", WARNINGBOX)
@@ -194,14 +273,8 @@ class SpeechToTextJob(unohelper.Base, XJobExecutor):
                 flask_dir = home_path / '.libreoffice' / 'speech_api'
                 flask_dir.mkdir(parents=True, exist_ok=True)
                 
-                # 尋找虛擬環境中的 Python
-                venv_python = home_path / '.libreoffice' / 'python_env' / 'venv' / 'Scripts' / 'python.exe'
-                
                 # 創建API腳本文件，如果存在虛擬環境則使用它
-                if venv_python.exists():
-                    create_api_script(flask_dir, venv_python)
-                else:
-                    create_api_script(flask_dir)
+                create_api_script(flask_dir, get_venv_python())
                 
                 # 創建標記檔，表示已安裝完成
                 config_marker.parent.mkdir(parents=True, exist_ok=True)
@@ -241,8 +314,37 @@ class SpeechToTextJob(unohelper.Base, XJobExecutor):
             # 不顯示詳細錯誤，只顯示通用消息，避免嚇到用戶
             # show_message_box(self.ctx, f"安裝檢查過程中發生錯誤：{str(e)}", "錯誤", ERRORBOX)
 
+    def on_install_done(self, success, phase_summary):
+        """背景安裝完成後的回呼 (在安裝執行緒中執行)"""
+        if not success:
+            show_message_box(self.ctx, "缺少必要模組，語音辨識功能可能無法正常運作。", "警告", WARNINGBOX)
+            return
+        # 安裝成功後，嘗試立即啟動 API 服務
+        logging.debug("模組安裝成功，嘗試啟動 API 服務")
+        if start_api_server():
+            logging.debug("API 服務已自動啟動")
+            message = "已成功安裝必要模組並啟動語音辨識服務。您可以開始使用該功能了。"
+        else:
+            message = "已成功安裝必要模組，但無法自動啟動服務。點擊語音辨識按鈕時將再次嘗試啟動。"
+        show_message_box(self.ctx, f"{message}\n\n各階段耗時：\n{phase_summary}", "安裝成功", INFOBOX)
+
     def trigger(self, args):
         logging.debug(f"Trigger called with args: {args}")
+        # 背景安裝進行中時不執行語音辨識，提供取消選項
+        task = get_install_task()
+        if task is not None and task.is_running():
+            result = show_message_box(self.ctx, "語音辨識模組正在背景安裝中 (進度顯示在狀態列)。\n\n要取消安裝嗎？", "安裝中", QUERYBOX, BUTTONS_YES_NO)
+            if result == YES:
+                task.cancel()
+            return
+        # 連續聽寫以「Continuous Dictation」切換：再按一次或按「Stop Speech Recognition」停止。
+        # 聽寫期間麥克風由服務占用，其他語音命令同樣只停止聽寫，不另外開始辨識
+        dictation = get_active_dictation()
+        if dictation is not None:
+            dictation.stop()
+            return
+        if parse_command(args)[0] == "StopSpeechRecognition" or recognition_running():
+            return
         try:
             # 添加嵌入式HTTP客戶端代碼 - 不需要requests模組
             import sys
@@ -316,8 +418,12 @@ class SpeechToTextJob(unohelper.Base, XJobExecutor):
             # 檢查API服務是否啟動
             self.ensure_api_running()
         
-            # 執行語音辨識
-            self.start_speech_to_text()
+            # 執行語音辨識，命令 URL 決定使用的設定組合 (profiles.json)
+            command, profile = parse_command(args)
+            if command == "StartContinuousRecognition":
+                self.start_continuous_dictation(profile)
+            else:
+                self.start_speech_to_text(profile)
         except Exception as e:
             logging.error(f"Error in trigger: {e}")
             show_message_box(self.ctx, f"執行語音辨識時發生錯誤：{str(e)}", "語音辨識錯誤", ERRORBOX)
@@ -330,6 +436,10 @@ class SpeechToTextJob(unohelper.Base, XJobExecutor):
             requests.get("http://127.0.0.1:5000")
             logging.debug("API service is running")
         except Exception:  # 不再區分具體異常類型
+            # 熱備援模式下，備援實例會在主實例結束後立即接手，先短暫等待
+            if is_warm_standby_enabled() and wait_for_api(2.0):
+                logging.debug("API 服務已由熱備援實例接手")
+                return
             # 檢查是否已安裝為Windows服務
             try:
                 # 檢查服務狀態
@@ -379,10 +489,7 @@ class SpeechToTextJob(unohelper.Base, XJobExecutor):
                 if result == YES:
                     # 使用Python直接啟動API，避免使用批次檔
                     if start_api_server():
-                        # 給API一些啟動時間
-                        import time
-                        time.sleep(3)
-                    
+                        # start_api_server 會等到服務回應後才返回，不需再等待
                         # 再次檢查API是否運行
                         try:
                             requests.get("http://127.0.0.1:5000")
@@ -399,8 +506,9 @@ class SpeechToTextJob(unohelper.Base, XJobExecutor):
                 else:
                     raise Exception("無法使用語音辨識，API服務未運行")
 
-    def start_speech_to_text(self):
-        logging.debug("Starting speech to text")
+    def start_speech_to_text(self, profile="dictation"):
+        global _recognition_thread
+        logging.debug(f"Starting speech to text (profile: {profile})")
         try:
             # 獲取當前文件
             model = self.desktop.getCurrentComponent()
@@ -411,69 +519,85 @@ class SpeechToTextJob(unohelper.Base, XJobExecutor):
                 show_message_box(self.ctx, "請在文字文件中使用此功能", "語音辨識錯誤", ERRORBOX)
                 return
             
-            text = model.Text
-            
-            # 获取当前光标位置
-            controller = model.getCurrentController()
-            view_cursor = controller.getViewCursor()
-            
-            # 显示正在聆听消息（创建临时cursor用于此消息）
-            temp_cursor = text.createTextCursorByRange(view_cursor.getStart())
-            listening_text = "正在聆聽..."
-            text.insertString(temp_cursor, listening_text, 0)
-        
-            try:
+            # 聆聽狀態顯示在狀態列；說話期間已辨識完成的片段以暫定文字顯示在游標位置
+            inserter = DocumentInserter(model)
+            inserter.show_status("正在聆聽...")
+            # 辨識請求在背景執行緒等待，UI 執行緒不被占住；文件操作經 AsyncCallback 回到主執行緒執行
+            dispatch = MainThreadDispatcher(self.ctx)
+            provisional = ProvisionalText(inserter, dispatch=dispatch)
+            with _recognition_lock:
+                _recognition_thread = threading.Thread(
+                    target=self.recognize_in_background, args=(profile, inserter, provisional, dispatch),
+                    name='speech-to-text', daemon=True)
+                _recognition_thread.start()
+
+        except Exception as e:
+            logging.error(f"Error in start_speech_to_text: {e}")
+            show_message_box(self.ctx, f"語音辨識發生錯誤：{str(e)}", "語音辨識錯誤", ERRORBOX)
+
+    def recognize_in_background(self, profile, inserter, provisional, dispatch):
+        """在背景執行緒呼叫辨識服務，期間輪詢暫定文字；結果交回主執行緒插入文件"""
+        poller = None
+        status_code, result, error = None, None, None
+        try:
+            remote = load_remote_config()
+            if remote is not None:
+                # 用戶端模式 (remote.json)：本機擷取語音，交給區域網路上的共用服務辨識
+                result = recognize_remote(remote, profile)
+                status_code = 200
+            else:
                 # 呼叫API進行語音辨識 - 使用更长的参数值
+                import uuid
                 import requests
+                request_id = uuid.uuid4().hex
+                poller = PartialPoller(request_id, provisional)
                 response = requests.post(
                     "http://127.0.0.1:5000/recognize",
-                    json_data={
-                        "language": "zh-TW", 
-                        "timeout": 15,         # 增加到15秒
-                        "pause_threshold": 8.0, # 增加到8秒无声才结束
-                        "non_speaking_duration": 1.5  # 增加检测静音阈值
-                    }
+                    json_data={"profile": profile, "request_id": request_id}
                 )
-                
-                # 删除"正在聆听..."消息 - 修复删除操作
-                try:
-                    # 创建新的光标范围来选择之前插入的文本
-                    delete_cursor = text.createTextCursorByRange(view_cursor.getStart())
-                    # 移动光标选择"正在聆聽..."
-                    delete_cursor.goLeft(len(listening_text), True)
-                    # 删除选中的文本
-                    delete_cursor.setString("")
-                except Exception as delete_error:
-                    logging.error(f"删除临时文本错误: {delete_error}")
-                    # 如果删除失败，继续处理识别结果
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    if result.get("success"):
-                        recognized_text = result.get("text", "")
-                        # 在当前光标位置插入识别结果
-                        text.insertString(view_cursor, recognized_text, 0)
-                    else:
-                        error_msg = result.get("error", "未知錯誤")
-                        show_message_box(self.ctx, f"辨識失敗：{error_msg}", "語音辨識錯誤", WARNINGBOX)
-                else:
-                    show_message_box(self.ctx, f"API服務錯誤：HTTP狀態碼 {response.status_code}", "語音辨識錯誤", ERRORBOX)
-                
-            except Exception as e:
-                # 删除"正在聆听..."消息 - 在异常处理中也使用相同的修复方法
-                try:
-                    delete_cursor = text.createTextCursorByRange(view_cursor.getStart())
-                    delete_cursor.goLeft(len(listening_text), True)
-                    delete_cursor.setString("")
-                except:
-                    logging.error("无法删除临时提示文本")
-                
-                show_message_box(self.ctx, f"API請求錯誤：{str(e)}", "語音辨識錯誤", ERRORBOX)
-                logging.error(f"API request error: {e}")
-        
+                status_code = response.status_code
+                result = response.json() if status_code == 200 else None
         except Exception as e:
-            logging.error(f"Error in start_speech_to_text: {e}")
-            show_message_box(self.ctx, f"語音辨識發生錯誤：{str(e)}", "語音辨識錯誤", ERRORBOX)
+            error = e
+            logging.error(f"API request error: {e}")
+        finally:
+            if poller is not None:
+                # 暫定文字不再更新後才定稿，避免定稿後又出現暫定文字
+                poller.stop()
+        dispatch(lambda: self.finish_speech_to_text(inserter, provisional, status_code, result, error))
+
+    def finish_speech_to_text(self, inserter, provisional, status_code, result, error):
+        """在主執行緒插入辨識結果或顯示錯誤"""
+        inserter.clear_status()
+        if error is not None:
+            provisional.discard()
+            show_message_box(self.ctx, f"API請求錯誤：{str(error)}", "語音辨識錯誤", ERRORBOX)
+        elif status_code == 200:
+            if result.get("success"):
+                recognized_text = result.get("text", "")
+                # 以最終結果取代暫定文字；沒有暫定文字時直接在游標位置插入 (單一復原動作、一次版面配置)
+                provisional.commit(recognized_text)
+                logging.debug(f"暫定文字統計: {provisional.stats()}")
+            else:
+                provisional.discard()
+                error_msg = result.get("error", "未知錯誤")
+                show_message_box(self.ctx, f"辨識失敗：{error_msg}", "語音辨識錯誤", WARNINGBOX)
+        else:
+            provisional.discard()
+            show_message_box(self.ctx, f"API服務錯誤：HTTP狀態碼 {status_code}", "語音辨識錯誤", ERRORBOX)
+
+    def start_continuous_dictation(self, profile="long-form"):
+        """開始連續聽寫，結果依序插入移動中的游標位置"""
+        logging.debug(f"Starting continuous dictation (profile: {profile})")
+        model = self.desktop.getCurrentComponent()
+        if not hasattr(model, "Text"):
+            logging.error("Current component is not a text document")
+            show_message_box(self.ctx, "請在文字文件中使用此功能", "語音辨識錯誤", ERRORBOX)
+            return
+        # 每秒以目前累積的語音取得一次暫定結果，即時顯示在文件中
+        dictation, error = start_dictation(model, options={"profile": profile}, dispatch=MainThreadDispatcher(self.ctx))
+        if dictation is None:
+            show_message_box(self.ctx, f"無法開始連續聽寫：{error}", "語音辨識錯誤", ERRORBOX)
 
 # Starting from Python IDE
 def main():
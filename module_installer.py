@@ -2,8 +2,15 @@
 # -*- coding: utf-8 -*-
 import sys
 import os
+import re
+import json
+import time
+import shutil
 import subprocess
+import threading
 import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import platform
 
@@ -74,9 +81,591 @@ def fix_venv_permissions():
 # 導入工具函數
 from utils import show_message_box, check_module_installed
 
+class InstallCancelled(Exception):
+    """使用者取消了安裝"""
+
+class InstallProgress:
+    """以 Writer 狀態列顯示安裝進度，無法取得狀態列時只寫入日誌"""
+
+    # 狀態列文字最短更新間隔 (秒)，避免 pip 大量輸出時頻繁呼叫 UNO
+    TEXT_INTERVAL = 0.2
+
+    def __init__(self, ctx, steps):
+        self.indicator = None
+        self.last_text_at = 0.0
+        try:
+            desktop = ctx.getServiceManager().createInstanceWithContext("com.sun.star.frame.Desktop", ctx)
+            frame = desktop.getCurrentFrame()
+            if frame is not None:
+                self.indicator = frame.createStatusIndicator()
+                self.indicator.start("語音辨識模組安裝中", steps)
+        except Exception as e:
+            logging.debug(f"無法取得狀態列: {e}")
+
+    def set_text(self, text, force=False):
+        now = time.monotonic()
+        if self.indicator is None or (not force and now - self.last_text_at < self.TEXT_INTERVAL):
+            return
+        self.last_text_at = now
+        try:
+            self.indicator.setText(text[:120])
+        except Exception:
+            pass
+
+    def set_value(self, value):
+        if self.indicator is not None:
+            try:
+                self.indicator.setValue(value)
+            except Exception:
+                pass
+
+    def end(self):
+        if self.indicator is not None:
+            try:
+                self.indicator.end()
+            except Exception:
+                pass
+            self.indicator = None
+
+class InstallTask:
+    """在背景執行緒執行安裝：串流子行程輸出、記錄各階段耗時，並可隨時取消"""
+
+    # 安裝流程的階段數 (狀態列進度範圍)
+    PHASE_COUNT = 5
+
+    def __init__(self, ctx, on_done=None):
+        self.ctx = ctx
+        self.on_done = on_done
+        self.cancel_event = threading.Event()
+        self.process = None
+        self.phases = []
+        self.current_phase = None
+        self.progress = None
+        self.thread = None
+        self.result = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name='module-installer', daemon=True)
+        self.thread.start()
+
+    def is_running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def cancel(self):
+        """要求取消安裝，並結束正在執行的子行程"""
+        logging.info("使用者要求取消安裝")
+        self.cancel_event.set()
+        process = self.process
+        if process is not None and process.poll() is None:
+            process.terminate()
+
+    def check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise InstallCancelled()
+
+    def begin_phase(self, name):
+        """結束上一個階段並開始新階段"""
+        self.check_cancelled()
+        self.end_phase()
+        self.current_phase = (name, time.monotonic())
+        logging.info(f"安裝階段: {name}")
+        if self.progress is not None:
+            self.progress.set_text(name, force=True)
+
+    def end_phase(self):
+        if self.current_phase is not None:
+            name, started = self.current_phase
+            self.phases.append((name, time.monotonic() - started))
+            self.current_phase = None
+            if self.progress is not None:
+                self.progress.set_value(len(self.phases))
+
+    def phase_summary(self):
+        return "\n".join(f"{name}: {seconds:.1f} 秒" for name, seconds in self.phases)
+
+    def _run(self):
+        global _current_task
+        self.progress = InstallProgress(self.ctx, self.PHASE_COUNT)
+        try:
+            self.result = install_modules_directly(self.ctx, self)
+        except Exception as e:
+            logging.error(f"背景安裝發生錯誤: {e}")
+            self.result = False
+        finally:
+            self.end_phase()
+            self.progress.end()
+            logging.info("安裝各階段耗時:\n" + self.phase_summary())
+            with _task_lock:
+                _current_task = None
+        if self.on_done is not None:
+            try:
+                self.on_done(self.result, self.phase_summary())
+            except Exception as e:
+                logging.error(f"安裝完成回呼發生錯誤: {e}")
+
+_current_task = None
+_task_lock = threading.Lock()
+
+def start_install_task(ctx, on_done=None):
+    """在背景開始安裝，已有安裝進行中時回傳該工作"""
+    global _current_task
+    with _task_lock:
+        if _current_task is not None and _current_task.is_running():
+            return _current_task
+        _current_task = InstallTask(ctx, on_done)
+        _current_task.start()
+        return _current_task
+
+def get_install_task():
+    """取得進行中的安裝工作，沒有時回傳 None"""
+    with _task_lock:
+        return _current_task
+
+def notify_progress(ctx, task, message, title):
+    """背景安裝時更新狀態列，同步安裝時沿用訊息對話框"""
+    if task is not None:
+        logging.info(message)
+        task.progress.set_text(message.splitlines()[0], force=True)
+    else:
+        show_message_box(ctx, message, title, 1)
+
+def run_command(args, task=None, tail_lines=50):
+    """執行子行程並逐行串流輸出到日誌與狀態列
+
+    只保留最後 tail_lines 行輸出 (放在 stdout 與 stderr) 供錯誤訊息使用，
+    取消安裝時結束子行程並拋出 InstallCancelled。
+    """
+    tail = deque(maxlen=tail_lines)
+    process = subprocess.Popen(
+        [str(a) for a in args],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        errors='replace'
+    )
+    if task is not None:
+        task.process = process
+    try:
+        for line in process.stdout:
+            line = line.rstrip()
+            if not line:
+                continue
+            tail.append(line)
+            logging.debug(f"[{Path(str(args[0])).name}] {line}")
+            if task is not None:
+                task.progress.set_text(line)
+                if task.cancel_event.is_set():
+                    process.terminate()
+        process.wait()
+    finally:
+        if task is not None:
+            task.process = None
+    if task is not None:
+        task.check_cancelled()
+    output = "\n".join(tail)
+    return subprocess.CompletedProcess(args=args, returncode=process.returncode, stdout=output, stderr=output)
+
+# 必要模組
+REQUIREMENTS = ["SpeechRecognition", "pyaudio", "flask", "requests"]
+# 選用模組：一併安裝，但缺少時不觸發修復 (服務改用 werkzeug 伺服器)
+OPTIONAL_REQUIREMENTS = ["waitress"]
+
+# 目標 Python 的 wheel 標籤，例如 cp39-win_amd64
+PYTHON_TAG_EXPR = "'cp%d%d-%s' % (sys.version_info[0], sys.version_info[1], sysconfig.get_platform().replace('-', '_').replace('.', '_'))"
+PYTHON_TAG_CODE = f"import sys, sysconfig; print({PYTHON_TAG_EXPR})"
+
+def get_python_tag(python_exe):
+    """查詢 Python 的版本與平台標籤，用於區分不同直譯器的 wheel 快取"""
+    result = subprocess.run(
+        [str(python_exe), "-c", PYTHON_TAG_CODE],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"無法取得 Python 標籤: {result.stderr}")
+    return result.stdout.strip()
+
+def get_wheelhouse_dir(python_tag):
+    """本機 wheel 快取目錄 (依 Python 版本與平台區分)"""
+    return Path.home() / '.libreoffice' / 'wheelhouse' / python_tag
+
+def get_bundled_wheelhouse():
+    """與 .oxt 一起發佈的 wheelhouse 目錄，不存在時回傳 None"""
+    bundled = Path(os.path.dirname(os.path.abspath(__file__))) / 'wheelhouse'
+    return bundled if bundled.is_dir() else None
+
+def get_lock_file(python_tag):
+    """已解析的版本鎖定檔，重新安裝時直接使用固定版本 (與 wheelhouse 一樣依 Python 版本與平台區分)"""
+    return Path.home() / '.libreoffice' / 'python_env' / f'requirements-{python_tag}.lock'
+
+def read_lock_file(python_tag):
+    """讀取鎖定檔的固定版本，不存在或標頭的 Python 標籤不符時回傳 None"""
+    lock_file = get_lock_file(python_tag)
+    try:
+        with open(lock_file, 'r', encoding='utf-8') as f:
+            lines = [line.strip() for line in f]
+    except OSError:
+        return None
+    if not lines or lines[0] != f"# python: {python_tag}":
+        logging.info(f"鎖定檔 {lock_file} 不是 {python_tag} 的版本，不使用")
+        return None
+    return [line for line in lines[1:] if line and not line.startswith("#") and "==" in line]
+
+def write_lock_file(venv_python, python_tag):
+    """將虛擬環境中實際安裝的版本寫入鎖定檔"""
+    result = subprocess.run(
+        [str(venv_python), "-m", "pip", "freeze"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True
+    )
+    if result.returncode != 0:
+        logging.warning(f"無法取得已安裝版本: {result.stderr}")
+        return False
+    pins = [line.strip() for line in result.stdout.splitlines() if "==" in line]
+    lock_file = get_lock_file(python_tag)
+    lock_file.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_file, 'w', encoding='utf-8') as f:
+        f.write(f"# python: {python_tag}\n")
+        f.write("\n".join(pins) + "\n")
+    logging.info(f"已寫入版本鎖定檔: {lock_file}")
+    return True
+
+# 一次取得虛擬環境的版本、已安裝套件與必要模組是否可匯入
+VENV_INSPECT_CODE = """
+import sys, sysconfig, json, importlib.util
+try:
+    from importlib import metadata
+except ImportError:
+    import importlib_metadata as metadata
+installed = {}
+for dist in metadata.distributions():
+    name = dist.metadata['Name']
+    if name:
+        installed[name] = dist.version
+print(json.dumps({
+    "version": "%d.%d.%d" % sys.version_info[:3],
+    "tag": """ + PYTHON_TAG_EXPR + """,
+    "installed": installed,
+    "importable": {m: importlib.util.find_spec(m) is not None for m in ('speech_recognition', 'pyaudio', 'flask', 'requests')},
+}))
+"""
+
+# 必要套件名稱與其匯入模組名稱
+REQUIRED_IMPORTS = {"SpeechRecognition": "speech_recognition", "pyaudio": "pyaudio", "flask": "flask", "requests": "requests"}
+
+def canonical_name(name):
+    """套件名稱正規化 (PEP 503)"""
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+def venv_matches_interpreter(venv_dir, python_exe):
+    """檢查虛擬環境是否由同一個基底 Python 建立 (比對 pyvenv.cfg 的 home)"""
+    try:
+        config = {}
+        with open(venv_dir / "pyvenv.cfg", 'r', encoding='utf-8') as f:
+            for line in f:
+                if "=" in line:
+                    key, value = line.split("=", 1)
+                    config[key.strip()] = value.strip()
+        home = Path(config.get("home", ""))
+        return home.resolve() == Path(python_exe).parent.resolve()
+    except Exception as e:
+        logging.info(f"無法讀取虛擬環境設定: {e}")
+        return False
+
+def inspect_venv(venv_python, major_version):
+    """以單一子行程驗證虛擬環境並取得已安裝套件，無法使用或版本不符時回傳 None"""
+    try:
+        result = subprocess.run(
+            [str(venv_python), "-c", VENV_INSPECT_CODE],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            timeout=60
+        )
+        if result.returncode != 0:
+            logging.info(f"虛擬環境無法執行: {result.stderr}")
+            return None
+        state = json.loads(result.stdout.strip().splitlines()[-1])
+        if not state["version"].startswith(f"{major_version}."):
+            logging.info(f"虛擬環境 Python 版本 {state['version']} 與需要的 {major_version} 不符")
+            return None
+        return state
+    except Exception as e:
+        logging.info(f"檢查虛擬環境失敗: {e}")
+        return None
+
+def diff_requirements(venv_state):
+    """比對鎖定檔 (或必要模組清單) 與已安裝套件，回傳需要安裝的套件規格"""
+    installed = {canonical_name(name): version for name, version in venv_state["installed"].items()}
+    specs = []
+    for line in read_lock_file(venv_state["tag"]) or []:
+        name, version = line.split("==", 1)
+        if installed.get(canonical_name(name)) != version:
+            specs.append(line)
+    # 鎖定檔之外，仍確認必要模組都能匯入
+    pinned = {canonical_name(spec.split("==", 1)[0]) for spec in specs}
+    for package, module in REQUIRED_IMPORTS.items():
+        if canonical_name(package) in pinned:
+            continue
+        if canonical_name(package) not in installed or not venv_state["importable"].get(module, False):
+            specs.append(package)
+    return specs
+
+def install_requirements(venv_python, requirements_file, use_lock=True, task=None):
+    """安裝必要模組，優先使用本機 wheelhouse 離線安裝
+
+    1. 有同一 Python 標籤的鎖定檔時以 --no-index 從 wheelhouse 安裝固定版本
+    2. 否則嘗試只用 wheelhouse (含隨 .oxt 發佈的 wheelhouse) 離線安裝
+    3. 都失敗時才連網：將缺少的 wheel 下載/建置一次存入 wheelhouse 後再離線安裝
+    use_lock=False 時只安裝 requirements_file 中列出的套件 (用於修復)。
+    回傳最後一個 pip 步驟的 CompletedProcess。
+    """
+    python_tag = get_python_tag(venv_python)
+    wheelhouse = get_wheelhouse_dir(python_tag)
+    wheelhouse.mkdir(parents=True, exist_ok=True)
+    find_links = ["--find-links", str(wheelhouse)]
+    bundled = get_bundled_wheelhouse()
+    if bundled is not None:
+        find_links += ["--find-links", str(bundled)]
+
+    def pip(*args):
+        return run_command([str(venv_python), "-m", "pip"] + list(args), task)
+
+    # 1/2. 離線安裝 (換了直譯器時，其他標籤的鎖定檔與 wheelhouse 不對應，不使用)
+    lock_file = get_lock_file(python_tag)
+    use_lock = use_lock and read_lock_file(python_tag) is not None
+    sources = [lock_file, requirements_file] if use_lock else [requirements_file]
+    for source in sources:
+        logging.info(f"嘗試從 wheelhouse 離線安裝: {source}")
+        result = pip("install", "--no-index", *find_links, "-r", str(source))
+        if result.returncode == 0:
+            if source != lock_file:
+                write_lock_file(venv_python, python_tag)
+            return result
+        logging.info("wheelhouse 缺少部分套件，改為連網下載")
+
+    # 3. 連網補齊 wheelhouse (PyAudio 等需要編譯的套件只會建置一次)
+    logging.info("升級 pip")
+    pip("install", "--upgrade", "pip")
+    source = lock_file if use_lock else requirements_file
+    logging.info(f"下載並建置 wheel 到 {wheelhouse}")
+    result = pip("wheel", *find_links, "--wheel-dir", str(wheelhouse), "-r", str(source))
+    if result.returncode == 0:
+        result = pip("install", "--no-index", *find_links, "-r", str(source))
+    if result.returncode != 0:
+        # wheel 建置失敗時退回一般安裝，保留 pip 的錯誤訊息
+        logging.warning(f"wheelhouse 安裝失敗，改用一般安裝: {result.stderr}")
+        result = pip("install", "-r", str(requirements_file))
+    if result.returncode == 0:
+        write_lock_file(venv_python, python_tag)
+    return result
+
+# 直譯器探索結果快取：以候選路徑 (實際路徑與修改時間) 為鍵，
+# 只有 LibreOffice 或系統 Python 的安裝變更時才重新探索
+DISCOVERY_CACHE = Path.home() / '.libreoffice' / 'python_env' / 'discovery.json'
+DISCOVERY_CACHE_VERSION = 1
+
+VERSION_PROBE_CODE = "import sys; print('.'.join(map(str, sys.version_info[:3])))"
+
+def path_fingerprint(path):
+    """回傳路徑的 [實際路徑, 修改時間]，不存在時回傳 None"""
+    try:
+        real_path = os.path.realpath(str(path))
+        return [real_path, os.stat(real_path).st_mtime_ns]
+    except OSError:
+        return None
+
+def load_discovery_cache():
+    try:
+        with open(DISCOVERY_CACHE, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+        if cache.get('version') == DISCOVERY_CACHE_VERSION:
+            return cache
+    except (OSError, ValueError, AttributeError):
+        pass
+    return {'version': DISCOVERY_CACHE_VERSION, 'lo': {}, 'interpreters': {}}
+
+def save_discovery_cache(cache):
+    try:
+        DISCOVERY_CACHE.parent.mkdir(parents=True, exist_ok=True)
+        temp_file = DISCOVERY_CACHE.with_suffix('.tmp')
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, indent=2)
+        os.replace(temp_file, DISCOVERY_CACHE)
+    except OSError as e:
+        logging.warning(f"無法寫入直譯器探索快取: {e}")
+
+def get_lo_program_dirs(system, home_path):
+    """LibreOffice 可能的程式目錄 (其中的 python-core-* 目錄名稱包含 Python 版本)"""
+    if system == "Windows":
+        return [Path("C:\\Program Files\\LibreOffice\\program")]
+    if system == "Darwin":
+        return [
+            Path("/Applications/LibreOffice.app/Contents/Resources"),
+            Path(home_path / "Applications/LibreOffice.app/Contents/Resources")
+        ]
+    return [
+        Path("/usr/lib/libreoffice/program"),
+        Path("/opt/libreoffice/program"),
+        Path("/usr/lib64/libreoffice/program")  # 某些發行版
+    ]
+
+def get_interpreter_candidates(system, major_version, home_path):
+    """依作業系統列出可能與 LibreOffice 相容的 Python 執行檔"""
+    if system == "Windows":
+        candidates = []
+        # 1. Windows 註冊表中登記的 Python
+        import winreg
+        key_path = f"Software\\Python\\PythonCore\\{major_version}\\InstallPath"
+        for hive in (winreg.HKEY_CURRENT_USER, winreg.HKEY_LOCAL_MACHINE):
+            try:
+                key = winreg.OpenKey(hive, key_path)
+                candidates.append(Path(winreg.QueryValue(key, "")) / "python.exe")
+            except OSError:
+                pass
+        # 2. 常見 Windows 路徑
+        version_dir = major_version.replace('.', '')
+        candidates += [
+            Path(f"C:\\Python{version_dir}\\python.exe"),
+            Path(f"C:\\Program Files\\Python{version_dir}\\python.exe"),
+            Path(f"C:\\Program Files (x86)\\Python{version_dir}\\python.exe"),
+            home_path / "AppData" / "Local" / "Programs" / "Python" / f"Python{version_dir}" / "python.exe"
+        ]
+        return candidates
+    if system == "Darwin":
+        return [
+            Path(f"/usr/local/bin/python{major_version}"),
+            Path(f"/usr/bin/python{major_version}"),
+            Path(f"/opt/homebrew/bin/python{major_version}"),
+            Path(f"{home_path}/Library/Python/{major_version}/bin/python{major_version}"),
+            # 也檢查沒有版本號的 python3
+            Path("/usr/bin/python3"),
+            Path("/usr/local/bin/python3"),
+            Path("/opt/homebrew/bin/python3")
+        ]
+    return [
+        Path(f"/usr/bin/python{major_version}"),
+        Path(f"/usr/local/bin/python{major_version}"),
+        Path(f"{home_path}/.local/bin/python{major_version}"),
+        # 也檢查沒有版本號的 python3
+        Path("/usr/bin/python3"),
+        Path("/usr/local/bin/python3")
+    ]
+
+def find_lo_python_version(lo_dirs, cache):
+    """從 LibreOffice 程式目錄下的 python-core-* 取得 Python 版本，目錄未變更時使用快取"""
+    entries = cache.setdefault('lo', {})
+    for lo_dir in lo_dirs:
+        key = str(lo_dir)
+        fingerprint = path_fingerprint(lo_dir)
+        if fingerprint is None:
+            entries.pop(key, None)
+            continue
+        entry = entries.get(key)
+        if entry is None or entry.get('fingerprint') != fingerprint:
+            version = None
+            for core_dir in sorted(lo_dir.glob('python-core-*')):
+                match = re.search(r'python-core-(\d+\.\d+\.\d+)', core_dir.name)
+                if match:
+                    version = match.group(1)
+                    break
+            entry = {'fingerprint': fingerprint, 'version': version}
+            entries[key] = entry
+        if entry['version']:
+            logging.info(f"找到 LibreOffice Python 版本: {entry['version']} ({lo_dir})")
+            return entry['version']
+    return None
+
+def probe_interpreter_versions(paths, cache, max_workers=8):
+    """並行取得各候選直譯器的版本 (x.y.z)，執行檔未變更時使用快取
+
+    回傳 {路徑字串: 版本或 None}，不存在的路徑不會出現在結果中。
+    """
+    entries = cache.setdefault('interpreters', {})
+    versions = {}
+    pending = {}
+    for path in paths:
+        key = str(path)
+        fingerprint = path_fingerprint(path)
+        if fingerprint is None:
+            entries.pop(key, None)
+            continue
+        entry = entries.get(key)
+        if entry is not None and entry.get('fingerprint') == fingerprint:
+            versions[key] = entry.get('version')
+        else:
+            pending[key] = fingerprint
+
+    def probe(executable):
+        try:
+            result = subprocess.run(
+                [executable, "-c", VERSION_PROBE_CODE],
+                capture_output=True,
+                text=True,
+                timeout=15
+            )
+            if result.returncode == 0:
+                return result.stdout.strip()
+        except (OSError, subprocess.SubprocessError) as e:
+            logging.info(f"檢查版本時出錯: {executable}: {e}")
+        return None
+
+    if pending:
+        logging.debug(f"檢查直譯器版本: {', '.join(pending)}")
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(pending))) as pool:
+            for key, version in zip(pending, pool.map(probe, pending)):
+                entries[key] = {'fingerprint': pending[key], 'version': version}
+                versions[key] = version
+    return versions
+
+def version_matches(version, major_version):
+    return bool(version) and (version == major_version or version.startswith(f"{major_version}."))
+
+def discover_python(system, home_path):
+    """找出 LibreOffice 的 Python 版本與相容的直譯器
+
+    回傳 (LibreOffice Python 版本, 相容直譯器路徑)，找不到時對應的值為 None。
+    """
+    cache = load_discovery_cache()
+    lo_python_version = find_lo_python_version(get_lo_program_dirs(system, home_path), cache)
+
+    # 找不到特定版本時，使用系統 Python 的版本 (Windows 除外)
+    if not lo_python_version and system != "Windows":
+        system_python = "/usr/bin/python3" if system == "Darwin" else shutil.which("python3")
+        if system_python:
+            lo_python_version = probe_interpreter_versions([system_python], cache).get(system_python)
+        if lo_python_version:
+            logging.info(f"使用系統 Python 版本: {lo_python_version}")
+        else:
+            lo_python_version = "3.9.0"  # 默認版本
+            logging.info(f"無法檢測版本，使用默認版本: {lo_python_version}")
+
+    python_exe = None
+    if lo_python_version:
+        major_version = '.'.join(lo_python_version.split('.')[:2])
+        candidates = get_interpreter_candidates(system, major_version, home_path)
+        if system == "Windows":
+            # Windows 候選路徑本身已對應版本，只需確認存在
+            python_exe = next((path for path in candidates if path.exists()), None)
+        else:
+            versions = probe_interpreter_versions(candidates, cache)
+            python_exe = next((path for path in candidates if version_matches(versions.get(str(path)), major_version)), None)
+        if python_exe is not None:
+            logging.info(f"找到匹配的 Python {major_version}: {python_exe}")
+        else:
+            logging.info(f"沒有找到匹配的 Python {major_version}")
+
+    save_discovery_cache(cache)
+    return lo_python_version, python_exe
+
 # 直接在Python中執行安裝，避免版本不兼容
-def install_modules_directly(ctx):
-    """自動化安裝匹配版本的 Python 與必要模組，使用用戶目錄避免權限問題"""
+def install_modules_directly(ctx, task=None):
+    """自動化安裝匹配版本的 Python 與必要模組，使用用戶目錄避免權限問題
+
+    task 為 InstallTask 時 (背景安裝)，進度顯示在狀態列並可取消。
+    """
     try:
         # 確保所有必要的模組都已導入
         import sys
@@ -84,7 +673,6 @@ def install_modules_directly(ctx):
         import subprocess
         import shutil
         import tempfile
-        import re
         import urllib.request
         from pathlib import Path
         
@@ -116,102 +704,14 @@ def install_modules_directly(ctx):
         user_python_dir.mkdir(parents=True, exist_ok=True)
         
         # 顯示安裝開始訊息
-        show_message_box(ctx, "正在檢測環境並準備安裝必要模組，請稍候...\n這可能需要幾分鐘時間。", "安裝準備中", 1)
-        
-        # 根據不同操作系統查找 LibreOffice 的 Python 版本
-        lo_python_version = None
-        
-        if is_windows:
-            # Windows 路徑
-            lo_program_dir = Path("C:\\Program Files\\LibreOffice\\program")
-            
-            if lo_program_dir.exists():
-                # 尋找 python-core-* 目錄
-                python_cores = list(lo_program_dir.glob('python-core-*'))
-                if python_cores:
-                    for core_dir in python_cores:
-                        # 從目錄名稱提取版本
-                        match = re.search(r'python-core-(\d+\.\d+\.\d+)', str(core_dir))
-                        if match:
-                            lo_python_version = match.group(1)
-                            logging.info(f"找到 LibreOffice Python 版本: {lo_python_version}")
-                            break
-                
-                if not lo_python_version:
-                    # 嘗試使用默認路徑提取版本
-                    default_path = Path("C:\\Program Files\\LibreOffice\\program\\python-core-3.9.21")
-                    if default_path.exists():
-                        lo_python_version = "3.9.21"
-                        logging.info(f"使用默認 LibreOffice Python 版本: {lo_python_version}")
-        
-        elif is_macos:
-            # macOS 路徑
-            lo_app_paths = [
-                Path("/Applications/LibreOffice.app/Contents/Resources"),
-                Path(home_path / "Applications/LibreOffice.app/Contents/Resources")
-            ]
-            
-            for app_path in lo_app_paths:
-                if app_path.exists():
-                    # 查找 python-core-* 目錄
-                    python_cores = list(app_path.glob('python-core-*'))
-                    if python_cores:
-                        for core_dir in python_cores:
-                            match = re.search(r'python-core-(\d+\.\d+\.\d+)', str(core_dir))
-                            if match:
-                                lo_python_version = match.group(1)
-                                logging.info(f"找到 LibreOffice Python 版本: {lo_python_version}")
-                                break
-            
-            # 如果找不到特定版本，嘗試取得目前 Python 版本
-            if not lo_python_version:
-                try:
-                    result = subprocess.run(
-                        ["/usr/bin/python3", "-c", "import sys; print('.'.join(map(str, sys.version_info[:3])))"],
-                        capture_output=True, 
-                        text=True, 
-                        check=True
-                    )
-                    lo_python_version = result.stdout.strip()
-                    logging.info(f"使用系統 Python 版本: {lo_python_version}")
-                except:
-                    lo_python_version = "3.9.0"  # 默認版本
-                    logging.info(f"無法檢測版本，使用默認版本: {lo_python_version}")
+        if task is not None:
+            task.begin_phase("偵測 Python 環境")
+        else:
+            show_message_box(ctx, "正在檢測環境並準備安裝必要模組，請稍候...\n這可能需要幾分鐘時間。", "安裝準備中", 1)
         
-        elif is_linux:
-            # Linux 路徑
-            lo_paths = [
-                Path("/usr/lib/libreoffice/program"),
-                Path("/opt/libreoffice/program"),
-                Path("/usr/lib64/libreoffice/program")  # 某些發行版
-            ]
-            
-            for lo_path in lo_paths:
-                if lo_path.exists():
-                    # 查找 python-core-* 目錄
-                    python_cores = list(lo_path.glob('python-core-*'))
-                    if python_cores:
-                        for core_dir in python_cores:
-                            match = re.search(r'python-core-(\d+\.\d+\.\d+)', str(core_dir))
-                            if match:
-                                lo_python_version = match.group(1)
-                                logging.info(f"找到 LibreOffice Python 版本: {lo_python_version}")
-                                break
-            
-            # 如果找不到特定版本，嘗試取得目前 Python 版本
-            if not lo_python_version:
-                try:
-                    result = subprocess.run(
-                        ["python3", "-c", "import sys; print('.'.join(map(str, sys.version_info[:3])))"],
-                        capture_output=True, 
-                        text=True, 
-                        check=True
-                    )
-                    lo_python_version = result.stdout.strip()
-                    logging.info(f"使用系統 Python 版本: {lo_python_version}")
-                except:
-                    lo_python_version = "3.9.0"  # 默認版本
-                    logging.info(f"無法檢測版本，使用默認版本: {lo_python_version}")
+        # 查找 LibreOffice 的 Python 版本與相容的直譯器 (安裝未變更時使用快取，不執行任何子行程)
+        lo_python_version, python_exe = discover_python(system, home_path)
+        python_installed = python_exe is not None
         
         # 如果無法檢測到版本，提供錯誤訊息
         if not lo_python_version:
@@ -224,113 +724,6 @@ def install_modules_directly(ctx):
         major_version = '.'.join(lo_python_version.split('.')[:2])
         logging.info(f"主要版本號: {major_version}")
         
-        # 檢查和安裝匹配版本的 Python
-        python_installed = False
-        python_exe = None
-        
-        # 根據不同操作系統檢測 Python
-        if is_windows:
-            # 1. 檢查 Windows 註冊表中是否有匹配版本的 Python
-            try:
-                key_path = f"Software\\Python\\PythonCore\\{major_version}\\InstallPath"
-                key = winreg.OpenKey(winreg.HKEY_CURRENT_USER, key_path)
-                install_path = winreg.QueryValue(key, "")
-                python_exe = Path(install_path) / "python.exe"
-                if python_exe.exists():
-                    logging.info(f"在註冊表找到匹配的 Python {major_version}: {python_exe}")
-                    python_installed = True
-            except:
-                try:
-                    key_path = f"Software\\Python\\PythonCore\\{major_version}\\InstallPath"
-                    key = winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, key_path)
-                    install_path = winreg.QueryValue(key, "")
-                    python_exe = Path(install_path) / "python.exe"
-                    if python_exe.exists():
-                        logging.info(f"在註冊表找到匹配的 Python {major_version}: {python_exe}")
-                        python_installed = True
-                except:
-                    logging.info(f"在註冊表沒有找到 Python {major_version}")
-            
-            # 2. 在常見 Windows 路徑尋找 Python
-            if not python_installed:
-                common_paths = [
-                    Path(f"C:\\Python{major_version.replace('.', '')}\\python.exe"),
-                    Path(f"C:\\Program Files\\Python{major_version.replace('.', '')}\\python.exe"),
-                    Path(f"C:\\Program Files (x86)\\Python{major_version.replace('.', '')}\\python.exe"),
-                    home_path / "AppData" / "Local" / "Programs" / "Python" / f"Python{major_version.replace('.', '')}" / "python.exe"
-                ]
-                
-                for path in common_paths:
-                    if path.exists():
-                        python_exe = path
-                        python_installed = True
-                        logging.info(f"在常見路徑找到 Python {major_version}: {python_exe}")
-                        break
-        
-        elif is_macos:
-            # 在 macOS 上常見的 Python 路徑
-            common_paths = [
-                Path(f"/usr/local/bin/python{major_version}"),
-                Path(f"/usr/bin/python{major_version}"),
-                Path(f"/opt/homebrew/bin/python{major_version}"),
-                Path(f"{home_path}/Library/Python/{major_version}/bin/python{major_version}")
-            ]
-            
-            # 也檢查沒有版本號的 python3
-            common_paths.append(Path("/usr/bin/python3"))
-            common_paths.append(Path("/usr/local/bin/python3"))
-            common_paths.append(Path("/opt/homebrew/bin/python3"))
-            
-            for path in common_paths:
-                if path.exists():
-                    # 檢查版本是否匹配
-                    try:
-                        result = subprocess.run(
-                            [str(path), "-c", "import sys; print('.'.join(map(str, sys.version_info[:2])))"],
-                            capture_output=True, 
-                            text=True, 
-                            check=True
-                        )
-                        version = result.stdout.strip()
-                        if version == major_version or version.startswith(f"{major_version}."):
-                            python_exe = path
-                            python_installed = True
-                            logging.info(f"在 macOS 找到匹配的 Python {major_version}: {python_exe}")
-                            break
-                    except:
-                        logging.info(f"檢查版本時出錯: {path}")
-        
-        elif is_linux:
-            # 在 Linux 上常見的 Python 路徑
-            common_paths = [
-                Path(f"/usr/bin/python{major_version}"),
-                Path(f"/usr/local/bin/python{major_version}"),
-                Path(f"{home_path}/.local/bin/python{major_version}")
-            ]
-            
-            # 也檢查沒有版本號的 python3
-            common_paths.append(Path("/usr/bin/python3"))
-            common_paths.append(Path("/usr/local/bin/python3"))
-            
-            for path in common_paths:
-                if path.exists():
-                    # 檢查版本是否匹配
-                    try:
-                        result = subprocess.run(
-                            [str(path), "-c", "import sys; print('.'.join(map(str, sys.version_info[:2])))"],
-                            capture_output=True, 
-                            text=True, 
-                            check=True
-                        )
-                        version = result.stdout.strip()
-                        if version == major_version or version.startswith(f"{major_version}."):
-                            python_exe = path
-                            python_installed = True
-                            logging.info(f"在 Linux 找到匹配的 Python {major_version}: {python_exe}")
-                            break
-                    except:
-                        logging.info(f"檢查版本時出錯: {path}")
-        
         # 如果未找到匹配版本的 Python，則提示安裝
         if not python_installed:
             # 在不同作業系統上處理 Python 安裝
@@ -345,7 +738,10 @@ def install_modules_directly(ctx):
                         return False
                     
                     # 下載對應版本的 Python
-                    show_message_box(ctx, f"正在下載 Python {major_version}，請稍候...\n這可能需要幾分鐘時間。", "下載中", 1)
+                    if task is not None:
+                        task.begin_phase(f"下載並安裝 Python {major_version}")
+                    else:
+                        show_message_box(ctx, f"正在下載 Python {major_version}，請稍候...\n這可能需要幾分鐘時間。", "下載中", 1)
                     
                     # 根據大版本選擇下載URL
                     if major_version == "3.9":
@@ -360,12 +756,18 @@ def install_modules_directly(ctx):
                         
                     installer_path = temp_dir / f"python_{major_version}_installer.exe"
                     
-                    # 下載安裝檔
-                    urllib.request.urlretrieve(download_url, installer_path)
+                    # 下載安裝檔 (背景安裝時回報下載進度並可取消)
+                    def report_download(blocks, block_size, total_size):
+                        if task is not None:
+                            task.check_cancelled()
+                            if total_size > 0:
+                                percent = min(100, blocks * block_size * 100 // total_size)
+                                task.progress.set_text(f"下載 Python {major_version}: {percent}%")
+                    urllib.request.urlretrieve(download_url, installer_path, report_download)
                     logging.info(f"Python {major_version} 下載完成: {installer_path}")
                     
                     # 執行安裝程序 - 靜默安裝，只給當前用戶，添加到 PATH
-                    show_message_box(ctx, f"正在安裝 Python {major_version}，請稍候...\n這可能需要幾分鐘時間。", "安裝中", 1)
+                    notify_progress(ctx, task, f"正在安裝 Python {major_version}，請稍候...\n這可能需要幾分鐘時間。", "安裝中")
                     install_args = [
                         str(installer_path),
                         "/quiet", 
@@ -375,12 +777,7 @@ def install_modules_directly(ctx):
                         "InstallLauncherAllUsers=0"
                     ]
                     
-                    proc = subprocess.run(
-                        install_args,
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.PIPE,
-                        text=True
-                    )
+                    proc = run_command(install_args, task)
                     
                     if proc.returncode != 0:
                         logging.error(f"Python 安裝失敗: {proc.stderr}")
@@ -415,6 +812,8 @@ def install_modules_directly(ctx):
                     python_installed = True
                     logging.info(f"使用新安裝的 Python: {python_exe}")
                     
+                except InstallCancelled:
+                    raise
                 except Exception as e:
                     logging.error(f"下載/安裝 Python 時發生錯誤: {str(e)}")
                     show_message_box(ctx, f"下載/安裝 Python 時發生錯誤: {str(e)}", "安裝錯誤", 3)
@@ -447,33 +846,39 @@ def install_modules_directly(ctx):
         # 建立 requirements.txt 文件
         requirements_file = manual_install_dir / 'requirements.txt'
         with open(requirements_file, 'w') as f:
-            f.write("SpeechRecognition\npyaudio\nflask\nrequests\n")
+            f.write("\n".join(REQUIREMENTS + OPTIONAL_REQUIREMENTS) + "\n")
         
         # 使用匹配版本的 Python 安裝必要模組到臨時目錄
-        show_message_box(ctx, f"正在使用 Python {major_version} 安裝必要模組，請稍候...", "模組安裝中", 1)
+        if task is not None:
+            task.begin_phase("建立虛擬環境")
+        else:
+            show_message_box(ctx, f"正在使用 Python {major_version} 安裝必要模組，請稍候...", "模組安裝中", 1)
         
-        # 創建虛擬環境 (使用用戶目錄避開權限問題)
+        # 虛擬環境 (使用用戶目錄避開權限問題)
         venv_dir = user_python_dir / "venv"
+        
+        # 根據系統確定虛擬環境中的 Python 路徑
+        if is_windows:
+            venv_python = venv_dir / "Scripts" / "python.exe"
+        else:  # Linux/macOS
+            venv_python = venv_dir / "bin" / "python"
+        
+        # 既有虛擬環境只在基底 Python 變更或無法使用時才重建，否則只補裝缺少的套件
+        venv_state = None
         if venv_dir.exists():
-            shutil.rmtree(venv_dir)
+            if venv_matches_interpreter(venv_dir, python_exe):
+                venv_state = inspect_venv(venv_python, major_version)
+            if venv_state is None:
+                logging.info("虛擬環境的 Python 已變更或無法使用，重新建立")
+                shutil.rmtree(venv_dir)
         
-        # 運行 Python 創建虛擬環境
         try:
-            logging.info(f"創建虛擬環境: {venv_dir}")
-            subprocess.run(
-                [str(python_exe), "-m", "venv", str(venv_dir)],
-                check=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE
-            )
-            
-            # 根據系統確定虛擬環境中的 Python 和 pip 路徑
-            if is_windows:
-                venv_python = venv_dir / "Scripts" / "python.exe"
-                venv_pip = venv_dir / "Scripts" / "pip.exe"
-            else:  # Linux/macOS
-                venv_python = venv_dir / "bin" / "python"
-                venv_pip = venv_dir / "bin" / "pip"
+            if venv_state is None:
+                # 運行 Python 創建虛擬環境
+                logging.info(f"創建虛擬環境: {venv_dir}")
+                proc = run_command([python_exe, "-m", "venv", venv_dir], task)
+                if proc.returncode != 0:
+                    logging.error(f"創建虛擬環境失敗: {proc.stdout}")
             
             if not venv_python.exists():
                 logging.error(f"創建虛擬環境失敗，找不到 Python: {venv_python}")
@@ -496,24 +901,24 @@ def install_modules_directly(ctx):
                     show_message_box(ctx, f"無法設置執行權限，請嘗試手動運行:\nchmod +x {venv_python}", "權限錯誤", 3)
                     # 繼續執行，讓用戶有機會手動修復
             
-            # 升級 pip
-            logging.info("升級 pip")
-            subprocess.run(
-                [str(venv_python), "-m", "pip", "install", "--upgrade", "pip"],
-                check=False,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE
-            )
-            
-            # 安裝必要模組
-            logging.info(f"安裝必要模組: {requirements_file}")
-            result = subprocess.run(
-                [str(venv_python), "-m", "pip", "install", "-r", str(requirements_file)],
-                check=False,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True
-            )
+            if task is not None:
+                task.begin_phase("安裝必要模組")
+            if venv_state is None:
+                # 安裝必要模組 (優先使用本機 wheelhouse，必要時才連網)
+                logging.info(f"安裝必要模組: {requirements_file}")
+                result = install_requirements(venv_python, requirements_file, task=task)
+            else:
+                # 只安裝缺少或版本不符的套件
+                specs = diff_requirements(venv_state)
+                if specs:
+                    logging.info(f"修復虛擬環境，安裝: {', '.join(specs)}")
+                    repair_file = manual_install_dir / 'repair_requirements.txt'
+                    with open(repair_file, 'w', encoding='utf-8') as f:
+                        f.write("\n".join(specs) + "\n")
+                    result = install_requirements(venv_python, repair_file, use_lock=False, task=task)
+                else:
+                    logging.info("虛擬環境完整，不需安裝任何套件")
+                    result = subprocess.CompletedProcess(args=[], returncode=0, stdout="", stderr="")
             
             if result.returncode != 0:
                 logging.error(f"安裝模組失敗: {result.stderr}")
@@ -558,6 +963,8 @@ def install_modules_directly(ctx):
             from api_service import create_api_script
             
             # 修改 speech_api.py 指向我們的虛擬環境
+            if task is not None:
+                task.begin_phase("產生 API 腳本")
             create_api_script(flask_dir, venv_python)
             
             # 創建安裝完成標記
@@ -566,14 +973,22 @@ def install_modules_directly(ctx):
             with open(config_marker, 'w', encoding='utf-8') as f:
                 f.write("Installed")
             
-            show_message_box(ctx, f"已成功安裝必要模組到用戶級別的 Python 環境。\n\nAPI 服務已配置使用該環境。\n\n請重新啟動 LibreOffice 以使用語音辨識功能。", "安裝成功", 1)
+            # 背景安裝由完成回呼啟動 API 服務並顯示結果
+            if task is None:
+                show_message_box(ctx, f"已成功安裝必要模組到用戶級別的 Python 環境。\n\nAPI 服務已配置使用該環境。\n\n請重新啟動 LibreOffice 以使用語音辨識功能。", "安裝成功", 1)
             return True
                 
+        except InstallCancelled:
+            raise
         except Exception as e:
             logging.error(f"安裝模組時發生錯誤: {str(e)}")
             show_message_box(ctx, f"安裝模組時發生錯誤: {str(e)}", "安裝錯誤", 3)
             return False
         
+    except InstallCancelled:
+        logging.info("安裝已取消")
+        show_message_box(ctx, "安裝已取消。下次使用語音辨識時會繼續安裝。", "安裝取消", 1)
+        return False
     except Exception as e:
         error_msg = f"安裝過程中發生錯誤: {str(e)}"
         logging.error(error_msg)
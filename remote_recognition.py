@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""用戶端模式：在本機擷取語音，交給區域網路上的共用語音辨識服務辨識
+
+~/.libreoffice/speech_api/remote.json 存在時，單次語音辨識改由本機服務的 /capture 擷取語音，
+本模組把收到的音訊邊收邊以 chunked 上傳到共用服務的 /recognize_audio，共用服務在說話期間就先行辨識已完成的片段：
+
+    {"url": "http://192.168.1.20:5000", "token": "7f1c0e...", "format": "pcm", "timeout": 60}
+
+format 為 flac 時改為說完後以 FLAC 壓縮一次上傳 (頻寬有限的網路)。
+"""
+import json
+import logging
+import http.client
+import urllib.parse
+from pathlib import Path
+
+REMOTE_CONFIG = Path.home() / '.libreoffice' / 'speech_api' / 'remote.json'
+
+
+def load_remote_config():
+    """讀取 remote.json，未設定或格式錯誤時回傳 None (使用本機服務辨識)"""
+    try:
+        with open(REMOTE_CONFIG, 'r', encoding='utf-8-sig') as f:
+            config = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logging.error(f"無法讀取 {REMOTE_CONFIG}: {e}")
+        return None
+    if not isinstance(config, dict) or not config.get("url"):
+        logging.error(f"{REMOTE_CONFIG} 缺少共用服務的 url")
+        return None
+    return config
+
+
+def open_connection(url, timeout):
+    """依 url 建立 HTTP(S) 連線，回傳 (連線, 路徑前綴)"""
+    parsed = urllib.parse.urlsplit(url)
+    connection_class = http.client.HTTPSConnection if parsed.scheme == 'https' else http.client.HTTPConnection
+    return connection_class(parsed.netloc, timeout=timeout), parsed.path.rstrip('/')
+
+
+def read_json(response):
+    try:
+        return json.loads(response.read().decode('utf-8'))
+    except ValueError:
+        return None
+
+
+def recognize_remote(config, profile, port=5000):
+    """由本機服務擷取語音並上傳到共用服務辨識，回傳與 /recognize 相同的 JSON"""
+    timeout = float(config.get("timeout", 60))
+    local = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+    remote = None
+    try:
+        try:
+            payload = {"profile": profile, "format": config.get("format", "pcm")}
+            local.request("POST", "/capture", body=json.dumps(payload).encode('utf-8'),
+                          headers={"Content-Type": "application/json"})
+            captured = local.getresponse()
+        except (OSError, http.client.HTTPException) as e:
+            logging.error(f"本機擷取語音失敗: {e}")
+            return {"success": False, "error": f"無法連接到本機語音服務：{e}"}
+        content_type = captured.getheader("Content-Type", "")
+        if not content_type.startswith("audio/"):
+            # 沒有麥克風或聆聽逾時，回應與 /recognize 相同
+            return read_json(captured) or {"success": False, "error": f"本機擷取語音失敗：HTTP {captured.status}"}
+
+        remote, base_path = open_connection(config["url"], timeout)
+        headers = {"Content-Type": content_type}
+        if config.get("token"):
+            headers["Authorization"] = f"Bearer {config['token']}"
+        path = f"{base_path}/recognize_audio?{urllib.parse.urlencode({'profile': profile})}"
+        if content_type.startswith("audio/pcm"):
+            # 沒有 Content-Length 的 iterable 會以 chunked 傳送，擷取到的音訊立即轉送
+            body = iter(lambda: captured.read1(16384), b"")
+        else:
+            body = captured.read()
+        remote.request("POST", path, body=body, headers=headers)
+        response = remote.getresponse()
+        result = read_json(response)
+        if result is None:
+            return {"success": False, "error": f"共用語音辨識服務錯誤：HTTP {response.status}"}
+        return result
+    except (OSError, http.client.HTTPException) as e:
+        logging.error(f"上傳語音到共用服務失敗: {e}")
+        return {"success": False, "error": f"無法連接到共用語音辨識服務：{e}"}
+    finally:
+        local.close()
+        if remote is not None:
+            remote.close()
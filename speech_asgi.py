@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""ASGI 版本的語音辨識 API 框架 (由 create_api_script 複製到語音辨識 API 服務目錄)
+
+不依賴任何網頁框架的最小 ASGI 應用程式：以 route 註冊 async 處理函式，
+處理函式回傳 (JSON 內容, 狀態碼) 或 StreamingResponse。麥克風擷取與辨識等阻塞工作
+以 run_blocking 交給執行緒池；等待連續聽寫結果時不佔用執行緒，由 StreamSession 的 listener 喚醒。
+
+串流回應以 NDJSON 逐行 (或原始位元組) 送出，每一段在前一段送出 (send 完成) 後才產生，
+用戶端讀取較慢時伺服器的流量控制會讓 send 等待，不會在記憶體中累積未送出的資料。
+以 stream_body 註冊的路由不預先讀取請求內容，處理函式在執行緒池中以 request.body.read 邊接收邊處理。
+"""
+import json
+import queue
+import asyncio
+import logging
+import functools
+from urllib.parse import parse_qs
+from concurrent.futures import ThreadPoolExecutor
+
+MAX_BODY = 1024 * 1024
+
+
+class Request:
+    """ASGI 請求的方法、路徑、查詢參數與 JSON 內容"""
+
+    def __init__(self, scope, body):
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        self.remote_addr = (scope.get("client") or (None, None))[0]
+        self.headers = {name.decode("latin-1").lower(): value.decode("latin-1") for name, value in scope.get("headers", [])}
+        # 一般路由為完整的請求內容 (bytes)，stream_body 路由為 BodyStream
+        self.body = body
+
+    def header(self, name, default=None):
+        return self.headers.get(name.lower(), default)
+
+    def json(self):
+        """與 Flask 的 get_json(silent=True) 相同：無法解析或不是物件時回傳空字典"""
+        try:
+            payload = json.loads(self.body.decode("utf-8")) if isinstance(self.body, bytes) and self.body else None
+        except ValueError:
+            payload = None
+        return payload if isinstance(payload, dict) else {}
+
+    def arg(self, name, default=None, type=str):
+        """與 Flask 的 request.args.get 相同：轉換失敗時回傳 default"""
+        values = self.query.get(name)
+        if not values:
+            return default
+        try:
+            return type(values[0])
+        except (TypeError, ValueError):
+            return default
+
+
+class StreamingResponse:
+    """逐段送出 events (async iterator)：字典以 NDJSON 逐行送出，bytes 直接送出"""
+
+    def __init__(self, events, media_type="application/x-ndjson; charset=utf-8"):
+        self.events = events
+        self.media_type = media_type
+
+
+# BodyStream 佇列中表示用戶端已中斷連線
+_DISCONNECTED = object()
+
+
+class BodyStream:
+    """在執行緒池中以阻塞的 read(size) 讀取 ASGI 請求內容
+
+    pump 在事件迴圈中接收請求內容放入佇列；尚未讀取的區塊數有上限，
+    處理較慢時暫停接收，由 TCP 流量控制讓用戶端等待，不會在記憶體中累積整個上傳內容。
+    """
+
+    def __init__(self, loop, max_pending=32):
+        self.loop = loop
+        self.chunks = queue.Queue()
+        self.space = asyncio.Semaphore(max_pending)
+        self.buffer = bytearray()
+        self.finished = False
+
+    async def pump(self, receive):
+        while True:
+            await self.space.acquire()
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                self.chunks.put(_DISCONNECTED)
+                return
+            body = message.get("body", b"")
+            if body:
+                self.chunks.put(body)
+            else:
+                self.space.release()
+            if not message.get("more_body"):
+                self.chunks.put(b"")
+                return
+
+    def read(self, size=-1):
+        """讀取 size 個位元組 (小於 0 時讀到結尾)，內容結束時回傳較短或空的資料"""
+        while not self.finished and (size < 0 or len(self.buffer) < size):
+            chunk = self.chunks.get()
+            if chunk is _DISCONNECTED:
+                self.finished = True
+                raise ConnectionError("client disconnected")
+            if not chunk:
+                self.finished = True
+                break
+            self.loop.call_soon_threadsafe(self.space.release)
+            self.buffer += chunk
+        if size < 0:
+            size = len(self.buffer)
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+
+def encode_json(body):
+    return json.dumps(body, ensure_ascii=False).encode("utf-8")
+
+
+class AsgiApp:
+    """最小的 ASGI 應用程式：路由、JSON 回應、串流回應與阻塞工作的執行緒池"""
+
+    def __init__(self, workers=8, on_request_start=None, on_request_end=None, before_request=None):
+        self.routes = {}
+        self.executor = ThreadPoolExecutor(max_workers=max(1, int(workers)), thread_name_prefix='asgi')
+        self.on_request_start = on_request_start
+        self.on_request_end = on_request_end
+        # before_request(request) 回傳 (JSON 內容, 狀態碼) 時不呼叫處理函式，直接回應
+        self.before_request = before_request
+
+    def route(self, path, methods=('GET',), stream_body=False):
+        def register(handler):
+            for method in methods:
+                self.routes[(method, path)] = (handler, stream_body)
+            return handler
+        return register
+
+    async def run_blocking(self, function, *args):
+        """在執行緒池中執行阻塞的函式"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(function, *args))
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        entry = self.routes.get((scope["method"], scope["path"]))
+        if entry is None:
+            if any(path == scope["path"] for _, path in self.routes):
+                await self._send_json(send, {"success": False, "error": "不支援的請求方法"}, 405)
+            else:
+                await self._send_json(send, {"success": False, "error": "端點不存在"}, 404)
+            return
+        handler, stream_body = entry
+
+        pump = None
+        if stream_body:
+            body = BodyStream(asyncio.get_running_loop())
+            pump = asyncio.ensure_future(body.pump(receive))
+        else:
+            body = bytearray()
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    return
+                body.extend(message.get("body", b""))
+                if len(body) > MAX_BODY:
+                    await self._send_json(send, {"success": False, "error": "請求內容過大"}, 413)
+                    return
+                if not message.get("more_body"):
+                    break
+            body = bytes(body)
+        request = Request(scope, body)
+
+        if self.on_request_start is not None:
+            self.on_request_start()
+        try:
+            try:
+                result = self.before_request(request) if self.before_request is not None else None
+                if result is None:
+                    result = await handler(request)
+            except Exception as e:
+                logging.error(f"伺服器錯誤: {e}")
+                result = ({"success": False, "error": "伺服器內部錯誤"}, 500)
+            finally:
+                if pump is not None:
+                    pump.cancel()
+            if isinstance(result, StreamingResponse):
+                await self._send_stream(result, receive, send)
+            else:
+                await self._send_json(send, *result)
+        finally:
+            if self.on_request_end is not None:
+                self.on_request_end()
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    @staticmethod
+    async def _send_json(send, body, status=200):
+        data = encode_json(body)
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json; charset=utf-8"),
+                        (b"content-length", str(len(data)).encode("latin-1"))]
+        })
+        await send({"type": "http.response.body", "body": data})
+
+    @staticmethod
+    async def _send_stream(response, receive, send):
+        async def disconnected():
+            while (await receive())["type"] != "http.disconnect":
+                pass
+
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", response.media_type.encode("latin-1"))]
+        })
+        events = response.events.__aiter__()
+        watcher = asyncio.ensure_future(disconnected())
+        try:
+            while True:
+                item = asyncio.ensure_future(events.__anext__())
+                await asyncio.wait({item, watcher}, return_when=asyncio.FIRST_COMPLETED)
+                if not item.done():
+                    # 用戶端已中斷連線
+                    item.cancel()
+                    return
+                try:
+                    data = item.result()
+                except StopAsyncIteration:
+                    break
+                # send 在用戶端讀取跟不上時等待，下一筆更新在此之後才產生
+                body = data if isinstance(data, bytes) else encode_json(data) + b"\n"
+                await send({"type": "http.response.body", "body": body, "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            watcher.cancel()
+            if hasattr(events, "aclose"):
+                await events.aclose()
+
+
+async def wait_for_session(session, after, wait=0.0, partial_after=None):
+    """results_after 的 asyncio 版本：等待期間不佔用執行緒"""
+    loop = asyncio.get_running_loop()
+    changed = asyncio.Event()
+
+    def listener():
+        loop.call_soon_threadsafe(changed.set)
+
+    session.add_listener(listener)
+    try:
+        deadline = loop.time() + max(0.0, wait)
+        while True:
+            changed.clear()
+            with session.condition:
+                if session.ready(after, partial_after):
+                    break
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                await asyncio.wait_for(changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                break
+    finally:
+        session.remove_listener(listener)
+    return session.results_after(after, 0.0, partial_after)
+
+
+async def session_events(session, after=0, partial_after=None, wait=10.0):
+    """StreamSession.events 的 asyncio 版本"""
+    while True:
+        data = await wait_for_session(session, after, wait, partial_after)
+        yield data
+        if not data["active"]:
+            return
+        after = data["next"]
+        if partial_after is not None:
+            partial_after = data["partial_version"]
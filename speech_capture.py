@@ -0,0 +1,547 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""記憶體用量固定的音訊擷取 (由 create_api_script 複製到語音辨識 API 服務目錄)
+
+recognizer.listen 會把整段語音累積成一個 AudioData，轉換格式時再產生多份複本，
+說得越久記憶體越大。這裡的擷取迴圈與 listen 的語音偵測邏輯相同，
+但音訊寫入 AudioSpool：小於門檻時放在記憶體，超過後改寫入暫存檔，
+讀取時以 memoryview / mmap 只對應需要的範圍，不產生整段音訊的複本。
+辨識時依安靜處切成長度有上限的片段，每次只複製一個片段。
+"""
+import math
+import mmap
+import queue
+import tempfile
+import contextlib
+from array import array
+from collections import deque
+
+try:
+    import audioop
+except ImportError:
+    # Python 3.13 起 audioop 由 audioop-lts 提供 (SpeechRecognition 的相依套件)
+    audioop = None
+
+# 不以空白分隔詞語的語言，片段結果直接相接
+UNSPACED_LANGUAGES = ('zh', 'ja', 'ko', 'th')
+
+
+def rms(data, sample_width):
+    """音訊片段的能量 (均方根)"""
+    if audioop is not None:
+        return audioop.rms(data, sample_width)
+    if sample_width != 2 or not len(data):
+        return 0
+    samples = array('h')
+    samples.frombytes(bytes(data))
+    return int(math.sqrt(sum(sample * sample for sample in samples) / len(samples)))
+
+
+class AudioSpool:
+    """音訊暫存區：小於 memory_limit 時放在記憶體，超過後寫入暫存檔"""
+
+    def __init__(self, sample_rate, sample_width, memory_limit=1024 * 1024, directory=None):
+        self.sample_rate = sample_rate
+        self.sample_width = sample_width
+        self.memory_limit = memory_limit
+        self.directory = directory
+        self.buffer = bytearray()
+        self.file = None
+        self.length = 0
+
+    @property
+    def spilled(self):
+        return self.file is not None
+
+    @property
+    def duration(self):
+        return self.length / float(self.sample_rate * self.sample_width)
+
+    def write(self, data):
+        if self.file is None and self.length + len(data) > self.memory_limit:
+            self.file = tempfile.TemporaryFile(prefix='speech_spool_', dir=self.directory)
+            self.file.write(self.buffer)
+            self.buffer = bytearray()
+        if self.file is not None:
+            self.file.write(data)
+        else:
+            self.buffer += data
+        self.length += len(data)
+
+    def truncate(self, length):
+        """只保留前 length 個位元組"""
+        length = max(0, min(length, self.length))
+        if self.file is not None:
+            self.file.truncate(length)
+            self.file.seek(length)
+        else:
+            del self.buffer[length:]
+        self.length = length
+
+    @contextlib.contextmanager
+    def view(self, start=0, length=None):
+        """以 memoryview 讀取 [start, start + length) 的音訊
+
+        暫存檔只以 mmap 對應這個範圍，不複製到記憶體，用完即解除對應，
+        因此常駐記憶體只與讀取範圍有關，與整段語音長度無關。
+        """
+        start = max(0, min(start, self.length))
+        end = self.length if length is None else min(self.length, start + length)
+        if self.file is None or end <= start:
+            view = memoryview(self.buffer)[start:end]
+            try:
+                yield view
+            finally:
+                view.release()
+            return
+        self.file.flush()
+        offset = start - start % mmap.ALLOCATIONGRANULARITY
+        mapped = mmap.mmap(self.file.fileno(), end - offset, access=mmap.ACCESS_READ, offset=offset)
+        view = memoryview(mapped)[start - offset:]
+        try:
+            yield view
+        finally:
+            view.release()
+            mapped.close()
+
+    def tail(self, length):
+        """複製最後 length 個位元組 (例如暫定辨識只需要最近的音訊)"""
+        with self.view(self.length - length) as view:
+            return bytes(view)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        self.buffer = bytearray()
+        self.length = 0
+
+
+def adjust_for_ambient_noise(recognizer, source, duration=1.0):
+    """與 recognizer.adjust_for_ambient_noise 相同的環境噪音校正，但不限定 sr.AudioSource (見 speech_sources)"""
+    seconds_per_buffer = float(source.CHUNK) / source.SAMPLE_RATE
+    elapsed_time = 0.0
+    while True:
+        elapsed_time += seconds_per_buffer
+        if elapsed_time > duration:
+            break
+        buffer = source.stream.read(source.CHUNK)
+        if len(buffer) == 0:
+            break
+        damping = recognizer.dynamic_energy_adjustment_damping ** seconds_per_buffer
+        target_energy = rms(buffer, source.SAMPLE_WIDTH) * recognizer.dynamic_energy_ratio
+        recognizer.energy_threshold = recognizer.energy_threshold * damping + target_energy * (1 - damping)
+
+
+def listen_to_spool(sr, recognizer, source, timeout=None, phrase_time_limit=None,
+                    memory_limit=1024 * 1024, on_chunk=None):
+    """與 recognizer.listen 相同的語音偵測，但音訊寫入 AudioSpool 並回傳
+
+    逾時未偵測到語音時拋出 sr.WaitTimeoutError，音源在語音開始前結束時拋出 EOFError；
+    on_chunk(spool, speech) 在每個音訊區塊寫入後呼叫，speech 表示該區塊的能量是否超過門檻。
+    """
+    chunk_size = source.CHUNK
+    sample_width = source.SAMPLE_WIDTH
+    seconds_per_buffer = float(chunk_size) / source.SAMPLE_RATE
+    pause_buffer_count = int(math.ceil(recognizer.pause_threshold / seconds_per_buffer))
+    phrase_buffer_count = int(math.ceil(recognizer.phrase_threshold / seconds_per_buffer))
+    non_speaking_buffer_count = int(math.ceil(recognizer.non_speaking_duration / seconds_per_buffer))
+
+    spool = AudioSpool(source.SAMPLE_RATE, sample_width, memory_limit)
+    elapsed_time = 0.0
+    buffer = b""
+    try:
+        while True:
+            # 等待語音開始，只保留語音前固定數量的區塊
+            preroll = deque(maxlen=max(1, non_speaking_buffer_count))
+            while True:
+                elapsed_time += seconds_per_buffer
+                if timeout and elapsed_time > timeout:
+                    raise sr.WaitTimeoutError("listening timed out while waiting for phrase to start")
+                buffer = source.stream.read(chunk_size)
+                if len(buffer) == 0:
+                    if spool.length == 0:
+                        raise EOFError("audio source ended")
+                    break
+                preroll.append(buffer)
+                energy = rms(buffer, sample_width)
+                if energy > recognizer.energy_threshold:
+                    break
+                if recognizer.dynamic_energy_threshold:
+                    damping = recognizer.dynamic_energy_adjustment_damping ** seconds_per_buffer
+                    target_energy = energy * recognizer.dynamic_energy_ratio
+                    recognizer.energy_threshold = recognizer.energy_threshold * damping + target_energy * (1 - damping)
+
+            spool.truncate(0)
+            for frame in preroll:
+                spool.write(frame)
+            preroll.clear()
+
+            # 擷取到停頓超過 pause_threshold 為止
+            pause_count, phrase_count = 0, 0
+            pause_bytes = 0
+            phrase_start_time = elapsed_time
+            while True:
+                elapsed_time += seconds_per_buffer
+                if phrase_time_limit and elapsed_time - phrase_start_time > phrase_time_limit:
+                    break
+                buffer = source.stream.read(chunk_size)
+                if len(buffer) == 0:
+                    break
+                spool.write(buffer)
+                phrase_count += 1
+                speech = rms(buffer, sample_width) > recognizer.energy_threshold
+                if speech:
+                    pause_count = 0
+                    pause_bytes = 0
+                else:
+                    pause_count += 1
+                    pause_bytes += len(buffer)
+                if on_chunk is not None:
+                    on_chunk(spool, speech)
+                if pause_count > pause_buffer_count:
+                    break
+
+            phrase_count -= pause_count
+            if phrase_count >= phrase_buffer_count or len(buffer) == 0:
+                break
+
+        # 去掉結尾多餘的靜音，只保留 non_speaking_duration
+        extra = pause_count - non_speaking_buffer_count
+        if extra > 0 and pause_count:
+            spool.truncate(spool.length - pause_bytes * extra // pause_count)
+        return spool
+    except BaseException:
+        spool.close()
+        raise
+
+
+class AudioTooLong(Exception):
+    """上傳的音訊超過長度上限"""
+
+
+def receive_to_spool(read, sample_rate, sample_width, energy_threshold=300, on_chunk=None,
+                     chunk_size=1024, max_bytes=None, memory_limit=1024 * 1024):
+    """把上傳的音訊寫入 AudioSpool 並回傳，read(size) 在音訊結束時回傳空值
+
+    斷句已由用戶端完成，這裡不再等待語音開始或停頓；與 listen_to_spool 相同，
+    每個區塊寫入後呼叫 on_chunk(spool, speech)，因此上傳期間就能先行辨識已完成的片段。
+    音訊超過 max_bytes 時拋出 AudioTooLong。
+    """
+    block = chunk_size * sample_width
+    spool = AudioSpool(sample_rate, sample_width, memory_limit)
+    pending = bytearray()
+    try:
+        while True:
+            data = read(block)
+            if data:
+                pending += data
+            # 收到的資料長度不固定，湊成完整的區塊再處理，避免切在取樣中間
+            while len(pending) >= block or (not data and len(pending) >= sample_width):
+                size = min(block, len(pending) - len(pending) % sample_width)
+                chunk = bytes(pending[:size])
+                del pending[:size]
+                if max_bytes is not None and spool.length + len(chunk) > max_bytes:
+                    raise AudioTooLong(f"audio exceeds {max_bytes} bytes")
+                spool.write(chunk)
+                if on_chunk is not None:
+                    on_chunk(spool, rms(chunk, sample_width) > energy_threshold)
+            if not data:
+                return spool
+    except BaseException:
+        spool.close()
+        raise
+
+
+class PhraseStreamer:
+    """作為 listen_to_spool 的 on_chunk，擷取期間就依序送出已確定的音訊
+
+    listen_to_spool 遇到太短的語音會捨棄並重新等待，因此語音長度達到 phrase_threshold
+    (與其判斷方式相同) 後才開始送出；擷取結束後由 finish 送出其餘部分。
+    結尾的靜音在擷取結束時才裁掉，已送出的部分最多多出 pause_threshold 長的靜音。
+    send(data, sample_rate, sample_width) 依序收到各段音訊。
+    """
+
+    def __init__(self, send, phrase_threshold=0.3, chunk_size=1024, forward=None):
+        self.send = send
+        self.phrase_threshold = phrase_threshold
+        self.chunk_size = chunk_size
+        self.forward = forward
+        self.sent = 0
+        self.position = 0
+        self.phrase_start = None
+        self.confirmed = False
+
+    def on_chunk(self, spool, speech):
+        chunk_bytes = self.chunk_size * spool.sample_width
+        if spool.length < self.position or self.phrase_start is None:
+            # 新的語音 (或捨棄過短的語音後重新開始)：語音前的音訊之後是第一個區塊
+            self.phrase_start = spool.length - chunk_bytes
+        self.position = spool.length
+        if not self.confirmed and speech:
+            phrase_chunks = int(math.ceil(self.phrase_threshold * spool.sample_rate / float(self.chunk_size)))
+            self.confirmed = spool.length - self.phrase_start >= phrase_chunks * chunk_bytes
+        if self.confirmed:
+            self._send(spool)
+        if self.forward is not None:
+            self.forward(spool, speech)
+
+    def _send(self, spool):
+        if spool.length > self.sent:
+            with spool.view(self.sent, spool.length - self.sent) as view:
+                data = bytes(view)
+            self.sent = spool.length
+            self.send(data, spool.sample_rate, spool.sample_width)
+
+    def finish(self, spool):
+        """擷取結束後送出尚未送出的音訊"""
+        self._send(spool)
+
+
+class CaptureStream:
+    """擷取執行緒放入的音訊區塊，由 HTTP 回應依序讀出
+
+    擷取在送出任何音訊前結束時 (例如聆聽逾時)，first 回傳 None，錯誤訊息記錄在 error。
+    """
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.error = None
+        self.sample_rate = None
+        self.sample_width = None
+        # 非 PCM 時的音訊格式 (例如 audio/flac)
+        self.media_type = None
+        self.head = None
+
+    @property
+    def content_type(self):
+        return self.media_type or f"audio/pcm; rate={self.sample_rate}; width={self.sample_width}"
+
+    def put(self, data, sample_rate, sample_width):
+        self.sample_rate = sample_rate
+        self.sample_width = sample_width
+        self.queue.put(data)
+
+    def close(self, error=None):
+        self.error = error
+        self.queue.put(None)
+
+    def first(self):
+        """等待第一段音訊"""
+        self.head = self.queue.get()
+        return self.head
+
+    def next(self):
+        """下一段音訊，擷取結束時回傳 None"""
+        if self.head is not None:
+            data, self.head = self.head, None
+            return data
+        return self.queue.get()
+
+    def chunks(self):
+        while True:
+            data = self.next()
+            if data is None:
+                return
+            yield data
+
+
+def segment_bounds(spool, max_seconds=30.0, search_seconds=2.0, chunk_size=1024):
+    """把音訊切成不超過 max_seconds 的片段，回傳各片段的 (起點, 終點)
+
+    切點選在片段結尾前 search_seconds 內能量最低的位置，避免切在字詞中間；
+    只讀取搜尋範圍內的音訊。max_seconds 為 None 時不切割。
+    """
+    total = spool.length
+    sample_width = spool.sample_width
+    bytes_per_second = spool.sample_rate * sample_width
+    if max_seconds is None:
+        max_length = max(total, sample_width)
+    else:
+        max_length = max(sample_width, int(max_seconds * bytes_per_second) // sample_width * sample_width)
+    step = chunk_size * sample_width
+    position = 0
+    while position < total:
+        end = min(position + max_length, total)
+        if end < total:
+            search_start = max(position + step, end - int(search_seconds * bytes_per_second) // sample_width * sample_width)
+            best_end, best_energy = end, None
+            with spool.view(search_start, end - search_start) as view:
+                for offset in range(0, len(view) - step + 1, step):
+                    energy = rms(view[offset:offset + step], sample_width)
+                    if best_energy is None or energy < best_energy:
+                        best_end, best_energy = search_start + offset + step // 2 // sample_width * sample_width, energy
+            end = best_end
+        yield position, end
+        position = end
+
+
+def segment_audio(sr, spool, max_seconds=30.0):
+    """依序產生各片段的 AudioData，每次只複製一個片段"""
+    for start, end in list(segment_bounds(spool, max_seconds)):
+        with spool.view(start, end - start) as view:
+            audio = sr.AudioData(bytes(view), spool.sample_rate, spool.sample_width)
+        yield audio
+
+
+def join_texts(texts, language):
+    separator = "" if language.lower().startswith(UNSPACED_LANGUAGES) else " "
+    return separator.join(texts)
+
+
+def recognize_spool(sr, recognizer, spool, language, recognize, max_seconds=30.0):
+    """分段辨識暫存區中的音訊並串接結果，每次只複製一個片段
+
+    recognize(recognizer, audio, language) 回傳文字；所有片段都無法辨識時拋出 sr.UnknownValueError。
+    """
+    texts = []
+    for audio in segment_audio(sr, spool, max_seconds):
+        try:
+            text = recognize(recognizer, audio, language)
+        except sr.UnknownValueError:
+            continue
+        if text:
+            texts.append(text)
+    if not texts:
+        raise sr.UnknownValueError()
+    return join_texts(texts, language)
+
+
+def submit_segment(executor, recognize_scored, recognizer, audio, languages):
+    """把一個片段以各候選語言送到 executor 辨識，回傳 {語言: future}"""
+    return {language: executor.submit(recognize_scored, recognizer, audio, language) for language in languages}
+
+
+def collect_segment(sr, futures):
+    """等待一個片段各語言的辨識結果，回傳 ({語言: (文字, 信心度)}, 連線錯誤)"""
+    outcomes = {}
+    request_error = None
+    for language, future in futures.items():
+        try:
+            text, confidence = future.result()
+        except sr.UnknownValueError:
+            continue
+        except sr.RequestError as e:
+            request_error = e
+            continue
+        if text:
+            outcomes[language] = (text, confidence)
+    return outcomes, request_error
+
+
+def rank_languages(sr, segments, languages, request_error=None):
+    """串接各片段的結果並依信心度排序各語言，回傳 [{"language", "text", "confidence"}]
+
+    信心度取各片段依文字長度加權的平均；所有語言都無法辨識時拋出 sr.UnknownValueError，
+    全部失敗且有連線錯誤時拋出該錯誤。
+    """
+    ranked = []
+    for index, language in enumerate(languages):
+        pieces = [outcomes[language] for outcomes in segments if language in outcomes]
+        if not pieces:
+            continue
+        weighted = [(confidence * len(text), len(text)) for text, confidence in pieces if confidence is not None]
+        confidence = sum(value for value, _ in weighted) / sum(length for _, length in weighted) if weighted else None
+        # 信心度高者優先；沒有信心度的結果排在有信心度的之後，同分時依候選語言的順序
+        key = (confidence is None, -(confidence or 0.0), index)
+        ranked.append((key, {"language": language, "text": join_texts([text for text, _ in pieces], language), "confidence": confidence}))
+    if not ranked:
+        if request_error is not None:
+            raise request_error
+        raise sr.UnknownValueError()
+    ranked.sort(key=lambda item: item[0])
+    return [result for _, result in ranked]
+
+
+class SpeculativeRecognizer:
+    """說話期間在自然停頓處切出已完成的片段並立即送出辨識
+
+    作為 listen_to_spool 的 on_chunk 使用；語音結束後 finish 只需辨識最後一段，
+    再依序串接各片段的結果，因此說完後的等待時間與語音長度無關。
+    """
+
+    def __init__(self, sr, recognizer, languages, recognize_scored, executor,
+                 min_pause=0.3, min_segment=2.0, max_seconds=30.0):
+        self.sr = sr
+        self.recognizer = recognizer
+        self.languages = list(languages)
+        self.recognize_scored = recognize_scored
+        self.executor = executor
+        self.min_pause = min_pause
+        self.min_segment = min_segment
+        self.max_seconds = max_seconds
+        self.segments = []
+        # 寫入目前區塊之前的音訊長度
+        self.last_length = 0
+        self._reset(0)
+
+    def _reset(self, position):
+        self.cut = position
+        self.quiet_start = None
+        self.has_speech = False
+
+    def on_chunk(self, spool, speech):
+        if spool.length < self.cut:
+            # listen_to_spool 捨棄了過短的語音重新開始，先前送出的片段已無效
+            self.cancel()
+            self.last_length = 0
+            self._reset(0)
+        bytes_per_second = spool.sample_rate * spool.sample_width
+        if speech:
+            self.has_speech = True
+            self.quiet_start = None
+        elif self.quiet_start is None:
+            self.quiet_start = self.last_length
+        self.last_length = spool.length
+
+        if self.has_speech and self.quiet_start is not None:
+            quiet = spool.length - self.quiet_start
+            if quiet >= self.min_pause * bytes_per_second and self.quiet_start - self.cut >= self.min_segment * bytes_per_second:
+                # 在停頓中間切開，兩側都保留一些靜音
+                middle = self.quiet_start + quiet // 2
+                self._submit(spool, middle - middle % spool.sample_width)
+                return
+        if spool.length - self.cut >= self.max_seconds * bytes_per_second:
+            self._submit(spool, spool.length)
+
+    def _submit(self, spool, end):
+        with spool.view(self.cut, end - self.cut) as view:
+            audio = self.sr.AudioData(bytes(view), spool.sample_rate, spool.sample_width)
+        self.segments.append(submit_segment(self.executor, self.recognize_scored, self.recognizer, audio, self.languages))
+        self._reset(end)
+
+    def finish(self, spool):
+        """辨識最後一段並依序串接全部結果，回傳依信心度排序的各語言結果"""
+        if spool.length > self.cut and (self.has_speech or not self.segments):
+            self._submit(spool, spool.length)
+        segments = []
+        request_error = None
+        for futures in self.segments:
+            outcomes, error = collect_segment(self.sr, futures)
+            segments.append(outcomes)
+            request_error = error or request_error
+        self.segments = []
+        return rank_languages(self.sr, segments, self.languages, request_error)
+
+    def partial(self):
+        """開頭已辨識完成的片段以第一個候選語言串接的文字 (暫定結果)，遇到尚未完成的片段即停止"""
+        language = self.languages[0]
+        pieces = []
+        for futures in list(self.segments):
+            future = futures.get(language)
+            if future is None or not future.done():
+                break
+            if future.cancelled() or future.exception() is not None:
+                # 無法辨識的片段 (例如只有雜音) 在最終結果中同樣略過
+                continue
+            text, _ = future.result()
+            if text:
+                pieces.append(text)
+        return join_texts(pieces, language)
+
+    def cancel(self):
+        """取消尚未開始的片段辨識"""
+        for futures in self.segments:
+            for future in futures.values():
+                future.cancel()
+        self.segments = []
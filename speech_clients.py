@@ -0,0 +1,278 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""區域網路共用服務的用戶端 (由 create_api_script 複製到語音辨識 API 服務目錄)
+
+一台效能較好的電腦執行語音辨識服務 (以 --host 綁定區域網路介面)，各工作站在本機擷取語音，
+把音訊上傳到 /recognize_audio。clients.json 列出各用戶端的名稱與權杖，存檔後下一個請求即套用：
+
+    {
+      "clients": {"room-301": "7f1c0e...", "room-302": "a9e4d2..."},
+      "max_uploads": 2,
+      "max_upload_seconds": 600,
+      "scheduling": "fair"
+    }
+
+用戶端以 Authorization: Bearer <權杖> 標頭識別。辨識工作依用戶端輪流執行：每個用戶端一個佇列，
+工作執行緒空出時輪到下一個有工作的用戶端，長時間上傳切出的大量片段不會讓其他用戶端的短句排在後面；
+scheduling 為 fifo 時依送出順序執行。
+"""
+import hmac
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+from speech_files import file_signature
+
+# clients.json 未指定時使用的選項
+DEFAULT_OPTIONS = {
+    "max_uploads": 2,               # 每個用戶端同時進行的上傳數
+    "max_upload_seconds": 600.0,    # 單次上傳的音訊長度上限
+    "scheduling": "fair"            # fair 依用戶端輪流，fifo 依送出順序
+}
+
+# 收完整個檔案後再辨識的音訊格式
+FILE_TYPES = ('audio/wav', 'audio/x-wav', 'audio/wave', 'audio/flac', 'audio/x-flac', 'audio/aiff', 'audio/x-aiff')
+
+
+def parse_audio_type(content_type):
+    """解析上傳音訊的 Content-Type
+
+    audio/pcm; rate=16000; width=2 為單聲道、有號、little-endian 的 PCM，回傳 ('pcm', 取樣率, 取樣位元組數)；
+    WAV、AIFF 與 FLAC 回傳 ('file', None, None)；其他格式回傳 None。
+    """
+    media, _, parameters = (content_type or '').partition(';')
+    media = media.strip().lower()
+    if media in FILE_TYPES:
+        return 'file', None, None
+    if media != 'audio/pcm':
+        return None
+    options = {}
+    for parameter in parameters.split(';'):
+        name, _, value = parameter.partition('=')
+        options[name.strip().lower()] = value.strip()
+    try:
+        rate = int(options.get('rate') or 16000)
+        width = int(options.get('width') or 2)
+        channels = int(options.get('channels') or 1)
+    except ValueError:
+        return None
+    if channels != 1 or width not in (1, 2, 3, 4) or not 8000 <= rate <= 96000:
+        return None
+    return 'pcm', rate, width
+
+
+class ClientRegistry:
+    """依 clients.json 的修改時間重新載入用戶端權杖；檔案格式錯誤時沿用上一次成功載入的內容"""
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.lock = threading.Lock()
+        self.signature = None
+        self.content = {}
+
+    def _current(self):
+        signature = file_signature(self.path)
+        if signature == self.signature:
+            return self.content
+        with self.lock:
+            if signature != self.signature:
+                self.content = self._load(signature)
+                self.signature = signature
+        return self.content
+
+    def _load(self, signature):
+        if signature is None:
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8-sig') as f:
+                content = json.load(f)
+            if not isinstance(content, dict) or not isinstance(content.get("clients", {}), dict):
+                raise ValueError("clients 必須是 名稱: 權杖 的物件")
+        except (OSError, ValueError) as e:
+            logging.error(f"無法載入用戶端設定 {self.path}，沿用先前的設定: {e}")
+            return self.content
+        clients = {str(name): str(token) for name, token in content.get("clients", {}).items() if token}
+        for name, token in clients.items():
+            if len(token) < 16:
+                logging.warning(f"用戶端 {name} 的權杖少於 16 個字元，容易被猜中")
+        content["clients"] = clients
+        logging.info(f"已載入用戶端設定: {', '.join(sorted(clients)) or '無'}")
+        return content
+
+    def enabled(self):
+        """是否設定了任何用戶端 (設定後上傳音訊一律需要權杖)"""
+        return bool(self._current().get("clients"))
+
+    def options(self):
+        content = self._current()
+        return {key: content.get(key, value) for key, value in DEFAULT_OPTIONS.items()}
+
+    def authenticate(self, authorization):
+        """由 Authorization 標頭取得用戶端名稱，權杖無效時回傳 None"""
+        scheme, _, token = (authorization or '').partition(' ')
+        token = token.strip()
+        if scheme.lower() != 'bearer' or not token:
+            return None
+        token = token.encode('utf-8')
+        match = None
+        # 逐一以固定時間比較，比對時間不透露權杖內容
+        for name, expected in self._current().get("clients", {}).items():
+            if hmac.compare_digest(expected.encode('utf-8'), token):
+                match = name
+        return match
+
+
+class UploadLimiter:
+    """每個用戶端同時進行的上傳數上限"""
+
+    def __init__(self):
+        self.active = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, client, limit):
+        with self.lock:
+            if self.active.get(client, 0) >= int(limit):
+                return False
+            self.active[client] = self.active.get(client, 0) + 1
+            return True
+
+    def release(self, client):
+        with self.lock:
+            count = self.active.get(client, 0) - 1
+            if count > 0:
+                self.active[client] = count
+            else:
+                self.active.pop(client, None)
+
+
+class ClientExecutor:
+    """FairExecutor 中單一用戶端的視圖，介面與 concurrent.futures 的 executor.submit 相同"""
+
+    def __init__(self, executor, client):
+        self.executor = executor
+        self.client = client
+
+    def submit(self, function, *args, **kwargs):
+        return self.executor.submit(self.client, function, *args, **kwargs)
+
+
+class FairExecutor:
+    """依用戶端輪流執行工作的執行緒池
+
+    每個用戶端一個先進先出佇列；工作執行緒每次從排在最前面的用戶端取一件工作，
+    該用戶端還有工作時移到最後，因此每個有工作的用戶端輪流取得執行緒。fair 為 False 時所有工作共用一個佇列。
+    """
+
+    def __init__(self, workers=8, fair=True, thread_name_prefix='fair'):
+        self.workers = max(1, int(workers))
+        self.fair = fair
+        self.thread_name_prefix = thread_name_prefix
+        self.queues = OrderedDict()
+        self.condition = threading.Condition()
+        self.threads = []
+        self.idle = 0
+        self.queued = 0
+        self.shutting_down = False
+        self.counters = {}
+
+    def for_client(self, client):
+        return ClientExecutor(self, client)
+
+    def submit(self, client, function, *args, **kwargs):
+        future = Future()
+        with self.condition:
+            if self.shutting_down:
+                raise RuntimeError('cannot schedule new futures after shutdown')
+            key = client if self.fair else None
+            self.queues.setdefault(key, deque()).append((client, future, function, args, kwargs, time.monotonic()))
+            self.queued += 1
+            self._counter(client)["queued"] += 1
+            if self.queued > self.idle and len(self.threads) < self.workers:
+                thread = threading.Thread(target=self._work, name=f'{self.thread_name_prefix}_{len(self.threads)}', daemon=True)
+                self.threads.append(thread)
+                thread.start()
+            else:
+                self.condition.notify()
+        return future
+
+    def _counter(self, client):
+        counter = self.counters.get(client)
+        if counter is None:
+            counter = self.counters[client] = {"queued": 0, "running": 0, "completed": 0, "wait": 0.0}
+        return counter
+
+    def _next(self):
+        """取出下一件工作並把該用戶端移到最後，沒有工作且已關閉時回傳 None"""
+        with self.condition:
+            while not self.queues and not self.shutting_down:
+                self.idle += 1
+                self.condition.wait()
+                self.idle -= 1
+            if not self.queues:
+                return None
+            key, queue = next(iter(self.queues.items()))
+            item = queue.popleft()
+            del self.queues[key]
+            if queue:
+                self.queues[key] = queue
+            self.queued -= 1
+            counter = self._counter(item[0])
+            counter["queued"] -= 1
+            counter["running"] += 1
+            counter["wait"] += time.monotonic() - item[5]
+            return item
+
+    def _work(self):
+        while True:
+            item = self._next()
+            if item is None:
+                return
+            client, future, function, args, kwargs, _ = item
+            try:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        result = function(*args, **kwargs)
+                    except BaseException as e:
+                        future.set_exception(e)
+                    else:
+                        future.set_result(result)
+            finally:
+                with self.condition:
+                    counter = self._counter(client)
+                    counter["running"] -= 1
+                    counter["completed"] += 1
+
+    def stats(self):
+        """各用戶端排隊中、執行中與已完成的工作數及平均排隊時間"""
+        with self.condition:
+            return {
+                "scheduling": "fair" if self.fair else "fifo",
+                "workers": len(self.threads),
+                "clients": {
+                    client: {
+                        "queued": counter["queued"],
+                        "running": counter["running"],
+                        "completed": counter["completed"],
+                        "mean_wait_ms": round(counter["wait"] / (counter["completed"] + counter["running"]) * 1000, 1)
+                        if counter["completed"] + counter["running"] else None
+                    } for client, counter in self.counters.items()
+                }
+            }
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        with self.condition:
+            self.shutting_down = True
+            if cancel_futures:
+                for queue in self.queues.values():
+                    for item in queue:
+                        item[1].cancel()
+                        self._counter(item[0])["queued"] -= 1
+                self.queues.clear()
+                self.queued = 0
+            self.condition.notify_all()
+        if wait:
+            for thread in list(self.threads):
+                thread.join()
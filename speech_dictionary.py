@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""使用者詞典 (由 create_api_script 複製到語音辨識 API 服務目錄)
+
+詞典檔每行一條規則，# 開頭為註解：
+    句號 => 。
+    liber office => LibreOffice
+    + 語音辨識           (只作為辨識提示詞，不取代)
+
+所有取代規則編譯成 Aho-Corasick 自動機，一次掃描完成全部取代
+(同一位置有多條規則時取最長者，取代結果不再重複比對)。
+編譯結果以 pickle 快取在詞典旁，詞典檔變更時才重新編譯。
+"""
+import os
+import pickle
+import logging
+import threading
+from collections import deque
+
+from speech_files import file_signature
+
+# 快取格式版本，自動機結構變動時遞增
+CACHE_VERSION = 1
+
+
+class Dictionary:
+    """編譯好的取代規則與提示詞"""
+
+    def __init__(self, rules, hints):
+        self.hints = hints
+        self.rule_count = len(rules)
+        # 自動機：每個狀態的轉移表、失敗連結、
+        # 該狀態本身對應的規則 (長度, 取代文字) 與最近的可輸出後綴狀態
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [None]
+        self.output_link = [0]
+        for source, target in rules:
+            self._add(source, target)
+        self._link()
+
+    def _add(self, source, target):
+        state = 0
+        for char in source:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][char] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append(None)
+                self.output_link.append(0)
+            state = next_state
+        # 重複的來源以最後一條為準
+        self.output[state] = (len(source), target)
+
+    def _link(self):
+        """以廣度優先建立失敗連結與輸出連結"""
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(char, 0)
+                self.fail[next_state] = target if target != next_state else 0
+                link = self.fail[next_state]
+                self.output_link[next_state] = link if self.output[link] is not None else self.output_link[link]
+
+    def apply(self, text):
+        """一次掃描套用所有取代規則 (最左、最長優先，不重疊)"""
+        if not text or self.rule_count == 0:
+            return text
+        goto, fail, output, output_link = self.goto, self.fail, self.output, self.output_link
+        # longest[start] = 從 start 開始最長的規則 (結束位置, 取代文字)
+        longest = {}
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            match = state if output[state] is not None else output_link[state]
+            while match:
+                length, target = output[match]
+                start = index + 1 - length
+                best = longest.get(start)
+                if best is None or best[0] < index + 1:
+                    longest[start] = (index + 1, target)
+                match = output_link[match]
+        if not longest:
+            return text
+        pieces = []
+        position = 0
+        length = len(text)
+        while position < length:
+            best = longest.get(position)
+            if best is not None:
+                pieces.append(best[1])
+                position = best[0]
+            else:
+                pieces.append(text[position])
+                position += 1
+        return "".join(pieces)
+
+
+def parse_dictionary(content):
+    """解析詞典內容，回傳 (取代規則清單, 提示詞清單)"""
+    rules, hints = [], []
+    seen_hints = set()
+    for line_number, raw_line in enumerate(content.splitlines(), 1):
+        line = raw_line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if line.startswith('+'):
+            hint = line[1:].strip()
+            if hint and hint not in seen_hints:
+                seen_hints.add(hint)
+                hints.append(hint)
+            continue
+        if '=>' not in line:
+            logging.warning(f"詞典第 {line_number} 行格式錯誤: {raw_line}")
+            continue
+        source, target = (part.strip() for part in line.split('=>', 1))
+        if not source:
+            logging.warning(f"詞典第 {line_number} 行缺少來源文字: {raw_line}")
+            continue
+        rules.append((source, target))
+        # 取代後的專有名詞也是有用的提示詞
+        if len(target) > 1 and target not in seen_hints:
+            seen_hints.add(target)
+            hints.append(target)
+    return rules, hints
+
+
+class DictionaryStore:
+    """依詞典檔的修改時間載入詞典：優先使用磁碟快取，詞典變更時才重新編譯"""
+
+    def __init__(self, dictionary_path, cache_path=None):
+        self.dictionary_path = str(dictionary_path)
+        self.cache_path = str(cache_path) if cache_path else self.dictionary_path + '.cache'
+        self.lock = threading.Lock()
+        self.signature = None
+        self.dictionary = Dictionary([], [])
+
+    def get(self):
+        """取得目前的詞典 (每次呼叫只 stat 一次詞典檔)"""
+        signature = file_signature(self.dictionary_path)
+        if signature == self.signature:
+            return self.dictionary
+        with self.lock:
+            if signature != self.signature:
+                self.dictionary = self._load(signature)
+                self.signature = signature
+        return self.dictionary
+
+    def _load(self, signature):
+        if signature is None:
+            return Dictionary([], [])
+        cached = self._read_cache(signature)
+        if cached is not None:
+            return cached
+        try:
+            with open(self.dictionary_path, 'r', encoding='utf-8-sig') as f:
+                rules, hints = parse_dictionary(f.read())
+        except OSError as e:
+            logging.error(f"無法讀取詞典 {self.dictionary_path}: {e}")
+            return Dictionary([], [])
+        dictionary = Dictionary(rules, hints)
+        logging.info(f"已編譯詞典: {dictionary.rule_count} 條取代規則，{len(hints)} 個提示詞")
+        self._write_cache(signature, dictionary)
+        return dictionary
+
+    def _read_cache(self, signature):
+        try:
+            with open(self.cache_path, 'rb') as f:
+                version, cached_signature, dictionary = pickle.load(f)
+            if version == CACHE_VERSION and tuple(cached_signature) == signature:
+                logging.debug(f"使用詞典快取: {self.cache_path}")
+                return dictionary
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError, TypeError, AttributeError):
+            pass
+        return None
+
+    def _write_cache(self, signature, dictionary):
+        temp_path = self.cache_path + '.tmp'
+        try:
+            with open(temp_path, 'wb') as f:
+                pickle.dump((CACHE_VERSION, signature, dictionary), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, self.cache_path)
+        except OSError as e:
+            logging.warning(f"無法寫入詞典快取: {e}")
+
+
+def engine_hint_options(engine, hints, limit=500):
+    """依辨識引擎回傳傳遞提示詞的參數，不支援提示詞的引擎回傳空字典
+
+    sphinx 沒有偏重片語的參數：keyword_entries 會讓 pocketsphinx 改為關鍵字偵測，只輸出詞典中的詞，不再轉錄聽寫，
+    所以不傳提示詞給 sphinx。
+    """
+    if not hints:
+        return {}
+    hints = hints[:limit]
+    if engine == 'google_cloud':
+        return {'preferred_phrases': hints}
+    if engine == 'whisper':
+        return {'initial_prompt': '、'.join(hints)}
+    return {}
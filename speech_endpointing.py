@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""自適應斷句 (由 create_api_script 複製到語音辨識 API 服務目錄)
+
+固定的 pause_threshold 太短會把說到一半的話切斷，太長則每句話說完都要多等幾秒。
+這裡記錄每位說話者句中停頓 (靜音後又繼續說話) 的長度，以其高百分位數乘上 margin
+作為說完判定的等待時間，並限制在 min_threshold 與設定的 pause_threshold 之間。
+
+超過目前門檻的停頓會直接結束擷取而無法觀察，所以 margin 需大於 1，讓門檻能逐步放寬；
+樣本不足時使用設定的 pause_threshold。學到的停頓長度寫入 JSON 檔，服務重新啟動後沿用。
+
+門檻短於說話者偶爾較長的停頓時仍會提早結束擷取，單次辨識中被切斷的後半段無法補回，
+所以設定組合預設不開啟 (adaptive_pause)。省下的等待時間以實際量測的說完等待時間比較，
+而不是以設定值減去門檻推算。
+"""
+import os
+import json
+import logging
+import threading
+from collections import deque
+
+MODEL_VERSION = 1
+
+
+def median(values):
+    ordered = sorted(values)
+    return ordered[len(ordered) // 2] if ordered else None
+
+
+class PauseObserver:
+    """由 listen_to_spool 的 on_chunk 量測一段語音中的停頓長度，並轉呼叫 forward"""
+
+    def __init__(self, forward=None, min_pause=0.1):
+        self.forward = forward
+        self.min_pause = min_pause
+        self.pauses = []
+        self.position = 0
+        self.quiet_start = None
+        self.sample_rate, self.sample_width = 16000, 2
+
+    @property
+    def end_wait(self):
+        """最後一次偵測到語音後到擷取結束的秒數；擷取在說話中結束 (例如達到 phrase_time_limit) 時為 None"""
+        if self.quiet_start is None or self.position == 0:
+            return None
+        return (self.position - self.quiet_start) / float(self.sample_rate * self.sample_width)
+
+    def on_chunk(self, spool, speech):
+        if spool.length < self.position:
+            # 語音太短被捨棄，重新開始擷取
+            self.pauses = []
+            self.quiet_start = None
+        start = self.position
+        self.position = spool.length
+        self.sample_rate, self.sample_width = spool.sample_rate, spool.sample_width
+        if speech:
+            if self.quiet_start is not None:
+                pause = (start - self.quiet_start) / float(spool.sample_rate * spool.sample_width)
+                if pause >= self.min_pause:
+                    self.pauses.append(pause)
+            self.quiet_start = None
+        elif self.quiet_start is None:
+            self.quiet_start = start
+        if self.forward is not None:
+            self.forward(spool, speech)
+
+
+class PauseModel:
+    """每位說話者的句中停頓分佈與由此推得的說完判定門檻"""
+
+    def __init__(self, path=None, percentile=0.99, margin=1.3, min_threshold=0.5, window=500, min_samples=30):
+        self.path = str(path) if path else None
+        self.percentile = percentile
+        self.margin = margin
+        self.min_threshold = min_threshold
+        self.window = window
+        self.min_samples = min_samples
+        self.speakers = {}
+        # 本次執行中實際量測的說完等待時間，依是否套用了縮短的門檻分開記錄
+        self.end_waits = {"fixed": deque(maxlen=window), "adaptive": deque(maxlen=window)}
+        self.lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                content = json.load(f)
+            if content.get("version") != MODEL_VERSION:
+                return
+            for speaker, pauses in content.get("speakers", {}).items():
+                self.speakers[speaker] = deque((float(p) for p in pauses), maxlen=self.window)
+            logging.debug(f"已載入停頓模型: {', '.join(sorted(self.speakers))}")
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            logging.warning(f"無法載入停頓模型 {self.path}: {e}")
+
+    def save(self):
+        if not self.path:
+            return
+        with self.lock:
+            content = {
+                "version": MODEL_VERSION,
+                "speakers": {speaker: [round(p, 3) for p in pauses] for speaker, pauses in self.speakers.items()}
+            }
+        temp_path = self.path + '.tmp'
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(content, f)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logging.warning(f"無法寫入停頓模型: {e}")
+
+    def threshold(self, speaker, configured):
+        """說完判定的等待秒數；樣本不足時回傳設定值，設定值同時是上限"""
+        configured = float(configured)
+        with self.lock:
+            pauses = sorted(self.speakers.get(speaker, ()))
+        if len(pauses) < self.min_samples:
+            return configured
+        index = min(len(pauses) - 1, int(round(self.percentile * (len(pauses) - 1))))
+        return min(configured, max(self.min_threshold, pauses[index] * self.margin))
+
+    def record(self, speaker, pauses, configured=None, applied=None, end_wait=None):
+        """加入一段語音量測到的停頓並寫入檔案
+
+        end_wait 為量測到的說完等待時間 (PauseObserver.end_wait)，
+        applied 小於 configured 時計入自適應門檻，否則計入固定門檻 (包含樣本不足的暖身期)。
+        """
+        with self.lock:
+            history = self.speakers.setdefault(speaker, deque(maxlen=self.window))
+            history.extend(pauses)
+            if end_wait is not None:
+                adapted = configured is not None and applied is not None and float(applied) < float(configured)
+                self.end_waits["adaptive" if adapted else "fixed"].append(float(end_wait))
+        if pauses:
+            self.save()
+
+    def stats(self):
+        """各說話者的停頓樣本數與量測到的說完等待時間中位數；兩種門檻都有量測值時才回報省下的時間"""
+        with self.lock:
+            speakers = {speaker: len(pauses) for speaker, pauses in self.speakers.items()}
+            medians = {kind: median(waits) for kind, waits in self.end_waits.items()}
+            utterances = sum(len(waits) for waits in self.end_waits.values())
+        saving = None
+        if medians["fixed"] is not None and medians["adaptive"] is not None:
+            saving = round((medians["fixed"] - medians["adaptive"]) * 1000, 1)
+        return {
+            "speakers": speakers,
+            "utterances": utterances,
+            "median_end_wait_ms": {kind: round(value * 1000, 1) if value is not None else None
+                                   for kind, value in medians.items()},
+            "median_saving_ms": saving
+        }
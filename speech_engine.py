@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""辨識引擎呼叫層 (由 create_api_script 複製到語音辨識 API 服務目錄)
+
+每次辨識都有期限 (deadline)。主要引擎在近期延遲的百分位數內沒有回應時，
+再送出一份相同的請求 (hedged request)，採用先完成者，另一份尚未開始時直接取消，
+已送出時以剩餘期限作為其連線逾時，期限一到即結束。
+連續逾時達到門檻時斷路器開啟，改用設定的備用引擎，經過 reset_timeout 後再試主要引擎。
+"""
+import copy
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+
+class LatencyTracker:
+    """記錄最近的成功請求延遲並計算百分位數"""
+
+    def __init__(self, window=200, min_samples=5):
+        self.samples = deque(maxlen=window)
+        self.min_samples = min_samples
+        self.lock = threading.Lock()
+
+    def record(self, seconds):
+        with self.lock:
+            self.samples.append(seconds)
+
+    def percentile(self, fraction):
+        """樣本不足時回傳 None"""
+        with self.lock:
+            if len(self.samples) < self.min_samples:
+                return None
+            ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+        return ordered[index]
+
+
+class CircuitBreaker:
+    """連續逾時達到 failure_threshold 次即開啟，reset_timeout 秒後放行一次試探請求"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=3, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """是否可以使用主要引擎"""
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_timeout(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logging.warning(f"辨識引擎連續逾時 {self.failures} 次，斷路器開啟")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class DeadlineExceeded(Exception):
+    """辨識請求超過期限"""
+
+
+class HedgedEngine:
+    """具期限、對沖請求與斷路器的辨識引擎呼叫"""
+
+    def __init__(self, deadline=10.0, hedge_percentile=0.9, min_hedge_delay=0.3, max_hedge_delay=3.0,
+                 failure_threshold=3, reset_timeout=30.0, max_workers=8, definitive_errors=()):
+        # 這些錯誤代表引擎已給出答案 (例如無法辨識的語音)，不再等待對沖請求
+        self.definitive_errors = tuple(definitive_errors)
+        self.latency = LatencyTracker()
+        self.breaker = CircuitBreaker()
+        self.configure(deadline, hedge_percentile, min_hedge_delay, max_hedge_delay, failure_threshold, reset_timeout)
+        # 獨立的執行緒池，避免被呼叫端的執行緒池 (例如先行辨識) 佔滿而互相等待
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='engine')
+        self.counters = {"requests": 0, "hedged": 0, "hedge_wins": 0, "timeouts": 0, "failovers": 0}
+        self.lock = threading.Lock()
+
+    def configure(self, deadline=10.0, hedge_percentile=0.9, min_hedge_delay=0.3, max_hedge_delay=3.0,
+                  failure_threshold=3, reset_timeout=30.0):
+        """更新設定，保留延遲統計與斷路器狀態"""
+        self.deadline = float(deadline)
+        self.hedge_percentile = float(hedge_percentile)
+        self.min_hedge_delay = float(min_hedge_delay)
+        self.max_hedge_delay = float(max_hedge_delay)
+        self.breaker.failure_threshold = int(failure_threshold)
+        self.breaker.reset_timeout = float(reset_timeout)
+
+    def hedge_delay(self):
+        """送出對沖請求前的等待時間：近期延遲的百分位數，樣本不足時用上限"""
+        delay = self.latency.percentile(self.hedge_percentile)
+        if delay is None:
+            delay = self.max_hedge_delay
+        return min(self.max_hedge_delay, max(self.min_hedge_delay, delay))
+
+    def _count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def call(self, primary, secondary, recognizer, audio, language, deadline=None):
+        """以 primary(recognizer, audio, language) 辨識，斷路器開啟時改用 secondary (可為 None)
+
+        超過期限時拋出 DeadlineExceeded；引擎本身的錯誤原樣拋出。
+        """
+        self._count("requests")
+        deadline_at = time.monotonic() + float(deadline or self.deadline)
+        if not self.breaker.allow() and secondary is not None:
+            self._count("failovers")
+            return self._run_single(secondary, recognizer, audio, language, deadline_at)
+        try:
+            result = self._run_hedged(primary, recognizer, audio, language, deadline_at)
+        except DeadlineExceeded:
+            self._count("timeouts")
+            self.breaker.record_timeout()
+            raise
+        self.breaker.record_success()
+        return result
+
+    def _submit(self, engine, recognizer, audio, language, deadline_at):
+        # 每份請求使用自己的 recognizer 複本，連線逾時不超過剩餘期限
+        attempt = copy.copy(recognizer)
+        attempt.operation_timeout = max(0.1, deadline_at - time.monotonic())
+        started = time.monotonic()
+        future = self.executor.submit(engine, attempt, audio, language)
+        return future, started
+
+    def _run_single(self, engine, recognizer, audio, language, deadline_at):
+        future, _ = self._submit(engine, recognizer, audio, language, deadline_at)
+        done, _ = wait([future], timeout=max(0.0, deadline_at - time.monotonic()))
+        if not done:
+            future.cancel()
+            raise DeadlineExceeded("備用辨識引擎逾時")
+        return future.result()
+
+    def _run_hedged(self, engine, recognizer, audio, language, deadline_at):
+        first = self._submit(engine, recognizer, audio, language, deadline_at)
+        attempts = {first[0]: first[1]}
+        done, pending = wait(attempts, timeout=min(self.hedge_delay(), max(0.0, deadline_at - time.monotonic())),
+                             return_when=FIRST_COMPLETED)
+        if not done and time.monotonic() < deadline_at:
+            self._count("hedged")
+            hedge = self._submit(engine, recognizer, audio, language, deadline_at)
+            attempts[hedge[0]] = hedge[1]
+            pending = set(attempts)
+
+        error = None
+        while True:
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # 其中一份失敗時等待另一份；無法辨識的語音兩份結果相同，直接結束
+                    error = e
+                    if isinstance(e, self.definitive_errors):
+                        self._cancel(pending)
+                        pending = set()
+                    continue
+                self.latency.record(time.monotonic() - attempts[future])
+                if future is not first[0]:
+                    self._count("hedge_wins")
+                self._cancel(pending)
+                return result
+            if not pending:
+                raise error
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0:
+                self._cancel(pending)
+                raise DeadlineExceeded("辨識請求超過期限")
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+
+    @staticmethod
+    def _cancel(futures):
+        """取消尚未開始的請求；已送出的請求在剩餘期限內自行逾時，結果不再使用"""
+        for future in futures:
+            future.cancel()
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+        stats["breaker"] = self.breaker.state
+        stats["hedge_delay_ms"] = round(self.hedge_delay() * 1000, 1)
+        median = self.latency.percentile(0.5)
+        stats["latency_median_ms"] = round(median * 1000, 1) if median is not None else None
+        return stats
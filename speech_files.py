@@ -0,0 +1,16 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""設定檔的共用輔助函式 (由 create_api_script 複製到語音辨識 API 服務目錄)
+
+詞典、設定組合與用戶端設定都依檔案的修改時間與大小判斷是否需要重新載入。
+"""
+import os
+
+
+def file_signature(path):
+    """檔案的 (修改時間, 大小)，無法讀取時回傳 None"""
+    try:
+        stat = os.stat(path)
+        return (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        return None
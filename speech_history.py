@@ -0,0 +1,316 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""辨識紀錄 (由 create_api_script 複製到語音辨識 API 服務目錄)
+
+每次辨識的文字、時間、引擎、語言與信心度記錄在本機的 SQLite 資料庫 (history.db)。
+請求只把紀錄放進佇列；背景執行緒累積一批 (最多 batch_size 筆或 flush_interval 秒) 後以一個交易寫入，
+寫入磁碟不在請求路徑上。文字以 FTS5 (trigram) 建立全文索引，中文也能以任意三個字以上的片段搜尋；
+較短的關鍵字或 SQLite 不支援 FTS5 trigram 時改用 LIKE。
+"""
+import time
+import uuid
+import wave
+import queue
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+
+# 紀錄的欄位 (id 以外)
+COLUMNS = ("created_at", "kind", "client", "profile", "source", "text", "language", "engine", "confidence",
+           "audio_seconds", "capture_ms", "latency_ms", "audio_ref")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transcripts (
+    id INTEGER PRIMARY KEY,
+    created_at REAL NOT NULL,       -- Unix 時間
+    kind TEXT NOT NULL,             -- recognize (單次辨識)、upload (用戶端上傳) 或 stream (連續聽寫)
+    client TEXT,
+    profile TEXT,
+    source TEXT,                    -- 音訊來源或上傳的格式
+    text TEXT NOT NULL,
+    language TEXT,
+    engine TEXT,
+    confidence REAL,
+    audio_seconds REAL,             -- 音訊長度
+    capture_ms REAL,                -- 從請求開始到擷取 (或上傳) 完成
+    latency_ms REAL,                -- 從擷取完成到取得結果
+    audio_ref TEXT                  -- 音訊檔路徑 (保存音訊或音訊來源本身是檔案時)
+);
+CREATE INDEX IF NOT EXISTS transcripts_created ON transcripts (created_at);
+"""
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS transcripts_fts USING fts5(
+    text, content='transcripts', content_rowid='id', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS transcripts_fts_insert AFTER INSERT ON transcripts BEGIN
+    INSERT INTO transcripts_fts (rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS transcripts_fts_delete AFTER DELETE ON transcripts BEGIN
+    INSERT INTO transcripts_fts (transcripts_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+"""
+
+INSERT = f"INSERT INTO transcripts ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+
+# trigram 索引可搜尋的最短關鍵字長度
+MIN_FTS_TERM = 3
+# 多久檢查一次過期的紀錄 (秒)
+PRUNE_INTERVAL = 3600.0
+
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+class TranscriptStore:
+    """辨識紀錄資料庫：record 放進佇列後立即返回，由寫入執行緒批次寫入"""
+
+    def __init__(self, path, audio_dir=None, batch_size=64, flush_interval=1.0, max_pending=10000):
+        self.path = str(path)
+        self.audio_dir = Path(audio_dir) if audio_dir else None
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retention_days = 0
+        self.queue = queue.Queue(maxsize=max_pending)
+        # 寫入執行緒建立資料表後決定是否使用全文索引
+        self.fts = False
+        self.ready = threading.Event()
+        self.lock = threading.Lock()
+        self.counters = {"recorded": 0, "dropped": 0, "batches": 0, "errors": 0}
+        self.thread = threading.Thread(target=self._write_loop, name='history-writer', daemon=True)
+        self.thread.start()
+
+    def _count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] += amount
+
+    def record(self, entry, audio=None):
+        """把一筆紀錄放進寫入佇列，不等待寫入
+
+        audio 為 AudioSpool 時由寫入執行緒另存為 WAV 並關閉，呼叫端不再使用它。
+        """
+        entry = dict(entry)
+        entry.setdefault("created_at", time.time())
+        try:
+            self.queue.put_nowait((entry, audio))
+        except queue.Full:
+            self._count("dropped")
+            logging.warning("辨識紀錄的寫入佇列已滿，略過一筆紀錄")
+            if audio is not None:
+                audio.close()
+
+    def flush(self, timeout=5.0):
+        """等待佇列中已有的紀錄寫入 (搜尋前呼叫，剛辨識的結果也查得到)"""
+        done = threading.Event()
+        try:
+            self.queue.put((None, done), timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def close(self, timeout=5.0):
+        """寫入佇列中剩餘的紀錄後關閉資料庫"""
+        try:
+            self.queue.put((None, None), timeout=timeout)
+        except queue.Full:
+            return
+        self.thread.join(timeout)
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=10)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def _setup(self, connection):
+        connection.executescript(SCHEMA)
+        try:
+            connection.executescript(FTS_SCHEMA)
+            self.fts = True
+        except sqlite3.OperationalError as e:
+            logging.warning(f"SQLite 不支援 FTS5 trigram，辨識紀錄改以 LIKE 搜尋: {e}")
+
+    def _write_loop(self):
+        connection = None
+        try:
+            connection = self._connect()
+            self._setup(connection)
+        except sqlite3.Error as e:
+            logging.error(f"無法開啟辨識紀錄 {self.path}: {e}")
+            connection = None
+        finally:
+            self.ready.set()
+        last_prune = 0.0
+        stopping = False
+        while not stopping:
+            batch, waiters = [], []
+            item = self.queue.get()
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                entry, extra = item
+                if entry is None:
+                    # 佇列中的標記：flush 等待者或關閉
+                    if extra is None:
+                        stopping = True
+                    else:
+                        waiters.append(extra)
+                    break
+                batch.append((entry, extra))
+                remaining = deadline - time.monotonic()
+                if len(batch) >= self.batch_size or remaining <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if batch:
+                self._write(connection, batch)
+            for waiter in waiters:
+                waiter.set()
+            if connection is not None and self.retention_days and time.monotonic() - last_prune > PRUNE_INTERVAL:
+                last_prune = time.monotonic()
+                self._prune(connection)
+        if connection is not None:
+            connection.close()
+
+    def _write(self, connection, batch):
+        rows = []
+        for entry, audio in batch:
+            if audio is not None:
+                entry["audio_ref"] = self._save_audio(entry, audio)
+            rows.append(tuple(entry.get(column) for column in COLUMNS))
+        if connection is None:
+            self._count("errors", len(rows))
+            return
+        try:
+            with connection:
+                connection.executemany(INSERT, rows)
+        except sqlite3.Error as e:
+            self._count("errors", len(rows))
+            logging.error(f"寫入辨識紀錄失敗 ({len(rows)} 筆): {e}")
+            return
+        self._count("recorded", len(rows))
+        self._count("batches")
+
+    def _save_audio(self, entry, audio):
+        """把 AudioSpool 另存為 WAV，回傳檔案路徑"""
+        try:
+            if self.audio_dir is None:
+                return None
+            self.audio_dir.mkdir(parents=True, exist_ok=True)
+            stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(entry["created_at"]))
+            path = self.audio_dir / f"{stamp}-{uuid.uuid4().hex[:6]}.wav"
+            with wave.open(str(path), 'wb') as writer:
+                writer.setnchannels(1)
+                writer.setsampwidth(audio.sample_width)
+                writer.setframerate(audio.sample_rate)
+                with audio.view() as view:
+                    writer.writeframes(view)
+            return str(path)
+        except (OSError, wave.Error) as e:
+            logging.error(f"保存辨識紀錄的音訊失敗: {e}")
+            return None
+        finally:
+            audio.close()
+
+    def _prune(self, connection):
+        """刪除超過保留天數的紀錄與其另存的音訊檔"""
+        cutoff = time.time() - float(self.retention_days) * 86400
+        try:
+            with connection:
+                expired = connection.execute(
+                    "SELECT audio_ref FROM transcripts WHERE created_at < ? AND audio_ref IS NOT NULL", (cutoff,)
+                ).fetchall()
+                deleted = connection.execute("DELETE FROM transcripts WHERE created_at < ?", (cutoff,)).rowcount
+        except sqlite3.Error as e:
+            logging.error(f"刪除過期的辨識紀錄失敗: {e}")
+            return
+        for (audio_ref,) in expired:
+            # 只刪除自己另存的音訊，不動音訊來源本身的檔案
+            if self.audio_dir is not None and Path(audio_ref).parent == self.audio_dir:
+                try:
+                    Path(audio_ref).unlink()
+                except OSError:
+                    pass
+        if deleted:
+            logging.info(f"已刪除 {deleted} 筆超過 {self.retention_days} 天的辨識紀錄")
+
+    def _query(self, sql, parameters):
+        self.ready.wait(10)
+        connection = sqlite3.connect(self.path, timeout=10)
+        try:
+            return connection.execute(sql, parameters).fetchall()
+        finally:
+            connection.close()
+
+    def search(self, query=None, limit=20, before=None, kind=None, client=None):
+        """依關鍵字 (空白分隔，全部符合) 搜尋紀錄，新的在前；沒有關鍵字時列出最近的紀錄
+
+        before 為上一頁最後一筆的 id，用於分頁。
+        """
+        self.flush()
+        conditions, parameters = [], []
+        fts_terms = []
+        for term in (query or '').split():
+            if self.fts and len(term) >= MIN_FTS_TERM:
+                fts_terms.append('"' + term.replace('"', '""') + '"')
+            else:
+                conditions.append("text LIKE ? ESCAPE '\\'")
+                parameters.append(f"%{escape_like(term)}%")
+        if fts_terms:
+            conditions.append("id IN (SELECT rowid FROM transcripts_fts WHERE transcripts_fts MATCH ?)")
+            parameters.append(' AND '.join(fts_terms))
+        for column, value in (("kind", kind), ("client", client)):
+            if value:
+                conditions.append(f"{column} = ?")
+                parameters.append(value)
+        if before is not None:
+            conditions.append("id < ?")
+            parameters.append(int(before))
+        sql = (f"SELECT id, {', '.join(COLUMNS)} FROM transcripts WHERE {' AND '.join(conditions) or '1'} "
+               f"ORDER BY id DESC LIMIT ?")
+        rows = self._query(sql, parameters + [max(1, min(int(limit), 200))])
+        return [dict(zip(("id",) + COLUMNS, row)) for row in rows]
+
+    def latency(self, days=7):
+        """最近 days 天每天各類辨識的筆數、音訊總長與延遲百分位數 (容量規劃用)"""
+        self.flush()
+        rows = self._query(
+            "SELECT date(created_at, 'unixepoch', 'localtime'), kind, latency_ms, audio_seconds "
+            "FROM transcripts WHERE created_at >= ? ORDER BY created_at",
+            (time.time() - float(days) * 86400,)
+        )
+        groups = {}
+        for day, kind, latency_ms, audio_seconds in rows:
+            group = groups.setdefault((day, kind), {"latency": [], "audio_seconds": 0.0})
+            if latency_ms is not None:
+                group["latency"].append(latency_ms)
+            group["audio_seconds"] += audio_seconds or 0.0
+        summary = []
+        for (day, kind), group in groups.items():
+            ordered = sorted(group["latency"])
+            summary.append({
+                "date": day,
+                "kind": kind,
+                "count": len(ordered),
+                "audio_seconds": round(group["audio_seconds"], 1),
+                "latency_p50_ms": percentile(ordered, 0.5),
+                "latency_p95_ms": percentile(ordered, 0.95),
+                "latency_max_ms": ordered[-1] if ordered else None
+            })
+        return summary
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+        stats["pending"] = self.queue.qsize()
+        stats["full_text_index"] = self.fts
+        return stats
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""辨識設定檔 (由 create_api_script 複製到語音辨識 API 服務目錄)
+
+profiles.json 定義具名的設定組合，每個命令選用一組；檔案存檔後下一個請求即套用，不需重新啟動服務：
+
+    {
+      "defaults": {"language": "zh-TW"},
+      "profiles": {
+        "fast-commands": {"pause_threshold": 0.5, "timeout": 5},
+        "meeting": {"pause_threshold": 1.2, "languages": ["zh-TW", "en-US"]}
+      },
+      "engine": {"deadline": 10, "secondary": "sphinx"}
+    }
+
+每組設定依序由 DEFAULT_SETTINGS、檔案的 defaults、DEFAULT_PROFILES 中的同名設定與檔案中的同名設定合併而成，
+請求本身帶的參數優先於設定檔。engine 為整個服務共用的辨識引擎設定 (期限、對沖請求與斷路器)，
+history 為辨識紀錄的設定。
+"""
+import json
+import logging
+import threading
+
+from speech_files import file_signature
+
+# 所有設定項目與預設值
+DEFAULT_SETTINGS = {
+    # 語言
+    "language": "zh-TW",
+    "languages": None,              # 候選語言清單，多於一個時同時辨識並取信心度最高者
+    # 音訊來源: default、mic:<編號或名稱>、file:<路徑>、pcm:<路徑或 ->、tcp:<連接埠> (見 speech_sources)
+    "source": "default",
+    # 斷句
+    "timeout": 10.0,                # 等待開始說話的秒數
+    "phrase_time_limit": None,      # 單段語音的長度上限
+    "pause_threshold": 5.0,         # 停頓多久視為說完
+    "non_speaking_duration": 1.0,   # 語音前後保留的靜音長度
+    "adaptive_pause": False,        # 依說話者的停頓習慣縮短 pause_threshold (設定值為上限)
+    # 環境噪音校正
+    "ambient_duration": 1.0,        # 開始聆聽前校正環境噪音的秒數，0 表示不校正
+    "energy_threshold": None,       # 指定時使用固定的音量門檻，不再自動調整
+    # 辨識引擎
+    "engine": "google",             # google、sphinx 或 whisper
+    "deadline": None,               # 每次辨識請求的期限，未指定時使用 engine 設定
+    # 連續聽寫
+    "partial_interval": 0.0,
+    "workers": 2
+}
+
+# 內建的設定組合
+DEFAULT_PROFILES = {
+    "fast-commands": {
+        "timeout": 5.0,
+        "phrase_time_limit": 10.0,
+        "pause_threshold": 0.5,
+        "non_speaking_duration": 0.3,
+        "ambient_duration": 0.3,
+        "deadline": 3.0
+    },
+    "dictation": {
+        "timeout": 15.0,
+        "pause_threshold": 8.0,
+        "non_speaking_duration": 1.5
+    },
+    "long-form": {
+        "pause_threshold": 0.8,
+        "non_speaking_duration": 0.5,
+        "ambient_duration": 0.5,
+        "partial_interval": 1.0
+    }
+}
+
+# 服務共用的辨識引擎設定
+DEFAULT_ENGINE = {
+    "deadline": 10.0,           # 每次辨識請求的期限 (秒)
+    "hedge_percentile": 0.9,    # 超過近期延遲的這個百分位數仍未回應時送出對沖請求
+    "min_hedge_delay": 0.3,
+    "max_hedge_delay": 3.0,
+    "failure_threshold": 3,     # 連續逾時幾次後改用備用引擎
+    "reset_timeout": 30.0,      # 改用備用引擎多久後再試主要引擎
+    "secondary": None,          # 備用引擎: "sphinx" 或 "whisper"
+    "google_endpoint": None,    # 自訂 Google 語音 API 位址 (例如本機的測試伺服器)
+    "processes": "auto"         # sphinx / whisper 的工作程序數，auto 為 CPU 核心數減一，0 表示在執行緒中辨識
+}
+
+# 辨識紀錄 (見 speech_history) 的設定
+DEFAULT_HISTORY = {
+    "enabled": True,            # 把辨識結果記錄到 history.db
+    "keep_audio": False,        # 另存單次辨識與上傳的音訊 (history_audio/)
+    "retention_days": 0         # 保留天數，0 表示不刪除
+}
+
+
+class ProfileStore:
+    """依設定檔的修改時間重新載入設定；檔案格式錯誤時沿用上一次成功載入的內容"""
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.lock = threading.Lock()
+        self.signature = None
+        self.content = {}
+
+    def _current(self):
+        """取得目前的設定檔內容 (每次呼叫只 stat 一次設定檔)"""
+        signature = file_signature(self.path)
+        if signature == self.signature:
+            return self.content
+        with self.lock:
+            if signature != self.signature:
+                self.content = self._load(signature)
+                self.signature = signature
+        return self.content
+
+    def _load(self, signature):
+        if signature is None:
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8-sig') as f:
+                content = json.load(f)
+            if not isinstance(content, dict):
+                raise ValueError("設定檔最外層必須是物件")
+        except (OSError, ValueError) as e:
+            logging.error(f"無法載入設定檔 {self.path}，沿用先前的設定: {e}")
+            return self.content
+        logging.info(f"已載入設定檔，設定組合: {', '.join(sorted(content.get('profiles', {})))}")
+        return content
+
+    def names(self):
+        return sorted(set(DEFAULT_PROFILES) | set(self._current().get("profiles", {})))
+
+    def get(self, name=None):
+        """取得合併後的設定組合，名稱不存在時只使用預設值"""
+        content = self._current()
+        custom = content.get("profiles", {})
+        if name and name not in DEFAULT_PROFILES and name not in custom:
+            logging.warning(f"找不到設定組合 {name}，使用預設值")
+        settings = dict(DEFAULT_SETTINGS)
+        settings.update(content.get("defaults", {}))
+        settings.update(DEFAULT_PROFILES.get(name, {}))
+        settings.update(custom.get(name, {}))
+        return settings
+
+    def engine(self):
+        """取得辨識引擎設定"""
+        settings = dict(DEFAULT_ENGINE)
+        settings.update(self._current().get("engine", {}))
+        return settings
+
+    def history(self):
+        """取得辨識紀錄設定"""
+        settings = dict(DEFAULT_HISTORY)
+        settings.update(self._current().get("history", {}))
+        return settings
+
+
+def resolve_settings(store, payload):
+    """以請求中的 profile 取得設定組合，再以請求本身帶的參數覆寫"""
+    settings = store.get(payload.get("profile"))
+    for key in DEFAULT_SETTINGS:
+        if payload.get(key) is not None:
+            settings[key] = payload[key]
+    return settings
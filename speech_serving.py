@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""WSGI / ASGI 伺服器選擇 (由 create_api_script 複製到語音辨識 API 服務目錄)
+
+werkzeug 的伺服器每個連線建立一個執行緒，沒有連線數上限，也沒有閒置連線逾時。
+已安裝 waitress (純 Python) 時改用它：固定數量的工作執行緒、連線數上限、
+listen backlog 與 keep-alive 閒置逾時。兩者都提供 serve_forever / shutdown / server_close，
+shutdown 時停止接受新連線，等進行中的請求送完回應後才結束。
+ASGI 版本 (見 speech_asgi) 使用 uvicorn。
+"""
+import time
+import socket
+import importlib
+import logging
+import platform
+import threading
+
+# 預設的伺服器選項 (與 API 腳本的命令列參數對應)
+DEFAULT_OPTIONS = {
+    "server": "auto",
+    "threads": 8,               # 工作執行緒數
+    "backlog": 128,             # 尚未接受的連線佇列長度
+    "keep_alive": 30,           # keep-alive 連線閒置多久後關閉 (秒)
+    "connection_limit": 100,    # 同時開啟的連線數上限，超過時暫停接受新連線
+    "shutdown_timeout": 10.0    # 關閉時等待回應送完的秒數
+}
+
+
+def bind_socket(start_port, retries=3, backlog=128, host='127.0.0.1'):
+    """先綁定監聽端口，讓連線在模組載入期間就能排入佇列
+
+    端口被占用時依序嘗試後面的端口 (共 retries 個)，回傳 (socket, 實際的端口)；都被占用時回傳 (None, None)。
+    """
+    port = start_port
+    for _ in range(retries):
+        sock = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET, socket.SOCK_STREAM)
+        if platform.system() != 'Windows':
+            # Windows 的 SO_REUSEADDR 會允許搶占使用中的端口，只在其他系統設定
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            sock.bind((host, port))
+            sock.listen(backlog)
+            return sock, port
+        except OSError:
+            sock.close()
+            if port + 1 < start_port + retries:
+                logging.warning(f"端口 {port} 已被占用，嘗試使用 {port+1}")
+            else:
+                logging.warning(f"端口 {port} 已被占用")
+            port += 1
+    return None, None
+
+
+def waitress_available():
+    import importlib.util
+    return importlib.util.find_spec('waitress') is not None
+
+
+def asgi_available():
+    import importlib.util
+    return importlib.util.find_spec('uvicorn') is not None
+
+
+class WaitressServer:
+    """以 waitress 提供服務，介面與 werkzeug 的伺服器相同"""
+
+    def __init__(self, app, sock, threads=8, backlog=128, keep_alive=30, connection_limit=100, shutdown_timeout=10.0):
+        from waitress.server import create_server
+        self.map = {}
+        self.server = create_server(
+            app, map=self.map, sockets=[sock], threads=int(threads), backlog=int(backlog),
+            channel_timeout=int(keep_alive), connection_limit=int(connection_limit),
+            asyncore_use_poll=True, ident='speech_api'
+        )
+        self.shutdown_timeout = float(shutdown_timeout)
+        self.stopping = threading.Event()
+        self.stopped = threading.Event()
+
+    def _loop(self, timeout):
+        from waitress import wasyncore
+        wasyncore.loop(timeout=timeout, map=self.map, use_poll=True, count=1)
+
+    def _busy(self):
+        """仍有請求在處理或回應尚未送完的連線"""
+        return any(getattr(channel, 'requests', None) or getattr(channel, 'total_outbufs_len', 0)
+                   for channel in list(self.map.values()))
+
+    def serve_forever(self):
+        try:
+            while not self.stopping.is_set():
+                self._loop(0.5)
+            # 停止接受新連線，送完已開始處理的請求
+            self.server.accepting = False
+            deadline = time.monotonic() + self.shutdown_timeout
+            while self._busy() and time.monotonic() < deadline:
+                self._loop(0.05)
+            self.server.task_dispatcher.shutdown(cancel_pending=True, timeout=1.0)
+        finally:
+            self.stopped.set()
+
+    def shutdown(self):
+        """要求 serve_forever 結束 (可由其他執行緒呼叫)，等待其完成"""
+        self.stopping.set()
+        self.server.pull_trigger()
+        self.stopped.wait(self.shutdown_timeout + 5.0)
+
+    def server_close(self):
+        from waitress import wasyncore
+        wasyncore.close_all(self.map)
+
+
+class UvicornServer:
+    """以 uvicorn 提供 ASGI 應用程式，介面與 werkzeug 的伺服器相同
+
+    keep_alive 對應 timeout_keep_alive；connection_limit 對應 limit_concurrency，超過時回應 503。
+    """
+
+    def __init__(self, app, sock, backlog=128, keep_alive=30, connection_limit=100, shutdown_timeout=10.0):
+        import uvicorn
+        config = uvicorn.Config(
+            app, backlog=int(backlog), timeout_keep_alive=int(keep_alive), limit_concurrency=int(connection_limit),
+            timeout_graceful_shutdown=int(shutdown_timeout), lifespan='on', log_config=None, access_log=False
+        )
+        self.server = uvicorn.Server(config)
+        self.sock = sock
+        self.stopped = threading.Event()
+        self.shutdown_timeout = float(shutdown_timeout)
+
+    def serve_forever(self):
+        try:
+            self.server.run(sockets=[self.sock])
+        finally:
+            self.stopped.set()
+
+    def shutdown(self):
+        """要求 serve_forever 結束：停止接受新連線並等待進行中的請求完成"""
+        self.server.should_exit = True
+        self.stopped.wait(self.shutdown_timeout + 5.0)
+
+    def server_close(self):
+        pass
+
+
+def make_asgi_server(app, sock, options=None):
+    """以 uvicorn 提供 ASGI 應用程式，回傳 (伺服器, 'uvicorn')"""
+    settings = dict(DEFAULT_OPTIONS)
+    settings.update({key: value for key, value in (options or {}).items() if value is not None})
+    server = UvicornServer(app, sock, settings["backlog"], settings["keep_alive"], settings["connection_limit"],
+                           settings["shutdown_timeout"])
+    logging.info(f"使用 uvicorn 伺服器 (ASGI)，阻塞工作執行緒 {settings['threads']}，keep-alive {settings['keep_alive']} 秒")
+    return server, 'uvicorn'
+
+
+def resolve_server(kind):
+    """auto 在已安裝 waitress 時使用 waitress，否則使用 werkzeug"""
+    if kind in (None, 'auto'):
+        return 'waitress' if waitress_available() else 'werkzeug'
+    return kind
+
+
+def preload(kind, interface='wsgi'):
+    """預先匯入伺服器模組 (熱備援實例接手前使用)"""
+    if interface == 'asgi':
+        names = ('uvicorn',)
+    elif resolve_server(kind) == 'waitress':
+        names = ('waitress.server',)
+    else:
+        names = ('werkzeug.serving',)
+    for name in names:
+        importlib.import_module(name)
+
+
+def make_wsgi_server(app, sock, options=None):
+    """依選項建立伺服器，回傳 (伺服器, 實際使用的種類)"""
+    settings = dict(DEFAULT_OPTIONS)
+    settings.update({key: value for key, value in (options or {}).items() if value is not None})
+    kind = resolve_server(settings["server"])
+    if kind == 'waitress':
+        server = WaitressServer(app, sock, settings["threads"], settings["backlog"], settings["keep_alive"],
+                                settings["connection_limit"], settings["shutdown_timeout"])
+        logging.info(f"使用 waitress 伺服器，工作執行緒 {settings['threads']}，連線上限 {settings['connection_limit']}，"
+                     f"keep-alive {settings['keep_alive']} 秒")
+        return server, kind
+    from werkzeug.serving import make_server
+    host, port = sock.getsockname()[:2]
+    if settings["server"] == 'auto':
+        logging.info("未安裝 waitress，使用 werkzeug 伺服器 (每個連線一個執行緒)")
+    return make_server(host, port, app, threaded=True, fd=sock.fileno()), kind
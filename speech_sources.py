@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""音訊來源 (由 create_api_script 複製到語音辨識 API 服務目錄)
+
+擷取、斷句與辨識只使用音訊來源的 CHUNK、SAMPLE_RATE、SAMPLE_WIDTH 與 stream.read(取樣數)，
+麥克風以外的來源也走同一條流程。設定組合或請求的 source 指定來源：
+
+    default                         系統預設的麥克風
+    mic:2 / mic:Headset             依編號或名稱 (不分大小寫的部分比對) 選擇輸入裝置
+    file:/path/meeting.wav          WAV、AIFF 或 FLAC 檔
+    pcm:-; rate=16000; width=2      標準輸入的單聲道 little-endian PCM (服務以管道啟動時)
+    pcm:/tmp/dictation.fifo         FIFO 或檔案中的 PCM，參數同上 (FIFO 在寫入端開啟前會等待)
+    tcp:7000 / tcp:0.0.0.0:7000     等待一個用戶端連線並送來 PCM，例如 arecord -f S16_LE -r 16000 | nc 主機 7000
+
+麥克風與網路串流是即時音訊，開始聆聽前校正環境噪音；檔案與管道不校正，不會吃掉開頭的音訊。
+"""
+import sys
+import socket
+import logging
+
+# 未指定時 PCM 的取樣率與取樣位元組數
+DEFAULT_RATE = 16000
+DEFAULT_WIDTH = 2
+# PCM 與網路來源每次讀取的取樣數
+PCM_CHUNK = 1024
+
+
+class SourceError(Exception):
+    """音訊來源設定錯誤或無法開啟"""
+
+
+class PcmStream:
+    """以取樣數讀取 PCM，與麥克風的 stream.read 相同；結束時回傳空位元組"""
+
+    def __init__(self, file, sample_width):
+        self.file = file
+        self.sample_width = sample_width
+
+    def read(self, frames):
+        data = self.file.read(frames * self.sample_width)
+        # 結尾不完整的取樣捨棄
+        return data[:len(data) - len(data) % self.sample_width]
+
+
+class PcmSource:
+    """標準輸入、FIFO 或檔案中的 PCM"""
+
+    def __init__(self, path, sample_rate, sample_width):
+        self.path = path
+        self.SAMPLE_RATE = sample_rate
+        self.SAMPLE_WIDTH = sample_width
+        self.CHUNK = PCM_CHUNK
+        self.file = None
+        self.stream = None
+
+    def __enter__(self):
+        if self.path == '-':
+            # 標準輸入在多次擷取之間共用，接著上一次讀到的位置繼續
+            self.stream = PcmStream(sys.stdin.buffer, self.SAMPLE_WIDTH)
+            return self
+        try:
+            self.file = open(self.path, 'rb')
+        except OSError as e:
+            raise SourceError(f"無法開啟 {self.path}: {e}")
+        self.stream = PcmStream(self.file, self.SAMPLE_WIDTH)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        self.stream = None
+
+
+class TcpSource:
+    """等待一個用戶端連線，讀取它送來的 PCM；用戶端關閉連線即音訊結束"""
+
+    def __init__(self, host, port, sample_rate, sample_width, timeout=None, stop=None):
+        self.address = (host, port)
+        self.SAMPLE_RATE = sample_rate
+        self.SAMPLE_WIDTH = sample_width
+        self.CHUNK = PCM_CHUNK
+        self.timeout = timeout
+        self.stop = stop
+        self.server = None
+        self.connection = None
+        self.file = None
+        self.stream = None
+
+    def accept(self, wait_timeout_error):
+        """等待用戶端連線，逾時拋出 wait_timeout_error；stop 事件設定時拋出 EOFError"""
+        import time
+        deadline = time.monotonic() + self.timeout if self.timeout else None
+        while True:
+            remaining = deadline - time.monotonic() if deadline else None
+            if remaining is not None and remaining <= 0:
+                raise wait_timeout_error("等待音訊串流連線逾時")
+            # 分段等待，讓停止要求能及時生效
+            self.server.settimeout(min(0.5, remaining) if remaining is not None else 0.5)
+            try:
+                connection, address = self.server.accept()
+            except socket.timeout:
+                if self.stop is not None and self.stop.is_set():
+                    raise EOFError("audio source stopped")
+                continue
+            logging.info(f"音訊串流用戶端已連線: {address[0]}")
+            connection.settimeout(None)
+            return connection
+
+    def open(self, wait_timeout_error):
+        family = socket.AF_INET6 if ':' in self.address[0] else socket.AF_INET
+        self.server = socket.socket(family, socket.SOCK_STREAM)
+        try:
+            self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.server.bind(self.address)
+            self.server.listen(1)
+        except OSError as e:
+            self.server.close()
+            self.server = None
+            raise SourceError(f"無法在 {self.address[0]}:{self.address[1]} 等待音訊串流: {e}")
+        try:
+            self.connection = self.accept(wait_timeout_error)
+        except BaseException:
+            self.close()
+            raise
+        self.file = self.connection.makefile('rb')
+        self.stream = PcmStream(self.file, self.SAMPLE_WIDTH)
+        return self
+
+    def close(self):
+        for resource in (self.file, self.connection, self.server):
+            if resource is not None:
+                try:
+                    resource.close()
+                except OSError:
+                    pass
+        self.file = self.connection = self.server = self.stream = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def input_devices(sr):
+    """可錄音的裝置 [(編號, 名稱)]，略過沒有輸入聲道的裝置 (例如同一副耳機的播放端)
+
+    無法向 PyAudio 查詢裝置資訊時不過濾，列出 list_microphone_names 的全部裝置。
+    """
+    names = sr.Microphone.list_microphone_names()
+    try:
+        audio = sr.Microphone.get_pyaudio().PyAudio()
+    except Exception as e:
+        logging.debug(f"無法查詢音訊裝置資訊: {e}")
+        return list(enumerate(names))
+    try:
+        devices = []
+        for index, name in enumerate(names):
+            try:
+                info = audio.get_device_info_by_index(index)
+            except Exception:
+                continue
+            if int(info.get("maxInputChannels", 0)) > 0:
+                devices.append((index, name))
+        return devices
+    finally:
+        audio.terminate()
+
+
+def parse_parameters(text):
+    """解析 ; 分隔的 rate=、width= 參數"""
+    options = {}
+    for parameter in text.split(';'):
+        name, _, value = parameter.partition('=')
+        if name.strip():
+            options[name.strip().lower()] = value.strip()
+    try:
+        rate = int(options.get('rate') or DEFAULT_RATE)
+        width = int(options.get('width') or DEFAULT_WIDTH)
+    except ValueError:
+        raise SourceError(f"PCM 參數無效: {text}")
+    if width not in (1, 2, 3, 4) or not 8000 <= rate <= 96000:
+        raise SourceError(f"PCM 參數無效: {text}")
+    return rate, width
+
+
+class SourceSpec:
+    """解析後的音訊來源設定，open() 時才實際開啟"""
+
+    LABELS = {"mic": "麥克風", "file": "音訊檔", "pcm": "PCM 串流", "tcp": "網路串流"}
+
+    def __init__(self, kind, target=None, sample_rate=DEFAULT_RATE, sample_width=DEFAULT_WIDTH):
+        self.kind = kind
+        self.target = target
+        self.sample_rate = sample_rate
+        self.sample_width = sample_width
+
+    @property
+    def microphone(self):
+        return self.kind == "mic"
+
+    @property
+    def live(self):
+        """即時音訊 (開始聆聽前校正環境噪音)"""
+        return self.kind in ("mic", "tcp")
+
+    @property
+    def label(self):
+        return self.LABELS[self.kind]
+
+    def __str__(self):
+        if self.target is None:
+            return "預設麥克風"
+        return f"{self.label} {self.target[0]}:{self.target[1]}" if self.kind == "tcp" else f"{self.label} {self.target}"
+
+    def device_index(self, sr):
+        """麥克風的裝置編號，依名稱指定時在可錄音的裝置中比對"""
+        if self.target is None or isinstance(self.target, int):
+            return self.target
+        devices = input_devices(sr)
+        for index, name in devices:
+            if self.target.lower() in (name or '').lower():
+                return index
+        available = ', '.join(name for _, name in devices)
+        raise SourceError(f"找不到名稱包含「{self.target}」的輸入裝置 (可用: {available or '無'})")
+
+    def open(self, sr, timeout=None, stop=None):
+        """開啟音訊來源，回傳 context manager；timeout 為等待網路串流連線的秒數，stop 事件設定時放棄等待"""
+        if self.kind == "mic":
+            return sr.Microphone(device_index=self.device_index(sr))
+        if self.kind == "file":
+            return sr.AudioFile(self.target)
+        if self.kind == "pcm":
+            return PcmSource(self.target, self.sample_rate, self.sample_width)
+        host, port = self.target
+        return TcpSource(host, port, self.sample_rate, self.sample_width, timeout, stop).open(sr.WaitTimeoutError)
+
+
+def parse_source(text):
+    """解析 source 設定 (見模組說明)，格式錯誤時拋出 SourceError"""
+    text = str(text or 'default').strip()
+    kind, _, rest = text.partition(':')
+    kind = kind.strip().lower()
+    if kind in ('default', 'mic', 'microphone'):
+        rest = rest.strip()
+        if not rest:
+            return SourceSpec("mic")
+        return SourceSpec("mic", int(rest) if rest.isdigit() else rest)
+    if kind == 'file':
+        if not rest.strip():
+            raise SourceError("file 來源需要檔案路徑")
+        return SourceSpec("file", rest.strip())
+    if kind == 'pcm':
+        path, _, parameters = rest.partition(';')
+        rate, width = parse_parameters(parameters)
+        return SourceSpec("pcm", path.strip() or '-', rate, width)
+    if kind == 'tcp':
+        address, _, parameters = rest.partition(';')
+        host, _, port = address.strip().rpartition(':')
+        rate, width = parse_parameters(parameters)
+        try:
+            port = int(port)
+        except ValueError:
+            raise SourceError(f"網路串流的連接埠無效: {address}")
+        return SourceSpec("tcp", (host.strip('[]') or '127.0.0.1', port), rate, width)
+    raise SourceError(f"不支援的音訊來源: {text}")
@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""連續聽寫工作階段 (由 create_api_script 複製到語音辨識 API 服務目錄)
+
+擷取執行緒持續聆聽並把每段語音放入佇列，辨識執行緒同時處理先前的語音，
+因此第 N 段在辨識時第 N+1 段已在擷取。結果依序號排序後才交付，
+客戶端以 results(after) 長輪詢取得新結果。
+
+設定 partial_interval 時，擷取中的語音每隔該秒數把目前累積的音訊送去辨識，
+作為暫定結果 (partial) 提供給客戶端即時顯示，最終結果交付後即失效。
+
+每段語音擷取到 AudioSpool (見 speech_capture)，長時間不停頓的語音會寫入暫存檔，
+記憶體用量不隨語音長度增加；暫定辨識只複製最近 partial_window 秒的音訊。
+"""
+import time
+import queue
+import logging
+import threading
+import uuid
+
+from speech_capture import listen_to_spool, recognize_spool, adjust_for_ambient_noise
+from speech_sources import parse_source
+from speech_endpointing import PauseObserver
+
+
+class StreamSession:
+    """以管線方式並行擷取與辨識的連續聽寫工作階段"""
+
+    def __init__(self, sr, language='zh-TW', pause_threshold=0.8, non_speaking_duration=0.5,
+                 phrase_time_limit=None, workers=2, max_pending=8, poll_interval=1.0, partial_interval=0.0,
+                 partial_window=30.0, ambient_duration=0.5, energy_threshold=None, pause_model=None, speaker='default',
+                 recognize=None, postprocess=None, source=None, on_result=None):
+        self.sr = sr
+        # 音訊來源 (見 speech_sources)，未指定時使用預設麥克風
+        self.source = source or parse_source('default')
+        # 辨識函式 recognize(recognizer, audio, language) 與結果的後處理 (例如套用使用者詞典)
+        self.recognize = recognize or (lambda recognizer, audio, language: recognizer.recognize_google(audio, language=language))
+        self.postprocess = postprocess or (lambda text: text)
+        # on_result(結果, 音訊秒數, 從擷取完成到取得結果的秒數) 在每段辨識成功後呼叫 (例如寫入辨識紀錄)
+        self.on_result = on_result
+        self.id = uuid.uuid4().hex[:12]
+        self.language = language
+        self.pause_threshold = float(pause_threshold)
+        self.non_speaking_duration = float(non_speaking_duration)
+        self.phrase_time_limit = phrase_time_limit
+        self.poll_interval = poll_interval
+        self.partial_interval = float(partial_interval or 0)
+        self.partial_window = float(partial_window)
+        # 環境噪音校正秒數；指定 energy_threshold 時改用固定的音量門檻
+        self.ambient_duration = float(ambient_duration or 0)
+        self.energy_threshold = energy_threshold
+        self.worker_count = max(1, int(workers))
+        # 指定停頓模型 (見 speech_endpointing) 時，每段語音依說話者的停頓習慣調整 pause_threshold
+        self.pause_model = pause_model
+        self.speaker = speaker
+
+        # 佇列有上限，辨識落後時擷取會暫停而不是無限累積音訊
+        self.audio_queue = queue.Queue(maxsize=max_pending)
+        self.stop_event = threading.Event()
+        self.condition = threading.Condition()
+        self.captured = 0
+        self.completed = {}
+        self.results = []
+        self.error = None
+        self.capture_done = False
+        self.threads = []
+        # 暫定結果：只保留最新的待辨識音訊與最新的結果
+        self.partial_request = None
+        self.partial = None
+        self.partial_version = 0
+        # 結果或暫定結果更新時呼叫的函式 (例如喚醒 asyncio 的等待者)，呼叫時持有 condition
+        self.listeners = []
+
+    def start(self):
+        capture = threading.Thread(target=self._capture_loop, name=f'stream-capture-{self.id}', daemon=True)
+        self.threads.append(capture)
+        for index in range(self.worker_count):
+            self.threads.append(threading.Thread(target=self._recognize_loop, name=f'stream-recognize-{self.id}-{index}', daemon=True))
+        if self.partial_interval > 0:
+            self.threads.append(threading.Thread(target=self._partial_loop, name=f'stream-partial-{self.id}', daemon=True))
+        for thread in self.threads:
+            thread.start()
+        logging.info(f"連續聽寫開始 ({self.id})，語言: {self.language}")
+
+    def stop(self):
+        """停止擷取，已擷取的語音仍會完成辨識"""
+        self.stop_event.set()
+
+    @property
+    def finished(self):
+        return self.capture_done and len(self.results) >= self.captured
+
+    def add_listener(self, listener):
+        with self.condition:
+            self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        with self.condition:
+            if listener in self.listeners:
+                self.listeners.remove(listener)
+
+    def _notify(self):
+        """喚醒等待結果的執行緒與 listeners (呼叫端持有 condition)"""
+        self.condition.notify_all()
+        for listener in self.listeners:
+            listener()
+
+    def ready(self, after, partial_after=None):
+        """是否有序號大於 after 的結果、版本大於 partial_after 的暫定結果，或工作階段已結束"""
+        if len(self.results) > max(0, int(after)) or self.finished:
+            return True
+        return partial_after is not None and self.partial_version > partial_after
+
+    def results_after(self, after, wait=0.0, partial_after=None):
+        """回傳序號大於 after 的結果，沒有新結果時最多等待 wait 秒
+
+        指定 partial_after 時，暫定結果版本大於它也會立即回傳。
+        """
+        after = max(0, int(after))
+        with self.condition:
+            self.condition.wait_for(lambda: self.ready(after, partial_after), timeout=wait)
+            partial = self.partial
+            if partial is not None and partial["seq"] <= len(self.results):
+                partial = None
+            return {
+                "session": self.id,
+                "results": self.results[after:],
+                "next": len(self.results),
+                "partial": partial,
+                "partial_version": self.partial_version,
+                "active": not self.finished,
+                "error": self.error
+            }
+
+    def events(self, after=0, partial_after=None, wait=10.0):
+        """逐一產生與 results_after 相同格式的更新，直到工作階段結束；沒有更新時每 wait 秒產生一次"""
+        while True:
+            data = self.results_after(after, wait, partial_after)
+            yield data
+            if not data["active"]:
+                return
+            after = data["next"]
+            if partial_after is not None:
+                partial_after = data["partial_version"]
+
+    def _capture_loop(self):
+        sr = self.sr
+        recognizer = sr.Recognizer()
+        recognizer.pause_threshold = self.pause_threshold
+        recognizer.non_speaking_duration = min(self.non_speaking_duration, self.pause_threshold)
+        if self.energy_threshold is not None:
+            recognizer.energy_threshold = float(self.energy_threshold)
+            recognizer.dynamic_energy_threshold = False
+        try:
+            with self.source.open(sr, stop=self.stop_event) as source:
+                if self.source.live and self.ambient_duration > 0 and self.energy_threshold is None:
+                    adjust_for_ambient_noise(recognizer, source, duration=self.ambient_duration)
+                while not self.stop_event.is_set():
+                    try:
+                        # 短暫的等待逾時讓停止要求能及時生效
+                        spool = self._listen(recognizer, source)
+                    except sr.WaitTimeoutError:
+                        continue
+                    except EOFError:
+                        break
+                    with self.condition:
+                        self.captured += 1
+                        seq = self.captured
+                    logging.debug(f"連續聽寫擷取第 {seq} 段語音 ({spool.duration:.1f} 秒)")
+                    self.audio_queue.put((seq, spool, time.monotonic()))
+        except EOFError:
+            # 等待網路串流連線期間停止
+            pass
+        except Exception as e:
+            logging.error(f"連續聽寫擷取錯誤: {e}")
+            self.error = f"{self.source.label}使用錯誤: {e}"
+        finally:
+            # 音訊來源結束 (例如檔案讀完) 時也視為已停止，下一次開始連續聽寫建立新的工作階段
+            self.stop_event.set()
+            for _ in range(self.worker_count):
+                self.audio_queue.put(None)
+            with self.condition:
+                self.capture_done = True
+                self._notify()
+            logging.info(f"連續聽寫停止擷取 ({self.id})，共 {self.captured} 段")
+
+    def _listen(self, recognizer, source):
+        """聆聽一段語音；啟用暫定結果時，期間定期送出最近的音訊做暫定辨識"""
+        on_chunk = None
+        observer = None
+        if self.pause_model is not None:
+            recognizer.pause_threshold = self.pause_model.threshold(self.speaker, self.pause_threshold)
+            recognizer.non_speaking_duration = min(self.non_speaking_duration, recognizer.pause_threshold)
+        if self.partial_interval > 0:
+            on_chunk = self._partial_requester(source)
+        if self.pause_model is not None:
+            observer = PauseObserver(on_chunk)
+            on_chunk = observer.on_chunk
+
+        spool = listen_to_spool(self.sr, recognizer, source, timeout=self.poll_interval,
+                                phrase_time_limit=self.phrase_time_limit, on_chunk=on_chunk)
+        if observer is not None:
+            self.pause_model.record(self.speaker, observer.pauses, self.pause_threshold, recognizer.pause_threshold,
+                                    observer.end_wait)
+        return spool
+
+    def _partial_requester(self, source):
+        """回傳 on_chunk：每隔 partial_interval 秒把最近 partial_window 秒的音訊交給暫定辨識"""
+        seq = self.captured + 1
+        window = int(self.partial_window * source.SAMPLE_RATE) * source.SAMPLE_WIDTH
+        last_request = [time.monotonic()]
+
+        def request_partial(spool, speech):
+            now = time.monotonic()
+            if now - last_request[0] >= self.partial_interval:
+                last_request[0] = now
+                audio = self.sr.AudioData(spool.tail(window), spool.sample_rate, spool.sample_width)
+                with self.condition:
+                    self.partial_request = (seq, audio)
+                    self.condition.notify_all()
+
+        return request_partial
+
+    def _partial_loop(self):
+        """辨識最新的暫定音訊；辨識期間累積的較舊要求直接捨棄"""
+        sr = self.sr
+        recognizer = sr.Recognizer()
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.partial_request is not None or self.capture_done)
+                if self.partial_request is None:
+                    return
+                seq, audio = self.partial_request
+                self.partial_request = None
+            try:
+                text = self.postprocess(self.recognize(recognizer, audio, self.language))
+            except Exception as e:
+                logging.debug(f"暫定辨識失敗: {e}")
+                continue
+            with self.condition:
+                # 最終結果已交付時，暫定結果已過時
+                if seq > len(self.results):
+                    self.partial = {"seq": seq, "text": text}
+                    self.partial_version += 1
+                    self._notify()
+
+    def _recognize_loop(self):
+        sr = self.sr
+        recognizer = sr.Recognizer()
+        while True:
+            item = self.audio_queue.get()
+            if item is None:
+                return
+            seq, spool, captured_at = item
+            duration = spool.duration
+            result = {"seq": seq, "success": False, "text": ""}
+            try:
+                text = recognize_spool(sr, recognizer, spool, self.language, self.recognize)
+                result["text"] = self.postprocess(text)
+                result["success"] = True
+            except sr.UnknownValueError:
+                result["error"] = "無法辨識語音內容"
+            except sr.RequestError as e:
+                logging.error(f"Google API 請求錯誤: {e}")
+                result["error"] = f"語音辨識服務錯誤: {e}"
+            except Exception as e:
+                logging.error(f"連續聽寫辨識錯誤: {e}")
+                result["error"] = f"發生錯誤: {e}"
+            finally:
+                spool.close()
+            if result["success"] and self.on_result is not None:
+                try:
+                    self.on_result(result, duration, time.monotonic() - captured_at)
+                except Exception as e:
+                    logging.error(f"連續聽寫結果回呼錯誤: {e}")
+            self._complete(result)
+
+    def _complete(self, result):
+        """記錄辨識結果，只依序號連續的部分交付"""
+        with self.condition:
+            self.completed[result["seq"]] = result
+            next_seq = len(self.results) + 1
+            while next_seq in self.completed:
+                self.results.append(self.completed.pop(next_seq))
+                next_seq += 1
+            self._notify()
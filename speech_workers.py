@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""本機辨識引擎的多程序工作池 (由 create_api_script 複製到語音辨識 API 服務目錄)
+
+sphinx 與 whisper 以 CPU 辨識，在請求執行緒中執行時受 GIL 限制，同一時間實際上只有一個片段在辨識。
+工作池啟動數個工作程序，每個程序保留自己的 Recognizer (whisper 模型第一次載入後常駐在程序中)。
+音訊放在 multiprocessing.shared_memory 區段中，管道只傳送區段名稱與辨識參數，音訊本身不經過 pickle；
+區段由主程序建立，收到結果或工作程序結束時釋放。每件工作交給未完成工作最少的程序。
+"""
+import os
+import time
+import logging
+import itertools
+import threading
+import multiprocessing
+from collections import deque
+from multiprocessing import shared_memory
+from concurrent.futures import Future, InvalidStateError
+
+# 計算工作程序使用率的時間窗 (秒)
+UTILISATION_WINDOW = 60.0
+
+_recognizer = {"recognizer": None}
+
+
+def recognize_offline(engine, frame_data, sample_rate, sample_width, language, options):
+    """工作程序中的辨識函式：以常駐的 Recognizer 執行本機辨識引擎"""
+    import speech_recognition as sr
+    recognizer = _recognizer["recognizer"]
+    if recognizer is None:
+        recognizer = _recognizer["recognizer"] = sr.Recognizer()
+    audio = sr.AudioData(frame_data, sample_rate, sample_width)
+    if engine == "sphinx":
+        return recognizer.recognize_sphinx(audio, language=language, **options)
+    if engine == "whisper":
+        return recognizer.recognize_whisper(audio, language=language.split('-')[0], **options)
+    raise ValueError(f"工作程序不支援的辨識引擎: {engine}")
+
+
+def read_segment(name, size):
+    """由共享記憶體區段取出音訊 (區段的建立與釋放由主程序負責)"""
+    segment = shared_memory.SharedMemory(name=name)
+    try:
+        view = segment.buf[:size]
+        try:
+            return bytes(view)
+        finally:
+            view.release()
+    finally:
+        segment.close()
+
+
+def worker_main(connection, runner, warm_up):
+    """工作程序：先以一段靜音預熱引擎，再逐一辨識管道送來的工作
+
+    每件工作回傳 (工作編號, 是否成功, 結果或例外名稱, 錯誤訊息, 辨識耗時)。
+    """
+    if warm_up:
+        engine, language = warm_up
+        try:
+            runner(engine, b"\0\0" * 1600, 16000, 2, language, {})
+        except Exception:
+            pass
+    connection.send((None, True, os.getpid(), None, 0.0))
+    while True:
+        try:
+            job = connection.recv()
+        except (EOFError, OSError):
+            return
+        if job is None:
+            return
+        job_id, name, size, sample_rate, sample_width, engine, language, options = job
+        started = time.perf_counter()
+        try:
+            text = runner(engine, read_segment(name, size), sample_rate, sample_width, language, options)
+            reply = (job_id, True, text, None)
+        except Exception as e:
+            # 例外類別不一定能在主程序中還原，只傳名稱與訊息
+            reply = (job_id, False, type(e).__name__, str(e))
+        try:
+            connection.send(reply + (time.perf_counter() - started,))
+        except (EOFError, OSError):
+            return
+
+
+class WorkerError(Exception):
+    """工作程序無法完成辨識 (程序結束或引擎發生非預期的錯誤)"""
+
+
+class WorkerProcess:
+    """工作池中的一個工作程序與其未完成的工作"""
+
+    def __init__(self, context, index, runner, warm_up):
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(target=worker_main, args=(child_connection, runner, warm_up),
+                                       name=f'speech-worker-{index}', daemon=True)
+        self.process.start()
+        child_connection.close()
+        self.index = index
+        self.send_lock = threading.Lock()
+        self.pending = {}
+        self.ready = False
+        self.completed = 0
+        self.busy = 0.0
+        self.recent = deque()
+        self.started_at = time.monotonic()
+
+
+def release_segment(segment):
+    try:
+        segment.close()
+        segment.unlink()
+    except (OSError, BufferError):
+        pass
+
+
+class ProcessPool:
+    """本機辨識引擎的工作程序池
+
+    runner(engine, frame_data, sample_rate, sample_width, language, options) 在工作程序中執行，
+    必須是模組層級的函式；errors 把工作程序回報的例外名稱對應回主程序的例外類別。
+    """
+
+    def __init__(self, processes=None, runner=recognize_offline, warm_up=None, errors=None):
+        self.processes = max(1, int(processes or os.cpu_count() or 1))
+        self.runner = runner
+        self.warm_up = warm_up
+        self.errors = dict(errors or {})
+        # 服務本身有多個執行緒，以 spawn 建立乾淨的程序，不複製執行緒持有的鎖
+        self.context = multiprocessing.get_context('spawn')
+        self.lock = threading.Lock()
+        self.workers = []
+        self.job_ids = itertools.count()
+        self.restarts = 0
+        self.closed = False
+
+    def start(self):
+        """啟動所有工作程序 (不等待預熱完成，預熱期間送出的工作在管道中排隊)"""
+        with self.lock:
+            while len(self.workers) < self.processes:
+                self.workers.append(self._spawn(len(self.workers)))
+        return self
+
+    def _spawn(self, index):
+        worker = WorkerProcess(self.context, index, self.runner, self.warm_up)
+        threading.Thread(target=self._read, args=(worker,), name=f'speech-worker-{index}-reader', daemon=True).start()
+        return worker
+
+    def submit(self, engine, audio, language, options=None):
+        """把 AudioData 放進共享記憶體，交給未完成工作最少的程序，回傳結果為辨識文字的 Future"""
+        frame_data = audio.frame_data
+        segment = shared_memory.SharedMemory(create=True, size=max(1, len(frame_data)))
+        segment.buf[:len(frame_data)] = frame_data
+        future = Future()
+        with self.lock:
+            if self.closed:
+                release_segment(segment)
+                raise RuntimeError('cannot schedule new futures after shutdown')
+            worker = min(self.workers, key=lambda candidate: (len(candidate.pending), candidate.busy))
+            job_id = next(self.job_ids)
+            worker.pending[job_id] = (future, segment)
+        job = (job_id, segment.name, len(frame_data), audio.sample_rate, audio.sample_width, engine, language,
+               options or {})
+        try:
+            with worker.send_lock:
+                worker.connection.send(job)
+        except (OSError, ValueError) as e:
+            # 程序已結束，讀取執行緒會以 WorkerError 結束這件工作
+            logging.warning(f"無法把工作送給辨識程序 {worker.index}: {e}")
+        return future
+
+    def _read(self, worker):
+        while True:
+            try:
+                job_id, ok, value, detail, elapsed = worker.connection.recv()
+            except (EOFError, OSError):
+                break
+            if job_id is None:
+                worker.ready = True
+                logging.info(f"辨識程序 {worker.index} (PID {value}) 已就緒")
+                continue
+            now = time.monotonic()
+            with self.lock:
+                future, segment = worker.pending.pop(job_id)
+                worker.completed += 1
+                worker.busy += elapsed
+                worker.recent.append((now, elapsed))
+                while worker.recent and worker.recent[0][0] < now - UTILISATION_WINDOW:
+                    worker.recent.popleft()
+            release_segment(segment)
+            try:
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(self.errors.get(value, WorkerError)(detail or value))
+            except InvalidStateError:
+                # 呼叫端已放棄 (逾時取消)，結果不再使用
+                pass
+        self._lost(worker)
+
+    def _lost(self, worker):
+        """工作程序結束：未完成的工作以 WorkerError 結束，服務仍在運作時補上新的程序"""
+        worker.process.join(1.0)
+        with self.lock:
+            pending, worker.pending = worker.pending, {}
+            if worker in self.workers:
+                position = self.workers.index(worker)
+                if self.closed:
+                    del self.workers[position]
+                else:
+                    logging.error(f"辨識程序 {worker.index} 意外結束 (結束代碼 {worker.process.exitcode})，重新啟動")
+                    self.restarts += 1
+                    self.workers[position] = self._spawn(worker.index)
+        worker.connection.close()
+        for future, segment in pending.values():
+            release_segment(segment)
+            if not future.done():
+                future.set_exception(WorkerError("辨識程序意外結束"))
+
+    def stats(self):
+        """各工作程序的排隊工作數、已完成數與最近一分鐘的使用率"""
+        now = time.monotonic()
+        with self.lock:
+            workers = [{
+                "pid": worker.process.pid,
+                "ready": worker.ready,
+                "queued": len(worker.pending),
+                "completed": worker.completed,
+                "busy_seconds": round(worker.busy, 1),
+                "utilisation": round(sum(elapsed for _, elapsed in worker.recent)
+                                     / max(1e-6, min(UTILISATION_WINDOW, now - worker.started_at)), 3)
+            } for worker in self.workers]
+            restarts = self.restarts
+        return {
+            "processes": len(workers),
+            "queue_depth": sum(worker["queued"] for worker in workers),
+            "restarts": restarts,
+            "workers": workers
+        }
+
+    def shutdown(self, wait=True, timeout=10.0):
+        """停止接受新工作；已送出的工作在各程序中完成後程序才結束"""
+        with self.lock:
+            self.closed = True
+            workers = list(self.workers)
+        for worker in workers:
+            try:
+                with worker.send_lock:
+                    worker.connection.send(None)
+            except (OSError, ValueError):
+                pass
+        if wait:
+            deadline = time.monotonic() + timeout
+            for worker in workers:
+                worker.process.join(max(0.0, deadline - time.monotonic()))
+                if worker.process.is_alive():
+                    worker.process.terminate()
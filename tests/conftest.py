@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+"""測試直接匯入專案根目錄的模組 (輔助模組在服務目錄中也是以頂層模組匯入)"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
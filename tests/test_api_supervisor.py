@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+import api_supervisor
+from utils import acquire_file_lock, release_file_lock
+
+
+def test_stop_supervisor_releases_lock(tmp_path, monkeypatch):
+    monkeypatch.setattr(api_supervisor, "OUTPUT_LOG", tmp_path / "output.log")
+    lock_path = tmp_path / "supervisor.lock"
+    supervisor = api_supervisor.ApiSupervisor()
+    supervisor.lock_file = acquire_file_lock(lock_path)
+    monkeypatch.setattr(api_supervisor, "_supervisor", supervisor)
+    # 監管期間其他進程取不到監管程式鎖
+    assert acquire_file_lock(lock_path) is None
+
+    api_supervisor.stop_supervisor()
+    assert supervisor.stop_event.is_set()
+    assert supervisor.lock_file is None
+    assert api_supervisor._supervisor is None
+    lock_file = acquire_file_lock(lock_path)
+    assert lock_file is not None
+    release_file_lock(lock_file)
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+import random
+import threading
+
+import pytest
+
+import benchmark
+
+benchmark.install_uno_stubs()
+
+from document_inserter import DocumentInserter, MainThreadDispatcher, ProvisionalText, common_prefix_length  # noqa: E402
+
+
+def make_provisional(content="", position=None):
+    document = benchmark.StubTextDocument(content)
+    view_cursor = document.controller.view_cursor
+    view_cursor.anchor = view_cursor.position = len(content) if position is None else position
+    # 更新頻率不設限，每次 update 立即套用
+    return document, ProvisionalText(DocumentInserter(document), max_rate=1e9)
+
+
+def test_common_prefix_length():
+    assert common_prefix_length("今天下午", "今天晚上") == 2
+    assert common_prefix_length("", "abc") == 0
+    assert common_prefix_length("abc", "abc") == 3
+
+
+def test_updates_and_commit_keep_surrounding_text():
+    document, provisional = make_provisional("前文。後文", position=3)
+    for hypothesis in ("今天", "今天下午", "今天下五", "今天下午三點"):
+        provisional.update(hypothesis)
+        assert document.content == "前文。" + hypothesis + "後文"
+    provisional.commit("今天下午三點開會")
+    assert document.content == "前文。今天下午三點開會後文"
+    # 暫定文字的改寫不留復原動作，定稿只有一個
+    assert document.undo_manager.actions == 1
+    # 游標移到結果之後
+    assert document.controller.view_cursor.position == len("前文。今天下午三點開會")
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_hypotheses_match_document(seed):
+    rng = random.Random(seed)
+    document, provisional = make_provisional("開頭")
+    text = ""
+    for _ in range(40):
+        keep = rng.randint(0, len(text))
+        text = text[:keep] + "".join(rng.choice("甲乙丙丁戊己") for _ in range(rng.randint(0, 6)))
+        provisional.update(text)
+        assert document.content == "開頭" + text
+    provisional.commit("最終")
+    assert document.content == "開頭最終"
+
+
+def test_discard_removes_provisional_text():
+    document, provisional = make_provisional("前文")
+    provisional.update("暫定")
+    provisional.discard()
+    assert document.content == "前文"
+    assert document.undo_manager.actions == 0
+
+
+def test_commit_without_provisional_text_inserts_directly():
+    document, provisional = make_provisional("前文")
+    provisional.commit("結果")
+    assert document.content == "前文結果"
+    assert document.undo_manager.actions == 1
+
+
+def test_updates_rewrite_only_the_changed_suffix():
+    document, provisional = make_provisional()
+    provisional.update("今天下午三點")
+    provisional.update("今天下午三點在會議室")
+    assert provisional.chars_written == len("今天下午三點在會議室")
+    calls = provisional.inserter.uno_calls
+    # 只改寫不同的尾段：「三點」改為「五點」只寫入三個字
+    provisional.update("今天下午五點")
+    assert provisional.chars_written == len("今天下午三點在會議室") + 2
+    # collapseToEnd、goLeft、setString 與 lock/unlock
+    assert provisional.inserter.uno_calls - calls == 5
+    calls = provisional.inserter.uno_calls
+    # 游標已涵蓋改變的開頭，不需移動
+    provisional.update("今天下午六點")
+    assert provisional.inserter.uno_calls - calls == 3
+    assert document.content == "今天下午六點"
+
+
+def test_background_updates_wait_for_main_thread():
+    # 背景執行緒只把文件操作交給 AsyncCallback，不呼叫 UNO；主執行緒處理事件時才套用
+    document = benchmark.StubTextDocument("前文")
+    document.controller.view_cursor.anchor = document.controller.view_cursor.position = 2
+    ctx = benchmark.StubContext()
+    dispatch = MainThreadDispatcher(ctx)
+    provisional = ProvisionalText(DocumentInserter(document), max_rate=1e9, dispatch=dispatch)
+
+    def background():
+        for hypothesis in ("今天", "今天下午", "今天下午三點"):
+            provisional.update(hypothesis)
+
+    thread = threading.Thread(target=background)
+    thread.start()
+    thread.join(5)
+    assert not thread.is_alive()
+    assert document.content == "前文"
+    ctx.async_callback.run_pending()
+    assert document.content == "前文今天下午三點"
+
+    thread = threading.Thread(target=provisional.update, args=("今天晚上",))
+    thread.start()
+    thread.join(5)
+    # 在主執行緒定稿時直接執行；稍後才處理的暫定更新已被定稿取代
+    provisional.commit("今天下午三點開會")
+    ctx.async_callback.run_pending()
+    assert document.content == "前文今天下午三點開會"
+    assert document.undo_manager.actions == 1
+    assert not provisional.active
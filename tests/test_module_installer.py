@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+import module_installer
+from module_installer import diff_requirements, get_lock_file, read_lock_file
+
+
+@pytest.fixture(autouse=True)
+def home(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    return tmp_path
+
+
+def write_lock(tag, header_tag, pins):
+    lock_file = get_lock_file(tag)
+    lock_file.parent.mkdir(parents=True, exist_ok=True)
+    lock_file.write_text(f"# python: {header_tag}\n" + "\n".join(pins) + "\n", encoding="utf-8")
+
+
+def test_lock_file_is_kept_per_python_tag():
+    write_lock("cp39-win_amd64", "cp39-win_amd64", ["flask==2.0.0"])
+    assert read_lock_file("cp39-win_amd64") == ["flask==2.0.0"]
+    # 換了直譯器時不使用其他標籤的鎖定檔
+    assert read_lock_file("cp311-win_amd64") is None
+    assert get_lock_file("cp39-win_amd64") != get_lock_file("cp311-win_amd64")
+
+
+def test_lock_file_with_other_header_is_ignored():
+    write_lock("cp311-linux_x86_64", "cp39-linux_x86_64", ["flask==2.0.0"])
+    assert read_lock_file("cp311-linux_x86_64") is None
+
+
+def test_diff_requirements_uses_lock_of_venv_tag():
+    write_lock("cp39-linux_x86_64", "cp39-linux_x86_64", ["Flask==2.0.0", "requests==2.31.0"])
+    state = {
+        "tag": "cp39-linux_x86_64",
+        "installed": {"flask": "1.1.0", "requests": "2.31.0", "SpeechRecognition": "3.10.0", "PyAudio": "0.2.13"},
+        "importable": {module: True for module in module_installer.REQUIRED_IMPORTS.values()},
+    }
+    assert diff_requirements(state) == ["Flask==2.0.0"]
+    # 其他標籤的虛擬環境只檢查必要模組
+    assert diff_requirements(dict(state, tag="cp311-linux_x86_64")) == []
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+import threading
+
+from speech_clients import FairExecutor, parse_audio_type
+
+
+def run_blocked(executor, jobs):
+    """先以一件工作佔住唯一的執行緒，送出 jobs [(用戶端, 名稱)] 後放行，回傳執行順序"""
+    gate = threading.Event()
+    order = []
+    executor.submit("blocker", gate.wait)
+    futures = [executor.submit(client, order.append, name) for client, name in jobs]
+    gate.set()
+    for future in futures:
+        future.result(timeout=5)
+    executor.shutdown()
+    return order
+
+
+def test_fair_executor_alternates_clients():
+    jobs = [("a", "a1"), ("a", "a2"), ("a", "a3"), ("b", "b1"), ("c", "c1"), ("b", "b2")]
+    # 長時間上傳切出的 a 片段不會讓 b、c 的工作排在全部 a 之後
+    assert run_blocked(FairExecutor(workers=1), jobs) == ["a1", "b1", "c1", "a2", "b2", "a3"]
+
+
+def test_fifo_executor_keeps_submission_order():
+    jobs = [("a", "a1"), ("a", "a2"), ("b", "b1"), ("a", "a3")]
+    assert run_blocked(FairExecutor(workers=1, fair=False), jobs) == ["a1", "a2", "b1", "a3"]
+
+
+def test_fair_executor_stats_and_exceptions():
+    executor = FairExecutor(workers=2)
+    future = executor.for_client("a").submit(lambda: 1 / 0)
+    assert isinstance(future.exception(timeout=5), ZeroDivisionError)
+    assert executor.submit("b", sum, [1, 2]).result(timeout=5) == 3
+    executor.shutdown()
+    stats = executor.stats()
+    assert stats["scheduling"] == "fair"
+    assert stats["clients"]["a"]["completed"] == 1
+    assert stats["clients"]["b"]["queued"] == 0
+
+
+def test_parse_audio_type():
+    assert parse_audio_type("audio/pcm; rate=44100; width=2") == ("pcm", 44100, 2)
+    assert parse_audio_type("audio/pcm") == ("pcm", 16000, 2)
+    assert parse_audio_type("audio/wav") == ("file", None, None)
+    assert parse_audio_type("audio/pcm; channels=2") is None
+    assert parse_audio_type("audio/pcm; rate=abc") is None
+    assert parse_audio_type("audio/mpeg") is None
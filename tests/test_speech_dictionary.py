@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+from speech_dictionary import Dictionary, DictionaryStore, engine_hint_options, parse_dictionary
+
+
+def test_sphinx_does_not_take_hints():
+    # keyword_entries 會把 sphinx 切換成關鍵字偵測，不再轉錄聽寫
+    _, hints = parse_dictionary("liber office => LibreOffice\n+ 語音辨識\n")
+    assert hints == ["LibreOffice", "語音辨識"]
+    assert engine_hint_options('sphinx', hints) == {}
+
+
+def test_engine_hint_options():
+    assert engine_hint_options('google_cloud', ["甲乙"]) == {'preferred_phrases': ["甲乙"]}
+    assert engine_hint_options('whisper', ["甲乙", "丙丁"]) == {'initial_prompt': "甲乙、丙丁"}
+    assert engine_hint_options('google', ["甲乙"]) == {}
+    assert engine_hint_options('whisper', []) == {}
+
+
+def test_apply_prefers_leftmost_longest():
+    dictionary = Dictionary(parse_dictionary("語音 => A\n語音辨識 => B\n辨識結果 => C\n")[0], [])
+    # 同一位置取最長的規則；重疊的規則以較左邊的為準
+    assert dictionary.apply("語音辨識結果") == "B結果"
+    assert dictionary.apply("語音與辨識結果") == "A與C"
+    assert dictionary.apply("沒有規則") == "沒有規則"
+
+
+def test_apply_does_not_rematch_replacements():
+    dictionary = Dictionary([("a", "b"), ("b", "c"), ("ab", "x")], [])
+    assert dictionary.apply("aab") == "bx"
+    assert dictionary.apply("ba") == "cb"
+
+
+def test_apply_matches_rules_found_through_failure_links():
+    # "she" 掃描中途經由失敗連結找到 "he" 與 "e"
+    dictionary = Dictionary([("he", "1"), ("e", "2"), ("hers", "3")], [])
+    assert dictionary.apply("she") == "s1"
+    assert dictionary.apply("hers") == "3"
+    assert dictionary.apply("eh") == "2h"
+
+
+def test_parse_dictionary_skips_comments_and_invalid_lines():
+    rules, hints = parse_dictionary("# 註解\n\n句號 => 。\n沒有箭頭\n => 空白\n+ 提示\n+ 提示\nx => 取代後\nx => y\n")
+    assert rules == [("句號", "。"), ("x", "取代後"), ("x", "y")]
+    # 一個字的取代結果不作為提示詞，重複的提示詞只保留一次
+    assert hints == ["提示", "取代後"]
+    # 重複的來源以最後一條為準
+    assert Dictionary(rules, hints).apply("x句號") == "y。"
+
+
+def test_store_reloads_when_file_changes(tmp_path):
+    path = tmp_path / "dictionary.txt"
+    store = DictionaryStore(path)
+    assert store.get().apply("甲") == "甲"
+    path.write_text("甲 => 乙\n", encoding="utf-8")
+    assert store.get().apply("甲") == "乙"
+    assert (tmp_path / "dictionary.txt.cache").exists()
+    # 新的 DictionaryStore 直接使用磁碟快取
+    assert DictionaryStore(path).get().apply("甲") == "乙"
+    path.write_text("甲 => 丙丙\n", encoding="utf-8")
+    assert store.get().apply("甲") == "丙丙"
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+from types import SimpleNamespace
+
+from speech_endpointing import PauseModel, PauseObserver
+from speech_profiles import DEFAULT_PROFILES
+
+RATE = 16000
+WIDTH = 2
+
+
+def feed(observer, pattern, chunk=0.1):
+    """依 pattern 逐塊呼叫 on_chunk，'s' 為語音區塊、'.' 為靜音區塊"""
+    spool = SimpleNamespace(length=0, sample_rate=RATE, sample_width=WIDTH)
+    for mark in pattern:
+        spool.length += int(chunk * RATE) * WIDTH
+        observer.on_chunk(spool, mark == 's')
+
+
+def test_observer_measures_pauses_and_end_wait():
+    observer = PauseObserver()
+    feed(observer, "ss...ss.sss.....")
+    # 只有 0.1 秒以上、之後又繼續說話的靜音才是句中停頓
+    assert [round(p, 3) for p in observer.pauses] == [0.3, 0.1]
+    assert round(observer.end_wait, 3) == 0.5
+
+
+def test_observer_end_wait_is_none_when_cut_during_speech():
+    observer = PauseObserver()
+    feed(observer, "ss..sss")
+    assert observer.end_wait is None
+
+
+def test_threshold_uses_configured_value_until_enough_samples():
+    model = PauseModel(min_samples=30)
+    model.record("alice", [0.4] * 29)
+    assert model.threshold("alice", 2.0) == 2.0
+    model.record("alice", [0.4])
+    assert model.threshold("alice", 2.0) == 0.4 * model.margin
+    # 設定值是上限，min_threshold 是下限
+    assert model.threshold("alice", 0.3) == 0.3
+    model.record("bob", [0.1] * 30)
+    assert model.threshold("bob", 2.0) == model.min_threshold
+
+
+def test_savings_come_from_measured_end_waits():
+    model = PauseModel()
+    assert model.stats()["median_saving_ms"] is None
+    model.record("alice", [], 2.0, 2.0, end_wait=2.1)
+    # 只有固定門檻的量測值時不推算省下的時間
+    assert model.stats()["median_saving_ms"] is None
+    model.record("alice", [], 2.0, 0.8, end_wait=0.9)
+    model.record("alice", [], 2.0, 0.8, end_wait=None)
+    stats = model.stats()
+    assert stats["utterances"] == 2
+    assert stats["median_end_wait_ms"] == {"fixed": 2100.0, "adaptive": 900.0}
+    assert stats["median_saving_ms"] == 1200.0
+
+
+def test_model_persists_pauses(tmp_path):
+    path = tmp_path / "pause_model.json"
+    PauseModel(path).record("alice", [0.5] * 40)
+    assert PauseModel(path).threshold("alice", 3.0) == PauseModel(path).threshold("alice", 3.0) < 3.0
+
+
+def test_builtin_profiles_do_not_enable_adaptive_pause():
+    # 提早切斷的後半段在單次辨識中無法補回，自適應斷句由使用者自行開啟
+    assert not any(profile.get("adaptive_pause") for profile in DEFAULT_PROFILES.values())
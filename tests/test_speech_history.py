@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from speech_history import TranscriptStore, escape_like, percentile
+
+TEXTS = ["今天天氣很好", "語音辨識準確", "100% 完成", "file_name 已儲存", 'He said "hello"', "今天開會"]
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = TranscriptStore(tmp_path / "history.db", flush_interval=0.05)
+    for text in TEXTS:
+        store.record({"kind": "recognize", "text": text})
+    store.flush()
+    yield store
+    store.close()
+
+
+def texts(rows):
+    return [row["text"] for row in rows]
+
+
+def test_percentile_and_escape_like():
+    assert percentile([], 0.5) is None
+    assert percentile([1, 2, 3, 4, 5], 0.5) == 3
+    assert percentile([1, 2, 3, 4, 5], 0.95) == 5
+    assert escape_like("100%_a\\b") == "100\\%\\_a\\\\b"
+
+
+def test_search_with_full_text_index(store):
+    assert store.fts
+    assert texts(store.search("天氣很")) == ["今天天氣很好"]
+    # 空白分隔的關鍵字全部符合；短於三個字的關鍵字以 LIKE 比對
+    assert texts(store.search("今天 開會")) == ["今天開會"]
+    assert texts(store.search("今天")) == ["今天開會", "今天天氣很好"]
+    # 雙引號在 FTS 查詢中跳脫，不會造成語法錯誤
+    assert texts(store.search('"hello"')) == ['He said "hello"']
+
+
+@pytest.mark.parametrize("fts", [True, False])
+def test_search_escapes_like_wildcards(store, fts):
+    store.fts = fts
+    assert texts(store.search("%")) == ["100% 完成"]
+    assert texts(store.search("_")) == ["file_name 已儲存"]
+    assert texts(store.search("e_n")) == ["file_name 已儲存"]
+    assert texts(store.search("不存在")) == []
+
+
+def test_search_falls_back_to_like(store):
+    # SQLite 不支援 FTS5 trigram 時所有關鍵字都以 LIKE 比對
+    store.fts = False
+    assert texts(store.search("天氣很")) == ["今天天氣很好"]
+    assert texts(store.search('"hello"')) == ['He said "hello"']
+
+
+def test_search_pages_newest_first(store):
+    first = store.search(limit=2)
+    assert texts(first) == ["今天開會", 'He said "hello"']
+    second = store.search(limit=2, before=first[-1]["id"])
+    assert texts(second) == ["file_name 已儲存", "100% 完成"]
+    assert store.search(kind="stream") == []
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+import json
+
+from speech_profiles import DEFAULT_PROFILES, ProfileStore
+
+
+def test_builtin_profiles_recognize_a_single_language():
+    # 多個候選語言會讓每次辨識的雲端請求數倍增，由使用者在 profiles.json 中自行開啟
+    store = ProfileStore("/nonexistent/profiles.json")
+    for name in DEFAULT_PROFILES:
+        assert not store.get(name)["languages"]
+
+
+def test_profiles_file_opts_into_languages(tmp_path):
+    path = tmp_path / "profiles.json"
+    path.write_text(json.dumps({"profiles": {"dictation": {"languages": ["zh-TW", "en-US"]}}}), encoding="utf-8")
+    store = ProfileStore(path)
+    assert store.get("dictation")["languages"] == ["zh-TW", "en-US"]
+    assert store.get("dictation")["pause_threshold"] == DEFAULT_PROFILES["dictation"]["pause_threshold"]
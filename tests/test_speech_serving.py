@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+import socket
+
+from speech_serving import bind_socket
+
+
+def occupy():
+    """占用一個端口，回傳 (socket, 端口)"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(('127.0.0.1', 0))
+    sock.listen(1)
+    return sock, sock.getsockname()[1]
+
+
+def test_bind_socket_uses_requested_port():
+    probe, port = occupy()
+    probe.close()
+    sock, bound = bind_socket(port, retries=1)
+    try:
+        assert bound == port
+        assert sock.getsockname()[1] == port
+    finally:
+        sock.close()
+
+
+def test_bind_socket_falls_back_to_next_port():
+    busy, port = occupy()
+    try:
+        sock, bound = bind_socket(port, retries=3)
+        assert sock is not None
+        try:
+            assert bound != port
+            assert bound in (port + 1, port + 2)
+        finally:
+            sock.close()
+    finally:
+        busy.close()
+
+
+def test_bind_socket_without_fallback_reports_failure():
+    busy, port = occupy()
+    try:
+        assert bind_socket(port, retries=1) == (None, None)
+    finally:
+        busy.close()
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from speech_sources import SourceError, SourceSpec, input_devices, parse_source
+
+# 同一副耳機的播放端排在錄音端之前
+DEVICES = [
+    ("HDA Intel PCH: Analog", 2, 2),
+    ("Jabra USB Headset: Playback", 0, 2),
+    ("Jabra USB Headset: Capture", 1, 0),
+]
+
+
+class FakePyAudio:
+    def get_device_info_by_index(self, index):
+        name, inputs, outputs = DEVICES[index]
+        return {"name": name, "maxInputChannels": inputs, "maxOutputChannels": outputs}
+
+    def terminate(self):
+        pass
+
+
+class FakeMicrophone:
+    @staticmethod
+    def list_microphone_names():
+        return [name for name, _, _ in DEVICES]
+
+    @staticmethod
+    def get_pyaudio():
+        return type("pyaudio", (), {"PyAudio": FakePyAudio})
+
+    def __init__(self, device_index=None):
+        self.device_index = device_index
+
+
+class FakeSr:
+    Microphone = FakeMicrophone
+
+
+def test_input_devices_skip_output_only_devices():
+    assert input_devices(FakeSr) == [(0, "HDA Intel PCH: Analog"), (2, "Jabra USB Headset: Capture")]
+
+
+def test_microphone_by_name_matches_input_device():
+    assert parse_source("mic:headset").device_index(FakeSr) == 2
+    assert parse_source("mic:1").device_index(FakeSr) == 1
+    assert parse_source("default").device_index(FakeSr) is None
+
+
+def test_microphone_name_not_found_lists_input_devices():
+    with pytest.raises(SourceError) as error:
+        parse_source("mic:Playback").device_index(FakeSr)
+    assert "Jabra USB Headset: Capture" in str(error.value)
+    assert "Playback," not in str(error.value)
+
+
+def test_input_devices_without_pyaudio_lists_all_names():
+    class NoPyAudio(FakeMicrophone):
+        @staticmethod
+        def get_pyaudio():
+            raise AttributeError("Could not find PyAudio")
+
+    assert len(input_devices(type("sr", (), {"Microphone": NoPyAudio}))) == len(DEVICES)
+
+
+@pytest.mark.parametrize("text, kind, target", [
+    ("", "mic", None),
+    ("default", "mic", None),
+    ("mic:2", "mic", 2),
+    ("mic:Headset", "mic", "Headset"),
+    ("file: /tmp/meeting.wav ", "file", "/tmp/meeting.wav"),
+    ("pcm:-", "pcm", "-"),
+    ("pcm:/tmp/dictation.fifo; rate=8000; width=1", "pcm", "/tmp/dictation.fifo"),
+    ("tcp:7000", "tcp", ("127.0.0.1", 7000)),
+    ("tcp:0.0.0.0:7000", "tcp", ("0.0.0.0", 7000)),
+    ("tcp:[::1]:7000", "tcp", ("::1", 7000)),
+])
+def test_parse_source(text, kind, target):
+    source = parse_source(text)
+    assert (source.kind, source.target) == (kind, target)
+
+
+def test_parse_pcm_parameters():
+    source = parse_source("pcm:-; rate=8000; width=1")
+    assert (source.sample_rate, source.sample_width) == (8000, 1)
+    assert not source.live
+    assert parse_source("tcp:7000").live
+
+
+@pytest.mark.parametrize("text", ["file:", "pcm:-; rate=abc", "pcm:-; width=5", "tcp:port", "smb://share", "pcm:-; rate=1000"])
+def test_parse_source_errors(text):
+    with pytest.raises(SourceError):
+        parse_source(text)
+
+
+def test_source_labels():
+    assert str(parse_source("default")) == "預設麥克風"
+    assert str(parse_source("tcp:7000")) == "網路串流 127.0.0.1:7000"
+    assert isinstance(parse_source("mic:0"), SourceSpec)
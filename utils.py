@@ -106,4 +106,36 @@ def show_message_box(ctx, message, title, msg_type, buttons=1):
     toolkit = sm.createInstanceWithContext("com.sun.star.awt.Toolkit", ctx)
     parent = toolkit.getDesktopWindow()
     mb = toolkit.createMessageBox(parent, msg_type, buttons, title, message)
-    return mb.execute()
\ No newline at end of file
+    return mb.execute()
+
+# 取得檔案鎖 (進程結束時由作業系統自動釋放)，失敗時回傳 None
+def acquire_file_lock(lock_path):
+    import platform
+    lock_file = open(lock_path, 'a+')
+    try:
+        if platform.system() == "Windows":
+            import msvcrt
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return lock_file
+    except OSError:
+        lock_file.close()
+        return None
+
+# 釋放 acquire_file_lock 取得的檔案鎖
+def release_file_lock(lock_file):
+    import platform
+    try:
+        if platform.system() == "Windows":
+            import msvcrt
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+    except OSError:
+        pass
+    lock_file.close()